@@ -3,7 +3,7 @@ from django.utils.translation import ugettext as _
 
 from authtools.admin import UserAdmin as BaseUserAdmin
 
-from .models import User
+from .models import User, OutboxEmail
 # Register your models here.
 
 
@@ -19,3 +19,9 @@ class UserAdmin(BaseUserAdmin):
 
     readonly_fields = ('balance', 'token',)
 
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', )
+    search_fields = ('subject', 'recipients')
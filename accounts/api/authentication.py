@@ -0,0 +1,77 @@
+"""
+Token authentication with two level cache (see accounts.token_cache).
+
+Authenticated (user, token) pairs are kept in bounded in-process LRU
+with short TTL in front of shared Django cache. Other processes may use
+their local copy until `LOCAL_TTL` expires after invalidation, so it
+should stay short.
+"""
+import pickle
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from accounts.token_cache import CACHE_KEY, local_cache
+
+
+stats = {
+    'local_hits': 0,
+    'shared_hits': 0,
+    'misses': 0,
+}
+
+
+def get_stats():
+    """ Return copy of hit/miss counters of this process """
+
+    return dict(stats, local_size=len(local_cache))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement of TokenAuthentication which
+    caches authenticated user and token
+    """
+
+    def load_credentials(self, key):
+        """
+        User and token from primary, replica may still have user which was
+        deactivated and it would be cached. Raises AuthenticationFailed for
+        unknown token or inactive user, failures are not cached
+        """
+        try:
+            token = Token.objects.using(DEFAULT_DB_ALIAS).select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return token.user, token
+
+    def authenticate_credentials(self, key):
+        # cached values are stored pickled, so every request gets own
+        # copy of user and views can change it safely
+        data = local_cache.get(key)
+        if data is not None:
+            stats['local_hits'] += 1
+            return pickle.loads(data)
+
+        data = cache.get(CACHE_KEY % key)
+        if data is not None:
+            stats['shared_hits'] += 1
+            local_cache.set(key, data)
+            return pickle.loads(data)
+
+        stats['misses'] += 1
+        user, token = self.load_credentials(key)
+
+        data = pickle.dumps((user, token), pickle.HIGHEST_PROTOCOL)
+        cache.set(CACHE_KEY % key, data, settings.AUTH_TOKEN_CACHE['SHARED_TTL'])
+        local_cache.set(key, data)
+        return user, token
@@ -0,0 +1,73 @@
+"""
+Serializer-free representation for read endpoints.
+
+`RowEncoder` is built once per serializer class: it keeps readable fields
+and skips `to_representation` for fields which return database values
+as is, so rows fetched with `.values()` are encoded without model
+instances and DRF field machinery. Output is the same as serializer
+`data`, so rendered JSON is byte-identical.
+"""
+from collections import OrderedDict
+
+from rest_framework import serializers
+
+
+# fields which representation of database value is the value itself
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+def identity(value):
+    return value
+
+
+class RowEncoder(object):
+    """ Encode value rows and instances like serializer_class does """
+
+    def __init__(self, serializer_class):
+        self.fields = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source:
+                raise ValueError('Field %s of %s is not a model column' % (name, serializer_class.__name__))
+
+            if isinstance(field, IDENTITY_FIELDS) and type(field).to_representation in (
+                serializers.IntegerField.to_representation,
+                serializers.CharField.to_representation,
+                serializers.BooleanField.to_representation,
+            ):
+                convert = identity
+            else:
+                convert = field.to_representation
+            self.fields.append((name, field.source, convert))
+
+        self.columns = tuple(source for name, source, convert in self.fields)
+
+    def encode(self, row):
+        """ Encode dict returned by .values(*columns) """
+
+        return OrderedDict(
+            (name, None if row[source] is None else convert(row[source]))
+            for name, source, convert in self.fields
+        )
+
+    def encode_instance(self, instance):
+        return OrderedDict(
+            (name, None if getattr(instance, source) is None else convert(getattr(instance, source)))
+            for name, source, convert in self.fields
+        )
+
+    def encode_many(self, rows):
+        return [self.encode(row) for row in rows]
+
+
+_encoders = {}
+
+
+def get_encoder(serializer_class):
+    """ Return encoder for serializer class, built once per process """
+
+    encoder = _encoders.get(serializer_class)
+    if encoder is None:
+        encoder = _encoders[serializer_class] = RowEncoder(serializer_class)
+    return encoder
@@ -0,0 +1,14 @@
+from rest_framework.exceptions import APIException
+from rest_framework.status import HTTP_409_CONFLICT, HTTP_412_PRECONDITION_FAILED
+
+
+class Conflict(APIException):
+    status_code = HTTP_409_CONFLICT
+    default_detail = 'Request conflicts with current state of resource.'
+    default_code = 'conflict'
+
+
+class PreconditionFailed(APIException):
+    status_code = HTTP_412_PRECONDITION_FAILED
+    default_detail = 'Resource was changed, fetch it again.'
+    default_code = 'precondition_failed'
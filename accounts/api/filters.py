@@ -0,0 +1,15 @@
+from rest_framework.filters import BaseFilterBackend
+
+from accounts.search import search
+
+
+class ClientSearchFilter(BaseFilterBackend):
+    """ Search of clients by name, email and passport number with `search` parameter """
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return search(queryset, query)
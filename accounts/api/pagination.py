@@ -0,0 +1,120 @@
+"""
+Keyset pagination for large lists.
+
+Page is selected by (date_joined, id) of last row of previous page, so every
+page is one indexed range query without OFFSET and without COUNT(*).
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Return planner estimation of rows count for queryset,
+    None if database can not estimate it (available for PostgreSQL only)
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    return plan[0]['Plan']['Plan Rows']
+
+
+class ClientCursorPagination(BasePagination):
+    """
+    Cursor pagination ordered by (date_joined, id).
+    Count is returned only on request: `count=estimate`
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # columns required in rows of values() queryset
+    columns = ('date_joined', 'id')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(page_size, 1), settings.CLIENT_LIST_MAX_PAGE_SIZE)
+
+    def encode_cursor(self, row):
+        if isinstance(row, dict):
+            value = '%s|%d' % (row['date_joined'].isoformat(), row['id'])
+        else:
+            value = '%s|%d' % (row.date_joined.isoformat(), row.id)
+        return urlsafe_b64encode(value.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            date_joined, id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            date_joined = parse_datetime(date_joined)
+            id = int(id)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if date_joined is None:
+            raise NotFound(self.invalid_cursor_message)
+        return date_joined, id
+
+    def seek(self, queryset, date_joined, id):
+        """ Rows after (date_joined, id) """
+
+        # OR alone is not index range bound, date_joined >= starts index scan at the cursor
+        return queryset.filter(date_joined__gte=date_joined).filter(
+            Q(date_joined__gt=date_joined) | Q(date_joined=date_joined, id__gt=id)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.count = estimate_count(queryset)
+
+        queryset = queryset.order_by('date_joined', 'id')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = self.seek(queryset, *self.decode_cursor(cursor))
+
+        # one extra row tells if there is next page
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['results'] = data
+        return Response(response)
@@ -0,0 +1,24 @@
+import io
+import csv
+
+from django.conf import settings
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from accounts.importing import read_csv
+
+
+class CSVParser(BaseParser):
+    """ Parses CSV with header into list of dicts """
+
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            return read_csv(io.StringIO(stream.read().decode(encoding)))
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError('CSV parse error - %s' % exc)
@@ -1,27 +1,55 @@
+from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import ObjectDoesNotExist
 
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 
+from accounts.clients import BULK_UPDATE_FIELDS
+from accounts.hashing import check_password
+from finance_system.instrumentation import timer
+
 
 User = get_user_model()
 
 
-class ClientForManagerSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin(object):
+    """ Measure validation and serialization time for request instrumentation """
+
+    def is_valid(self, raise_exception=False):
+        with timer('validate'):
+            return super().is_valid(raise_exception=raise_exception)
+
+    @property
+    def data(self):
+        with timer('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class ClientForManagerSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for Manager to see and update Client """
     class Meta:
         model = User
         fields = ('id', 'first_name', 'last_name', 'email', 'is_active', 'is_closed')
 
         read_only_fields = ('id', 'first_name', 'last_name', 'email', )
+        list_serializer_class = TimedListSerializer
 
 
-class ClientRegisterSerializer(serializers.ModelSerializer):
+class ClientRegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for register clients """
 
     token = serializers.CharField(read_only=True)
+    @transaction.atomic
     def create(self, validated_data):
+        # user, token and outbox mails are saved in one transaction
         user = User.objects.create(
             first_name=validated_data['first_name'],
             last_name=validated_data['last_name'],
@@ -30,9 +58,6 @@ class ClientRegisterSerializer(serializers.ModelSerializer):
             is_active=False
         )
 
-
-        user.save()
-
         return user
 
     class Meta:
@@ -40,7 +65,7 @@ class ClientRegisterSerializer(serializers.ModelSerializer):
         fields = ('email', 'first_name', 'last_name', 'passport_number', 'token')
 
 
-class UserLoginSerializer(serializers.ModelSerializer):
+class UserLoginSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for login users """
 
     email = serializers.EmailField()
@@ -56,18 +81,24 @@ class UserLoginSerializer(serializers.ModelSerializer):
         email = data['email']
         password = data['password']
 
+        # user and token are fetched with one query
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.select_related('auth_token').get(email=email)
         except ObjectDoesNotExist:
+            check_password(None, password)
             raise serializers.ValidationError('This email is not valid')
 
-        if not user.check_password(password):
+        if not check_password(user, password):
             raise serializers.ValidationError('Incorect credentials try again')
-        data['token'] = user.token
+
+        try:
+            data['token'] = user.auth_token
+        except Token.DoesNotExist:
+            data['token'], created = Token.objects.get_or_create(user=user)
         return data
 
 
-class ClientProfileSerializer(serializers.ModelSerializer):
+class ClientProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for Client to see and update profile """
 
 
@@ -80,7 +111,7 @@ class ClientProfileSerializer(serializers.ModelSerializer):
 
 
 
-class ClientProvidePINSerilizer(serializers.ModelSerializer):
+class ClientProvidePINSerilizer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for Client to provide PIN """
 
     password1 = serializers.CharField(label='Verify PIN', write_only=True)
@@ -100,3 +131,81 @@ class ClientProvidePINSerilizer(serializers.ModelSerializer):
         if pin1 != pin2:
             raise serializers.ValidationError("PINs don't match", code="pins_dont_match")
 
+
+class TransferSerializer(serializers.Serializer):
+    """ Serializer for transfer between clients accounts """
+
+    from_account = serializers.IntegerField()
+    to_account = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    description = serializers.CharField(max_length=255, required=False, default='')
+
+    def validate(self, data):
+        if data['from_account'] == data['to_account']:
+            raise serializers.ValidationError('Accounts must be different')
+        return data
+
+
+class TransferBatchSerializer(TimedSerializerMixin, serializers.Serializer):
+    """ Serializer for batch of transfers """
+
+    transfers = TransferSerializer(many=True)
+
+    def validate_transfers(self, value):
+        if not value:
+            raise serializers.ValidationError('Provide at least one transfer')
+        if len(value) > settings.TRANSFER_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Batch may contain at most %d transfers' % settings.TRANSFER_BATCH_MAX_SIZE
+            )
+        return value
+
+
+class ClientBulkFilterSerializer(serializers.Serializer):
+    """ Filter of clients for bulk action, empty filter selects all clients only with 'all': true """
+
+    is_active = serializers.BooleanField(required=False)
+    is_closed = serializers.BooleanField(required=False)
+    all = serializers.BooleanField(required=False)
+
+    def validate(self, data):
+        select_all = data.pop('all', False)
+        if not data and not select_all:
+            raise serializers.ValidationError('Provide is_active or is_closed, or all: true to select all clients')
+        if data and select_all:
+            raise serializers.ValidationError('all can not be combined with is_active or is_closed')
+        return data
+
+
+class ClientBulkActionSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Serializer for Manager to update or delete many clients,
+    clients are selected by list of ids or by filter
+    """
+
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+
+    action = serializers.ChoiceField(choices=(ACTION_UPDATE, ACTION_DELETE))
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    filter = ClientBulkFilterSerializer(required=False)
+    is_active = serializers.BooleanField(required=False)
+    is_closed = serializers.BooleanField(required=False)
+
+    def validate_ids(self, value):
+        if len(value) > settings.CLIENT_BULK_MAX_IDS:
+            raise serializers.ValidationError('Provide at most %d ids' % settings.CLIENT_BULK_MAX_IDS)
+        return value
+
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError('Provide either ids or filter')
+
+        values = {field: data[field] for field in BULK_UPDATE_FIELDS if field in data}
+        if data['action'] == self.ACTION_UPDATE and not values:
+            raise serializers.ValidationError('Provide is_active or is_closed to update')
+        if data['action'] == self.ACTION_DELETE and values:
+            raise serializers.ValidationError('Values can not be provided for delete')
+
+        data['values'] = values
+        return data
@@ -1,11 +1,36 @@
+import hashlib
 import json
-
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
+from accounts import ledger, profiling
+from accounts.models import ClientRegistrationNotice, ClientSearchToken, LedgerEntry
+from accounts.search import update_tokens
+from accounts.token_cache import invalidate_users, local_cache
+
+from .encoders import RowEncoder, identity
+from .pagination import ClientCursorPagination
+from .throttling import CACHE_KEY, BucketRegistry, get_registry, reset_throttles
+from .serializers import ClientForManagerSerializer, ClientProfileSerializer
+from .views import ManagerClientDetailView
+
 
 User = get_user_model()
 
@@ -41,6 +66,48 @@ class UserLoginAPIViewAPITestCase(APITestCase):
 
         self.assertTrue('token' in json.loads(response.content))
 
+    def test_user_login_single_query(self):
+        """Test that user and token are fetched with one query"""
+
+        user_data = {
+            'email': self.email,
+            'password': self.password
+        }
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, user_data)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        content = json.loads(response.content)
+        self.assertEqual(self.token.key, content['token'])
+        self.assertFalse('password' in content)
+
+    def test_user_login_creates_missing_token(self):
+        """Test that token is created on login if user has no token"""
+
+        self.token.delete()
+
+        user_data = {
+            'email': self.email,
+            'password': self.password
+        }
+        response = self.client.post(self.url, user_data)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        user = User.objects.get(email=self.email)
+        self.assertEqual(user.token.key, json.loads(response.content)['token'])
+
+    def test_user_login_unknown_email(self):
+        """Test login with not existing email, it makes only lookup query"""
+
+        user_data = {
+            'email': 'unknown@testuser.com',
+            'password': self.password
+        }
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, user_data)
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
 
 class ClientRegisterViewAPITestCase(APITestCase):
     """Tests to client registration"""
@@ -189,6 +256,22 @@ class ClientProfileViewAPITestCase(APITestCase):
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
 
+    def test_update_keeps_concurrent_balance(self):
+        """Test that balance changed during profile update is not overwritten"""
+
+        original = ClientProfileSerializer.update
+
+        def update(serializer, instance, validated_data):
+            ledger.credit(instance.id, '100')
+            return original(serializer, instance, validated_data)
+
+        with mock.patch.object(ClientProfileSerializer, 'update', update):
+            response = self.client_1.patch(self.url, {'first_name': 'Jhon'}, format='json')
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        user = User.objects.get(email='test@testuser.com')
+        self.assertEqual(('Jhon', Decimal('100')), (user.first_name, user.balance))
+
     def test_active_client_allowed_to_profile(self):
         """Test to endpoint allow only for active client with password"""
 
@@ -253,6 +336,53 @@ class ManagerClientListViewAPITestCase(APITestCase):
         response = self.client.get(self.url)
         self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
 
+    def test_cursor_pagination(self):
+        """Test that cursor pages go through all clients without count"""
+
+        for number in range(3, 8):
+            User.objects.create(
+                first_name='Test',
+                last_name='Client',
+                email='test%d@testuser.com' % number,
+                passport_number='3249122%d' % number,
+            )
+
+        response = self.manager.get(self.url, {'pagination': 'cursor', 'page_size': 3})
+        content = json.loads(response.content)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertFalse('count' in content)
+        self.assertEqual(3, len(content['results']))
+        ids = [client['id'] for client in content['results']]
+
+        # page is one query after token is cached
+        with self.assertNumQueries(1):
+            response = self.manager.get(content['next'])
+        content = json.loads(response.content)
+
+        self.assertEqual(3, len(content['results']))
+        ids.extend(client['id'] for client in content['results'])
+
+        response = self.manager.get(content['next'])
+        content = json.loads(response.content)
+
+        self.assertEqual(1, len(content['results']))
+        self.assertIsNone(content['next'])
+        ids.extend(client['id'] for client in content['results'])
+
+        self.assertEqual(sorted(ids), ids)
+        self.assertEqual(7, len(set(ids)))
+
+    def test_cursor_pagination_filters(self):
+        """Test cursor pagination with filters and invalid cursor"""
+
+        response = self.manager.get(self.url, {'pagination': 'cursor', 'is_active': False, 'count': 'estimate'})
+        content = json.loads(response.content)
+        self.assertEqual(['test2@testuser.com'], [client['email'] for client in content['results']])
+
+        response = self.manager.get(self.url, {'cursor': 'invalid'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
 
 class ManagerClientDetailViewAPITestCase(APITestCase):
     """Test to endpoint """
@@ -274,6 +404,7 @@ class ManagerClientDetailViewAPITestCase(APITestCase):
             is_active=True,
         )
 
+        self.client_id = client.id
         self.url = reverse('api-account:manager-client-detail', kwargs={'id':client.id})
 
         self.manager = APIClient()
@@ -301,10 +432,1118 @@ class ManagerClientDetailViewAPITestCase(APITestCase):
         response = self.manager.put(self.url, user_data)
         self.assertEqual(status.HTTP_200_OK, response.status_code)
 
+    def test_concurrent_update_conflict(self):
+        """Test that update of client changed after the check gets 409 and loses nothing"""
+
+        original = ClientForManagerSerializer.update
+
+        def update(serializer, instance, validated_data):
+            # other manager saves client between the check and the update
+            other = User.objects.get(id=instance.id)
+            other.is_closed = True
+            other.save()
+            return original(serializer, instance, validated_data)
+
+        with mock.patch.object(ClientForManagerSerializer, 'update', update):
+            response = self.manager.patch(self.url, {'is_active': False}, format='json')
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        # request is rolled back, with the other save here as it used the same connection
+        self.assertEqual((True, False, 0), User.objects.values_list('is_active', 'is_closed', 'version').get(
+            id=self.client_id
+        ))
+
+        response = self.manager.patch(self.url, {'is_active': False}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((False, False, 1), User.objects.values_list('is_active', 'is_closed', 'version').get(
+            id=self.client_id
+        ))
+
+    def test_stale_instance_conflict(self):
+        """Test that view saving instance loaded before save of other one gets 409"""
+
+        first, second = User.objects.get(id=self.client_id), User.objects.get(id=self.client_id)
+
+        def get_object(view):
+            # other request saves first instance after the check
+            first.is_closed = True
+            first.save()
+            return second
+
+        with mock.patch.object(ManagerClientDetailView, 'get_object', get_object):
+            response = self.manager.patch(self.url, {'is_active': False}, format='json')
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+
     def test_delete_client(self):
         """Test delete client by manager"""
 
         response = self.manager.delete(self.url)
         self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
 
+    def test_delete_client_with_ledger(self):
+        """Test that client with balance history can not be deleted"""
+
+        ledger.credit(self.client_id, '10')
+
+        response = self.manager.delete(self.url)
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+
+
+class CachedTokenAuthenticationAPITestCase(APITestCase):
+    """Tests to cached token authentication"""
+
+    url = reverse('api-account:client-profile')
+
+    def setUp(self):
+        local_cache.clear()
+
+        self.user = User.objects.create(
+            first_name='Test',
+            last_name='User',
+            email='test@testuser.com',
+            passport_number='12345678'
+        )
+        self.user.set_password('1234567a')
+        self.user.save()
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % self.user.token)
+
+    def test_token_cached(self):
+        """Test that token is queried only on first request"""
+
+        # token and modified_at of profile
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_invalidation_on_user_change(self):
+        """Test that cached user is dropped when user is changed"""
+
+        self.client.get(self.url)
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    def test_invalidation_on_token_delete(self):
+        """Test that cached token is dropped when token is deleted"""
+
+        self.client.get(self.url)
+
+        self.user.token.delete()
+
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+
+class ManagerTransferBatchViewAPITestCase(APITestCase):
+    """Tests to endpoint api-account:manager-transfers"""
+
+    url = reverse('api-account:manager-transfers')
+
+    def setUp(self):
+        self.manager_user = manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+
+        self.client_1 = User.objects.create(
+            first_name='Test',
+            last_name='Client',
+            email='test1@testuser.com',
+            passport_number='32491221',
+        )
+
+        self.client_2 = User.objects.create(
+            first_name='Test',
+            last_name='Client',
+            email='test2@testuser.com',
+            passport_number='32491222',
+        )
+
+        self.closed_client = User.objects.create(
+            first_name='Test',
+            last_name='Client',
+            email='test3@testuser.com',
+            passport_number='32491223',
+            is_closed=True,
+        )
+
+        ledger.credit(self.client_1.id, '100')
+
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % self.client_1.token)
+
+    def test_batch_transfer(self):
+        """Test that valid transfers are applied and invalid rejected"""
+
+        data = {'transfers': [
+            {'from_account': self.client_1.id, 'to_account': self.client_2.id, 'amount': '60.00'},
+            {'from_account': self.client_1.id, 'to_account': self.client_2.id, 'amount': '60.00'},
+            {'from_account': self.client_2.id, 'to_account': self.closed_client.id, 'amount': '10.00'},
+            {'from_account': self.client_2.id, 'to_account': 0, 'amount': '10.00'},
+            {'from_account': self.client_2.id, 'to_account': self.client_1.id, 'amount': '10.00'},
+        ]}
+
+        response = self.manager.post(self.url, data, format='json')
+        content = json.loads(response.content)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(2, content['applied'])
+        self.assertEqual(
+            ['applied', 'rejected', 'rejected', 'rejected', 'applied'],
+            [result['status'] for result in content['results']]
+        )
+
+        self.client_1.refresh_from_db()
+        self.client_2.refresh_from_db()
+        self.assertEqual(Decimal('50'), self.client_1.balance)
+        self.assertEqual(Decimal('50'), self.client_2.balance)
+
+    def test_transfer_with_manager_account(self):
+        """Test that money is not moved from or to accounts of managers"""
+
+        ledger.credit(self.manager_user.id, '100')
+        data = {'transfers': [
+            {'from_account': self.client_1.id, 'to_account': self.manager_user.id, 'amount': '10.00'},
+            {'from_account': self.manager_user.id, 'to_account': self.client_2.id, 'amount': '10.00'},
+        ]}
+
+        response = self.manager.post(self.url, data, format='json')
+        content = json.loads(response.content)
+        self.assertEqual(0, content['applied'])
+        self.assertEqual(
+            [{'status': 'rejected', 'error': 'Account does not exist'}] * 2,
+            content['results']
+        )
+        self.assertEqual(
+            [Decimal('100'), Decimal('100'), Decimal('0')],
+            [User.objects.get(id=user.id).balance for user in (self.manager_user, self.client_1, self.client_2)]
+        )
+
+    def test_invalid_batch(self):
+        """Test that batch with invalid item is not applied"""
+
+        data = {'transfers': [
+            {'from_account': self.client_1.id, 'to_account': self.client_2.id, 'amount': '10.00'},
+            {'from_account': self.client_1.id, 'to_account': self.client_1.id, 'amount': '10.00'},
+        ]}
+
+        response = self.manager.post(self.url, data, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(1, LedgerEntry.objects.count())
+
+    def test_only_manager_allowed(self):
+        """Test endpoint to allow only for managers"""
+
+        data = {'transfers': [
+            {'from_account': self.client_1.id, 'to_account': self.client_2.id, 'amount': '10.00'},
+        ]}
+
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+class QueryPlanTestMixin(object):
+    """
+    Mixin to check that endpoints queries do not scan whole users table and
+    use expected indexes. Statements are recorded with parameters as executed
+    and explained again. PostgreSQL prefers sequential scan of small table,
+    so it is disabled in test transaction and scan left in plan means there
+    is no usable index
+    """
+
+    seed_size = 2000
+
+    def seed_clients(self):
+        User.objects.bulk_create([
+            User(
+                first_name='Seed',
+                last_name='Client',
+                email='seed%d@testuser.com' % number,
+                passport_number='S%d' % number,
+                is_active=number % 2 == 0,
+                is_closed=number % 7 == 0,
+                # partial indexes of clients are selective only with other users in table
+                is_manager=number % 5 == 0,
+            ) for number in range(self.seed_size)
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # reset by rollback of test transaction
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql, params)
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    tables = ('accounts_user', 'accounts_clientsearchtoken')
+
+    def is_seq_scan(self, line):
+        if connection.vendor == 'postgresql':
+            return any('Seq Scan on %s ' % table in line + ' ' for table in self.tables)
+        # SQLite: "SCAN accounts_user" without index
+        return line.startswith('SCAN') and 'USING' not in line and \
+            any(table in line.split() for table in self.tables)
+
+    @contextmanager
+    def capture_statements(self):
+        """ Record SQL with parameters as executed, captured_queries of SQLite are not valid SQL """
+
+        statements = []
+        execute = CursorWrapper.execute
+
+        def record(cursor, sql, params=None):
+            if cursor.db.alias == connection.alias:
+                statements.append((sql, params))
+            return execute(cursor, sql, params)
+
+        with mock.patch.object(CursorWrapper, 'execute', record):
+            yield statements
+
+    def assertNoSeqScan(self, request, indexes=()):
+        """
+        Call request and check plans of all its queries to users table.
+        Every item of `indexes` (index name or tuple of alternatives) has to be used by some query
+        """
+        with self.capture_statements() as statements:
+            response = request()
+
+        plans = []
+        for sql, params in statements:
+            if not sql.startswith('SELECT') or 'accounts_user' not in sql:
+                continue
+            plan = self.explain(sql, params)
+            plans.append(plan)
+            for line in plan:
+                self.assertFalse(self.is_seq_scan(line), 'Sequential scan in:\n%s\n%s' % (sql, '\n'.join(plan)))
+
+        self.assertTrue(plans, 'No query to users table was checked')
+        text = '\n'.join('\n'.join(plan) for plan in plans)
+        for index in indexes:
+            alternatives = (index,) if isinstance(index, str) else index
+            self.assertTrue(any(name in text for name in alternatives),
+                            'Index %s is not used:\n%s' % (' or '.join(alternatives), text))
+        return response
+
+
+class ClientQueryPlanTestCase(QueryPlanTestMixin, APITestCase):
+    """Tests to indexes of manager endpoints"""
+
+    def setUp(self):
+        self.seed_clients()
+
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+        # token of manager is cached, plans are of endpoint queries only
+        self.manager.get(reverse('api-account:manager-client-list'))
+
+    def test_client_list_plans(self):
+        """Test client list with filters and pagination"""
+
+        url = reverse('api-account:manager-client-list')
+
+        # PostgreSQL orders by unique email index, it is as cheap as partial one
+        email = ('accounts_user_client_email', 'accounts_user_email_key')
+        for params, indexes in (
+            ({}, [email]),
+            ({'page': 50}, [email]),
+            ({'is_active': True}, ['accounts_user_client_status']),
+            ({'is_active': False, 'is_closed': True}, ['accounts_user_client_status']),
+            ({'pagination': 'cursor'}, ['accounts_user_client_joined']),
+            ({'pagination': 'cursor', 'is_active': True}, ['accounts_user_client_joined']),
+        ):
+            response = self.assertNoSeqScan(lambda: self.manager.get(url, params), indexes)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        response = self.manager.get(url, {'pagination': 'cursor'})
+        next_url = json.loads(response.content)['next']
+        response = self.assertNoSeqScan(lambda: self.manager.get(next_url), ['accounts_user_client_joined'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_cursor_seek_plan(self):
+        """Test that page after cursor starts index range scan at the cursor"""
+
+        clients = User.objects.filter(is_manager=False, is_staff=False, is_superuser=False)
+        last = clients.order_by('date_joined', 'id')[1000]
+        queryset = ClientCursorPagination().seek(clients, last.date_joined, last.id).order_by('date_joined', 'id')
+        plan = '\n'.join(self.explain(*queryset[:11].query.sql_with_params()))
+
+        self.assertIn('accounts_user_client_joined', plan)
+        if connection.vendor == 'postgresql':
+            self.assertRegex(plan, r'Index Cond: \(date_joined >= ')
+        else:
+            self.assertIn('date_joined>?', plan)
+
+    def test_client_search_plans(self):
+        """Test search by tokens index"""
+
+        update_tokens(User.objects.all())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        url = reverse('api-account:manager-client-list')
+        for params in (
+            {'search': 'seed1999@testuser.com'},
+            {'search': 'S1999'},
+            {'search': 'seed client'},
+            {'search': 'seed19', 'is_active': False},
+            {'search': 'seed19', 'pagination': 'cursor'},
+        ):
+            # prefix index on PostgreSQL, index of token and user elsewhere
+            response = self.assertNoSeqScan(lambda: self.manager.get(url, params), [
+                ('accounts_clientsearchtoken_prefix', 'accounts_clientsearchtoken_token_')
+            ])
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_client_detail_plan(self):
+        """Test client detail"""
+
+        client = User.objects.filter(is_manager=False).last()
+        url = reverse('api-account:manager-client-detail', kwargs={'id': client.id})
+
+        response = self.assertNoSeqScan(lambda: self.manager.get(url), [('accounts_user_pkey', 'PRIMARY KEY')])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'DEFAULT_QUERY_BUDGET': 10,
+    'QUERY_BUDGETS': {'ManagerClientListView': 1},
+    'REPEATED_QUERY_THRESHOLD': 3,
+}
+
+
+@override_settings(REQUEST_INSTRUMENTATION=INSTRUMENTATION)
+class RequestInstrumentationTestCase(APITestCase):
+    """Tests to per-request SQL and timing instrumentation"""
+
+    url = reverse('api-account:manager-client-list')
+
+    def setUp(self):
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+    def test_server_timing(self):
+        """Test that timings are sent in header and logged"""
+
+        with self.assertLogs('accounts.instrumentation', 'INFO') as logs:
+            response = self.manager.get(self.url)
+
+        timing = response['Server-Timing']
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertTrue('perm;dur=' in timing)
+        self.assertTrue('serialize;dur=' in timing)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual('ManagerClientListView', record['view'])
+        self.assertEqual(200, record['status'])
+
+    def test_query_budget(self):
+        """Test that request over query budget is logged as warning"""
+
+        with self.assertLogs('accounts.instrumentation', 'WARNING') as logs:
+            self.manager.get(self.url)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(record['queries'] > 1)
+        self.assertEqual(['query budget 1 exceeded'], record['warnings'])
+
+
+PROFILING = {
+    'ENABLED': True,
+    'MAX_PROFILES': 2,
+    'HEADER_MAX_AGE': 60,
+}
+
+
+class RequestProfilingTestCase(APITestCase):
+    """Tests to profiling of requests with signed header"""
+
+    url = reverse('api-account:manager-client-list')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(REQUEST_PROFILING=dict(PROFILING, DIR=directory))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % self.manager.token)
+        self.store = profiling.get_store()
+
+    def test_profile_saved(self):
+        """Test that request with header of manager is profiled, others are not"""
+
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Profile-Id', response)
+
+        response = self.client.get(self.url, {'search': 'test'}, HTTP_X_PROFILE=profiling.make_header(self.manager))
+        self.assertEqual(200, response.status_code)
+
+        profile = self.store.get(response['X-Profile-Id'])
+        self.assertEqual('ManagerClientListView', profile['view'])
+        self.assertEqual(self.url, profile['path'])
+        self.assertEqual('test@testuser.com', profile['user'])
+        self.assertIn('list', self.store.report(profile['id']))
+        self.assertEqual([profile['id']], self.store.ids())
+
+    def test_header_of_other_user(self):
+        """Test that header is used only by user it is signed for, who is manager or superuser"""
+
+        client = User.objects.create(
+            first_name='Client',
+            last_name='client',
+            email='client@testuser.com',
+            passport_number='12345678',
+        )
+        for header, token in (
+            (profiling.make_header(client), client.token),
+            (profiling.make_header(self.manager), client.token),
+            (profiling.make_header(self.manager) + 'x', self.manager.token),
+        ):
+            self.client.credentials(HTTP_AUTHORIZATION='Token %s' % token)
+            self.assertNotIn('X-Profile-Id', self.client.get(self.url, HTTP_X_PROFILE=header))
+
+        self.assertEqual([], self.store.ids())
+
+    def test_store_bounded(self):
+        """Test that only last MAX_PROFILES profiles are kept"""
+
+        header = profiling.make_header(self.manager)
+        ids = [self.client.get(self.url, HTTP_X_PROFILE=header)['X-Profile-Id'] for i in range(3)]
+        self.assertEqual(ids[:0:-1], self.store.ids())
+        self.assertEqual(ids[:0:-1], [profile['id'] for profile in self.store.list()])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_pages(self):
+        """Test that superuser sees profiles in admin, managers without admin access do not"""
+
+        profile_id = self.client.get(self.url, HTTP_X_PROFILE=profiling.make_header(self.manager))['X-Profile-Id']
+
+        admin = User.objects.create_superuser(email='admin@testuser.com', password='password')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin-profile-list'))
+        self.assertContains(response, profile_id)
+        self.assertContains(response, 'X-Profile: %s' % profiling.make_header(admin)[:20])
+
+        response = self.client.get(reverse('admin-profile-detail', args=[profile_id]), {'sort': 'tottime'})
+        self.assertContains(response, 'Ordered by: internal time')
+
+        response = self.client.get(reverse('admin-profile-download', args=[profile_id]))
+        self.assertEqual('application/octet-stream', response['Content-Type'])
+
+        self.client.force_login(self.manager)
+        self.assertEqual(302, self.client.get(reverse('admin-profile-list')).status_code)
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_admin_pages_own_profiles(self):
+        """Test that manager with admin access sees only profiles of own requests"""
+
+        admin = User.objects.create_superuser(email='admin@testuser.com', password='password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % admin.token)
+        other_id = self.client.get(self.url, HTTP_X_PROFILE=profiling.make_header(admin))['X-Profile-Id']
+
+        self.manager.is_staff = True
+        self.manager.save()
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % self.manager.token)
+        own_id = self.client.get(self.url, HTTP_X_PROFILE=profiling.make_header(self.manager))['X-Profile-Id']
+
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('admin-profile-list'))
+        self.assertContains(response, own_id)
+        self.assertNotContains(response, other_id)
+        self.assertEqual(200, self.client.get(reverse('admin-profile-detail', args=[own_id])).status_code)
+        self.assertEqual(404, self.client.get(reverse('admin-profile-detail', args=[other_id])).status_code)
+        self.assertEqual(404, self.client.get(reverse('admin-profile-download', args=[other_id])).status_code)
+
+
+class ManagerClientExportViewAPITestCase(APITestCase):
+    """Tests to endpoint api-account:manager-client-export"""
+
+    url = reverse('api-account:manager-client-export')
+
+    def setUp(self):
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+
+        for number in range(1, 6):
+            User.objects.create(
+                first_name='Test',
+                last_name='Client%d' % number,
+                email='test%d@testuser.com' % number,
+                passport_number='3249122%d' % number,
+                is_active=number != 5,
+            )
+
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+    def get_content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(CLIENT_EXPORT_CHUNK_SIZE=2)
+    def test_export_csv(self):
+        """Test that all clients are exported in chunks"""
+
+        response = self.manager.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('text/csv', response['Content-Type'])
+
+        lines = self.get_content(response).splitlines()
+        self.assertEqual('id,first_name,last_name,email,is_active,is_closed', lines[0])
+        self.assertEqual(6, len(lines))
+        self.assertTrue(lines[1].endswith(',Test,Client1,test1@testuser.com,True,False'))
+
+    def test_export_ndjson_filter(self):
+        """Test export with filter in NDJSON"""
+
+        response = self.manager.get(self.url, {'output': 'ndjson', 'is_active': False})
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+
+        self.assertEqual(1, len(rows))
+        self.assertEqual('test5@testuser.com', rows[0]['email'])
+        self.assertEqual(False, rows[0]['is_active'])
+
+    def test_export_invalid_output(self):
+        """Test export with unknown format"""
+
+        response = self.manager.get(self.url, {'output': 'xml'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class ManagerClientImportViewAPITestCase(APITestCase):
+    """Tests to endpoint api-account:manager-client-import"""
+
+    url = reverse('api-account:manager-client-import')
+
+    def setUp(self):
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+    def test_import_csv(self):
+        """Test import of clients from CSV"""
+
+        content = 'email,first_name,last_name,passport_number\n' \
+                  'test1@testuser.com,Test,Client1,32491221\n' \
+                  'test2@testuser.com,Test,Client2,32491222\n'
+        response = self.manager.post(self.url, content, content_type='text/csv')
+
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual({'created': 2}, response.data)
+        self.assertEqual(2, User.objects.filter(is_manager=False, auth_token__isnull=False).count())
+
+    def test_import_json_errors(self):
+        """Test that invalid rows are reported"""
+
+        response = self.manager.post(self.url, [{
+            'email': 'test@testuser.com',
+            'first_name': 'Test',
+            'last_name': 'Client',
+            'passport_number': '32491221',
+        }], format='json')
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(1, response.data['errors'][0]['row'])
+        self.assertIn('email', response.data['errors'][0]['errors'])
+
+    def test_import_not_manager(self):
+        """Test that clients can not import"""
+
+        client = User.objects.create(
+            first_name='Test',
+            last_name='Client',
+            email='test1@testuser.com',
+            passport_number='32491221',
+        )
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % client.token)
+
+        response = self.manager.post(self.url, [], format='json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+class ManagerClientBulkViewAPITestCase(APITestCase):
+    """Tests to endpoint api-account:manager-client-bulk"""
+
+    url = reverse('api-account:manager-client-bulk')
+
+    def setUp(self):
+        local_cache.clear()
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+
+        self.clients = [
+            User.objects.create(
+                first_name='Test',
+                last_name='Client%d' % number,
+                email='test%d@testuser.com' % number,
+                passport_number='3249122%d' % number,
+                is_active=False,
+            ) for number in range(1, 5)
+        ]
+
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+    def test_update_by_ids(self):
+        """Test that clients are activated by one update"""
+
+        ids = [client.id for client in self.clients[:2]]
+        # authentication, savepoint, lock of ids, one update, savepoint release
+        with self.assertNumQueries(5):
+            response = self.manager.post(self.url, {'action': 'update', 'ids': ids, 'is_active': True}, format='json')
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'updated': 2}, response.data)
+        self.assertEqual(set(ids), set(User.objects.filter(is_active=True, is_manager=False).values_list('id', flat=True)))
+
+    def test_form_data_rejected(self):
+        """Test that form data, where missing booleans are False, is not accepted"""
+
+        ids = [client.id for client in self.clients[:2]]
+        response = self.manager.post(self.url, {'action': 'update', 'ids': ids, 'is_active': True})
+        self.assertEqual(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, response.status_code)
+        self.assertFalse(User.objects.filter(is_active=True, is_manager=False).exists())
+
+    def test_update_by_filter(self):
+        """Test that managers are not changed by filter"""
+
+        response = self.manager.post(self.url, {
+            'action': 'update',
+            'filter': {'is_active': False},
+            'is_closed': True,
+        }, format='json')
+
+        self.assertEqual({'updated': 4}, response.data)
+        self.assertEqual(4, User.objects.filter(is_closed=True).count())
+
+    def test_delete(self):
+        """Test deletion and conflict for clients with balance history"""
+
+        response = self.manager.post(self.url, {'action': 'delete', 'ids': [self.clients[0].id]}, format='json')
+        self.assertEqual({'deleted': 1}, response.data)
+
+        ledger.credit(self.clients[1].id, Decimal('10.00'))
+        response = self.manager.post(self.url, {
+            'action': 'delete',
+            'ids': [self.clients[1].id, self.clients[2].id],
+        }, format='json')
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+        self.assertEqual(4, User.objects.count())
+
+    def test_delete_queries_do_not_depend_on_clients_count(self):
+        """Test that clients with related rows are deleted by set based queries"""
+
+        for client in self.clients:
+            # cached token
+            APIClient(HTTP_AUTHORIZATION='Token %s' % client.token).get(reverse('api-account:client-profile'))
+        ClientRegistrationNotice.objects.create(user=self.clients[2])
+        # token of manager is cached
+        self.manager.post(self.url, {}, format='json')
+
+        with CaptureQueriesContext(connection) as small:
+            response = self.manager.post(self.url, {'action': 'delete', 'ids': [self.clients[0].id]}, format='json')
+        self.assertEqual({'deleted': 1}, response.data)
+
+        # savepoint, lock of ids, ledger check, token keys, DELETE per referencing table and clients, release
+        with self.assertNumQueries(13), CaptureQueriesContext(connection) as large:
+            response = self.manager.post(self.url, {'action': 'delete', 'filter': {'all': True}}, format='json')
+        self.assertEqual({'deleted': 3}, response.data)
+        self.assertEqual(len(small), len(large))
+
+        self.assertEqual(1, User.objects.count())
+        self.assertEqual(1, Token.objects.count())
+        self.assertFalse(ClientSearchToken.objects.exclude(user__is_manager=True).exists())
+        self.assertFalse(ClientRegistrationNotice.objects.exists())
+        self.assertIsNone(local_cache.get(self.clients[3].token.key))
+
+    def test_invalid_action(self):
+        """Test that ids or filter is required"""
+
+        response = self.manager.post(self.url, {'action': 'update', 'is_active': True}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_empty_filter(self):
+        """Test that empty filter is rejected and all clients are selected with explicit flag only"""
+
+        for data in ({'action': 'delete', 'filter': {}}, {'action': 'delete', 'filter': {'all': False}}):
+            response = self.manager.post(self.url, data, format='json')
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(5, User.objects.count())
+
+        response = self.manager.post(self.url, {'action': 'update', 'filter': {'all': True}, 'is_closed': True},
+                                     format='json')
+        self.assertEqual({'updated': 4}, response.data)
+
+
+class FastReadPathAPITestCase(APITestCase):
+    """Tests that encoders render the same JSON as serializers"""
+
+    def setUp(self):
+        local_cache.clear()
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+        for number in range(1, 13):
+            client = User.objects.create(
+                first_name='Test',
+                last_name='Client%d' % number,
+                email='test%d@testuser.com' % number,
+                passport_number='3249122%d' % number,
+                is_closed=number % 3 == 0,
+            )
+        client.set_password('1234')
+        client.save()
+        ledger.credit(client.id, Decimal('10.50'))
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % client.token)
+
+    def assertSameContent(self, client, url, params=None):
+        response = client.get(url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        with override_settings(FAST_READ_PATH=False):
+            expected = client.get(url, params)
+        self.assertEqual(expected.content, response.content)
+
+    def test_manager_list(self):
+        url = reverse('api-account:manager-client-list')
+        self.assertSameContent(self.manager, url)
+        self.assertSameContent(self.manager, url, {'is_closed': True, 'page': 1})
+        self.assertSameContent(self.manager, url, {'pagination': 'cursor', 'page_size': 5})
+
+    def test_client_profile(self):
+        self.assertSameContent(self.client, reverse('api-account:client-profile'))
+
+    def test_encoder_skips_field_machinery(self):
+        """Test that only decimal field is converted by serializer field"""
+
+        encoder = RowEncoder(ClientProfileSerializer)
+        converted = [name for name, source, convert in encoder.fields if convert is not identity]
+        self.assertEqual(['balance'], converted)
+
+
+class ConditionalRequestsAPITestCase(APITestCase):
+    """Tests to ETag and Last-Modified of client profile and client detail"""
+
+    def setUp(self):
+        local_cache.clear()
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+        self.user = User.objects.create(
+            first_name='Test',
+            last_name='Client',
+            email='test1@testuser.com',
+            passport_number='32491221',
+        )
+        self.user.set_password('1234')
+        self.user.save()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % self.user.token)
+
+        self.detail_url = reverse('api-account:manager-client-detail', kwargs={'id': self.user.id})
+        self.profile_url = reverse('api-account:client-profile')
+
+    def test_not_modified(self):
+        """Test that unchanged profile is checked by one column"""
+
+        response = self.client.get(self.profile_url)
+        etag = response['ETag']
+
+        # token is cached, only modified_at is selected
+        with self.assertNumQueries(1):
+            response = self.client.get(self.profile_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        response = self.client.get(self.profile_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_etag_changed_by_set_based_updates(self):
+        """Test that ledger and bulk updates change ETag"""
+
+        etag = self.manager.get(self.detail_url)['ETag']
+
+        ledger.credit(self.user.id, Decimal('10.00'))
+        response = self.client.get(self.profile_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('10.00', response.data['balance'])
+        etag = response['ETag']
+
+        self.manager.post(reverse('api-account:manager-client-bulk'), {
+            'action': 'update', 'ids': [self.user.id], 'is_closed': True,
+        }, format='json')
+        response = self.manager.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_if_match(self):
+        """Test that update with stale ETag is rejected"""
+
+        etag = self.manager.get(self.detail_url)['ETag']
+
+        response = self.manager.patch(self.detail_url, {'is_active': False}, HTTP_IF_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+        response = self.manager.patch(self.detail_url, {'is_active': True}, HTTP_IF_MATCH=etag)
+        self.assertEqual(status.HTTP_412_PRECONDITION_FAILED, response.status_code)
+        self.assertFalse(User.objects.get(id=self.user.id).is_active)
+
+    def test_forbidden_before_conditions(self):
+        """Test that client without PIN or inactive client is refused for matching ETag"""
+
+        etag = self.client.get(self.profile_url)['ETag']
+
+        # update() keeps modified_at, so ETag still matches
+        # inactive users are rejected by token authentication
+        for values, status_code in (
+            ({'password': ''}, status.HTTP_403_FORBIDDEN),
+            ({'is_active': False}, status.HTTP_401_UNAUTHORIZED),
+        ):
+            User.objects.filter(id=self.user.id).update(**values)
+            invalidate_users([self.user.id])
+            response = self.client.get(self.profile_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(status_code, response.status_code)
+            response = self.client.patch(self.profile_url, {'first_name': 'Other'}, HTTP_IF_MATCH='"stale"')
+            self.assertEqual(status_code, response.status_code)
+
+
+class ManagerClientSearchAPITestCase(APITestCase):
+    """Tests to search of clients by name, email and passport number"""
+
+    url = reverse('api-account:manager-client-list')
+
+    def setUp(self):
+        manager = User.objects.create(
+            first_name='Manager',
+            last_name='manager',
+            email='test@testuser.com',
+            passport_number='32491220',
+            is_manager=True,
+        )
+        self.manager = APIClient()
+        self.manager.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+        for first_name, last_name, email, passport_number in (
+            ('John', 'Smith', 'john.smith@testuser.com', 'AB 123456'),
+            ('Jane', 'Smithson', 'jane@testuser.com', 'CD 654321'),
+            ('José', 'García', 'jgarcia@testuser.com', 'EF 111111'),
+        ):
+            User.objects.create(
+                first_name=first_name,
+                last_name=last_name,
+                email=email,
+                passport_number=passport_number,
+            )
+
+    def search(self, query, **params):
+        params['search'] = query
+        response = self.manager.get(self.url, params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return sorted(client['email'] for client in response.data['results'])
+
+    def test_search(self):
+        """Test exact and prefix matches"""
+
+        self.assertEqual(['jane@testuser.com', 'john.smith@testuser.com'], self.search('smith'))
+        self.assertEqual(['john.smith@testuser.com'], self.search('John Smith'))
+        self.assertEqual(['john.smith@testuser.com'], self.search('john.smith@testuser.com'))
+        self.assertEqual(['jane@testuser.com'], self.search('cd654321'))
+        self.assertEqual(['jgarcia@testuser.com'], self.search('garcia jose'))
+        self.assertEqual([], self.search('smith', is_active=False))
+        self.assertEqual([], self.search('test@testuser.com'))
+
+    def test_tokens_updated(self):
+        """Test that tokens follow changes of client"""
+
+        client = User.objects.get(email='jane@testuser.com')
+        client.last_name = 'Brown'
+        client.save()
+
+        self.assertEqual(['john.smith@testuser.com'], self.search('smith'))
+        self.assertEqual(['jane@testuser.com'], self.search('brown'))
+
+        # unrelated changes do not touch tokens
+        client.is_closed = True
+        with CaptureQueriesContext(connection) as queries:
+            client.save()
+        self.assertFalse([query for query in queries.captured_queries if 'clientsearchtoken' in query['sql']])
+
+
+THROTTLE_RATES = {
+    'login_ip': '5/min',
+    'login_email': '2/min',
+    'provide_pin_user': '1/min',
+}
+
+
+@override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=THROTTLE_RATES))
+class LocalThrottlingAPITestCase(APITestCase):
+    """Tests to in-process throttling"""
+
+    def setUp(self):
+        cache.clear()
+        reset_throttles()
+
+    def tearDown(self):
+        reset_throttles()
+
+    def login(self, email, **extra):
+        return self.client.post(
+            reverse('api-account:user-login'), {'email': email, 'password': 'wrong'}, **extra
+        )
+
+    def test_email_throttled_before_queries(self):
+        """Test that throttled login does not query users or hash password"""
+
+        with mock.patch('accounts.api.serializers.check_password', return_value=False) as check_password:
+            for i in range(2):
+                self.assertEqual(status.HTTP_400_BAD_REQUEST, self.login('test@testuser.com').status_code)
+            self.assertEqual(2, check_password.call_count)
+
+            with self.assertNumQueries(0):
+                response = self.login('Test@testuser.com')
+            self.assertEqual(2, check_password.call_count)
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertIn('Retry-After', response)
+
+        # other emails from other addresses are allowed
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.login('other@testuser.com').status_code)
+
+    def test_ip_throttled(self):
+        """Test that one address is limited for any emails"""
+
+        statuses = [
+            self.login('test%d@testuser.com' % i, REMOTE_ADDR='10.0.0.1').status_code for i in range(6)
+        ]
+        self.assertEqual([status.HTTP_400_BAD_REQUEST] * 5 + [status.HTTP_429_TOO_MANY_REQUESTS], statuses)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.login('test@testuser.com', REMOTE_ADDR='10.0.0.2').status_code)
+
+    def test_forwarded_for_ignored(self):
+        """Test that client can not change its address by X-Forwarded-For"""
+
+        statuses = [
+            self.login('test%d@testuser.com' % i, REMOTE_ADDR='10.0.0.1',
+                       HTTP_X_FORWARDED_FOR='192.168.0.%d' % i).status_code
+            for i in range(6)
+        ]
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, statuses[-1])
+
+    def test_shared_count(self):
+        """Test that key is blocked when all processes together exceeded rate"""
+
+        registry = get_registry('login_email', '2/min')
+        # other process already allowed two requests in this period
+        registry.sync({'test@testuser.com': 2})
+        self.assertTrue(registry.allow('other@testuser.com')[0])
+
+        with override_settings(LOCAL_THROTTLE=dict(settings.LOCAL_THROTTLE, SYNC_INTERVAL=0)):
+            self.assertTrue(registry.allow('test@testuser.com')[0])
+        allowed, wait = registry.allow('test@testuser.com')
+        self.assertFalse(allowed)
+        self.assertTrue(0 < wait <= 60)
+
+    def test_sync_of_processes_added(self):
+        """Test that counts synced by registries of two processes are summed exactly"""
+
+        period = int(time.time() // 60)
+        first = BucketRegistry('login_email', 10, 60)
+        second = BucketRegistry('login_email', 10, 60)
+        first.sync({'test@testuser.com': 3, 'other@testuser.com': 1})
+        second.sync({'test@testuser.com': 4})
+        first.sync({'test@testuser.com': 2})
+
+        digest = hashlib.md5(b'test@testuser.com').hexdigest()
+        self.assertEqual(9, cache.get(CACHE_KEY % ('login_email', digest, period)))
+
+        second.sync({'test@testuser.com': 2})
+        self.assertFalse(second.allow('test@testuser.com')[0])
+        self.assertTrue(first.allow('test@testuser.com')[0])
+
+    def test_user_throttled(self):
+        """Test provide PIN throttled by user"""
+
+        user = User.objects.create(
+            first_name='Test',
+            last_name='User',
+            email='test@testuser.com',
+            passport_number='12345678'
+        )
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % user.token)
 
+        url = reverse('api-account:client-provide-pin')
+        data = {'password': '1234', 'password1': '1234'}
+        self.assertEqual(status.HTTP_200_OK, self.client.put(url, data).status_code)
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, self.client.put(url, data).status_code)
@@ -0,0 +1,210 @@
+"""
+Throttling with in-process token buckets.
+
+Every process keeps bucket per key (IP, email or user) and decides without
+cache round trip, so throttled requests are refused before any query or
+password hashing. Requests allowed by local buckets are counted and every
+`SYNC_INTERVAL` seconds the counts are added to shared cache per rate period.
+Key which exceeded its rate in all processes together is refused by every
+process until the period ends.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+CACHE_KEY = 'accounts:throttle:%s:%s:%d'
+
+
+class TokenBucket(object):
+    """ Bucket with `capacity` tokens refilled with `rate` tokens per second """
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+    def consume(self, capacity, rate, now):
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def wait(self, rate):
+        return (1 - self.tokens) / rate
+
+
+class BucketRegistry(object):
+    """ Buckets of one scope, bounded count of keys, least recently used are dropped """
+
+    timer = time.monotonic
+
+    def __init__(self, scope, num_requests, duration):
+        self.scope = scope
+        self.capacity = num_requests
+        self.duration = duration
+        self.rate = num_requests / duration
+        self.buckets = OrderedDict()
+        # allowed requests per key since last sync
+        self.pending = {}
+        # key -> time until which key is refused after shared count exceeded rate
+        self.blocked = {}
+        self.synced = self.timer()
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        """ Returns (allowed, wait) """
+
+        now = self.timer()
+        with self.lock:
+            blocked_until = self.blocked.get(key)
+            if blocked_until is not None:
+                if blocked_until > now:
+                    return False, blocked_until - now
+                del self.blocked[key]
+
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.capacity, now)
+                if len(self.buckets) > settings.LOCAL_THROTTLE['MAX_KEYS']:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+
+            if not bucket.consume(self.capacity, self.rate, now):
+                return False, bucket.wait(self.rate)
+
+            self.pending[key] = self.pending.get(key, 0) + 1
+            sync = now - self.synced >= settings.LOCAL_THROTTLE['SYNC_INTERVAL']
+            if sync:
+                pending, self.pending = self.pending, {}
+                self.synced = now
+
+        if sync:
+            self.sync(pending)
+        return True, None
+
+    def sync(self, pending):
+        """
+        Add local counts to shared cache and block keys which exceeded rate.
+        Counts are added by atomic incr, so syncs of processes are not lost,
+        sync runs once per SYNC_INTERVAL so round trip per key is cheap
+        """
+        # counts are kept per period of the rate, wall clock is common for processes
+        wall = time.time()
+        period = int(wall // self.duration)
+        blocked_until = self.timer() + (period + 1) * self.duration - wall
+
+        blocked = []
+        for key, count in pending.items():
+            # emails are not valid memcached keys
+            digest = hashlib.md5(str(key).encode()).hexdigest()
+            cache_key = CACHE_KEY % (self.scope, digest, period)
+            cache.add(cache_key, 0, self.duration * 2)
+            try:
+                total = cache.incr(cache_key, count)
+            except ValueError:
+                # expired between add and incr
+                continue
+            if total > self.capacity:
+                blocked.append(key)
+
+        if blocked:
+            with self.lock:
+                for key in blocked:
+                    self.blocked[key] = blocked_until
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(scope, rate):
+    key = (scope, rate)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(key)
+            if registry is None:
+                num_requests, duration = SimpleRateThrottle.parse_rate(None, rate)
+                registry = _registries[key] = BucketRegistry(scope, num_requests, duration)
+    return registry
+
+
+def reset_throttles():
+    """ Drop all local buckets """
+
+    _registries.clear()
+
+
+class LocalRateThrottle(SimpleRateThrottle):
+    """
+    Base class of local throttles. Scope is `throttle_scope` of view with
+    `scope_suffix`, rates are taken from DEFAULT_THROTTLE_RATES
+    """
+
+    scope_suffix = None
+
+    def __init__(self):
+        # rate depends on view, see allow_request
+        pass
+
+    def get_rate(self):
+        # api_settings is replaced on override of REST_FRAMEWORK, read it on every call
+        return settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}).get(self.scope)
+
+    def allow_request(self, request, view):
+        if not settings.LOCAL_THROTTLE['ENABLED']:
+            return True
+
+        self.scope = '%s_%s' % (view.throttle_scope, self.scope_suffix)
+        rate = self.get_rate()
+        if rate is None:
+            return True
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        allowed, self.wait_time = get_registry(self.scope, rate).allow(key)
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class IPRateThrottle(LocalRateThrottle):
+    scope_suffix = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.get_ident(request)
+
+
+class EmailRateThrottle(LocalRateThrottle):
+    """ Throttle by email from request data, e.g. password guessing for one account """
+
+    scope_suffix = 'email'
+
+    def get_cache_key(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not email or not isinstance(email, str):
+            return None
+        return email.strip().lower()
+
+
+class UserRateThrottle(LocalRateThrottle):
+    scope_suffix = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
@@ -4,11 +4,15 @@ from . import views
 
 urlpatterns = [
     url(r'^manager/clients/$', views.ManagerClientListView.as_view(), name='manager-client-list'),
+    url(r'^manager/clients/bulk/$', views.ManagerClientBulkView.as_view(), name='manager-client-bulk'),
+    url(r'^manager/clients/import/$', views.ManagerClientImportView.as_view(), name='manager-client-import'),
+    url(r'^manager/clients/export/$', views.ManagerClientExportView.as_view(), name='manager-client-export'),
     url(
         r'^manager/clients/(?P<id>[0-9]+)/$',
         views.ManagerClientDetailView.as_view(),
         name='manager-client-detail'
     ),
+    url(r'^manager/transfers/$', views.ManagerTransferBatchView.as_view(), name='manager-transfers'),
 
     url(r'^client/register/$', views.ClientRegisterView.as_view(), name='client-account-register'),
     url(r'^client/profile/$', views.ClientProfileView.as_view(), name='client-profile'),
@@ -1,36 +1,159 @@
+import csv
+import json
+from calendar import timegm
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import ProtectedError
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from django_filters.rest_framework import DjangoFilterBackend
 
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (
     CreateAPIView,
+    GenericAPIView,
     ListAPIView,
     RetrieveUpdateDestroyAPIView,
     RetrieveUpdateAPIView
 )
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST, \
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST, \
     HTTP_404_NOT_FOUND
 
+from accounts import ledger
+from accounts.clients import delete_clients, update_clients
+from accounts.importing import import_clients
+from finance_system.instrumentation import timer
+from accounts.models import ConcurrentUpdate
+
 from .serializers import (
+    ClientBulkActionSerializer,
     ClientForManagerSerializer,
     ClientRegisterSerializer,
     ClientProfileSerializer,
     ClientProvidePINSerilizer,
     UserLoginSerializer,
+    TransferBatchSerializer,
 )
+from .encoders import get_encoder
+from .exceptions import Conflict, PreconditionFailed
+from .filters import ClientSearchFilter
+from .pagination import ClientCursorPagination
+from .parsers import CSVParser
 from .permissions import (
     IsManagerPermission,
     IsClientPermission,
     ClientHavePINPermission
 )
+from .throttling import EmailRateThrottle, IPRateThrottle, UserRateThrottle
 
 
 User = get_user_model()
 
 
-class ManagerClientListView(ListAPIView):
-    """Client list endpoint for Managers with filters 'is_closed', 'is_active'"""
+class InstrumentedViewMixin(object):
+    """ Measure permissions checks time for request instrumentation """
+
+    def check_permissions(self, request):
+        with timer('perm'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timer('perm'):
+            super().check_object_permissions(request, obj)
+
+
+class FastReadMixin(object):
+    """
+    Render JSON reads with row encoder of serializer class instead of serializer,
+    other renderers (browsable API) use serializer for forms
+    """
+
+    def use_fast_read(self):
+        return settings.FAST_READ_PATH and self.request.accepted_renderer.format == 'json'
+
+    def get_encoder(self):
+        return get_encoder(self.get_serializer_class())
+
+
+class ConditionalMixin(object):
+    """
+    ETag and Last-Modified by `modified_at` column of object.
+    Conditions are checked by single row query before object is loaded.
+    Row is not locked for updates, they are saved only if row version is
+    still the checked one and get 409 Conflict otherwise
+    """
+
+    modified_at = None
+    version = None
+
+    def get_conditional_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+
+    def get_etag(self, modified_at):
+        return '%d.%06d' % (timegm(modified_at.utctimetuple()), modified_at.microsecond)
+
+    def set_conditional_headers(self, response):
+        response['ETag'] = '"%s"' % self.get_etag(self.modified_at)
+        response['Last-Modified'] = http_date(timegm(self.modified_at.utctimetuple()))
+        return response
+
+    def conditional(self, handler, request, *args, **kwargs):
+        row = list(self.get_conditional_queryset().order_by().values_list('modified_at', 'version')[:1])
+        self.modified_at, self.version = row[0] if row else (None, None)
+        if self.modified_at is not None:
+            response = get_conditional_response(
+                request,
+                etag=self.get_etag(self.modified_at),
+                last_modified=timegm(self.modified_at.utctimetuple())
+            )
+            if response is not None:
+                if response.status_code == PreconditionFailed.status_code:
+                    raise PreconditionFailed()
+                return self.set_conditional_headers(response)
+
+        response = handler(request, *args, **kwargs)
+        if self.modified_at is not None and response.status_code == HTTP_200_OK:
+            self.set_conditional_headers(response)
+        return response
+
+    def perform_update(self, serializer):
+        if self.version is not None:
+            # object may be loaded after the check, changes are based on checked state
+            serializer.instance.version = self.version
+        try:
+            super().perform_update(serializer)
+        except ConcurrentUpdate:
+            raise Conflict('Resource was changed by other request, fetch it again.')
+        self.modified_at = serializer.instance.modified_at
+
+    def get(self, request, *args, **kwargs):
+        return self.conditional(super().get, request, *args, **kwargs)
+
+    @transaction.atomic
+    def put(self, request, *args, **kwargs):
+        return self.conditional(super().put, request, *args, **kwargs)
+
+    @transaction.atomic
+    def patch(self, request, *args, **kwargs):
+        return self.conditional(super().patch, request, *args, **kwargs)
+
+
+class ManagerClientListView(InstrumentedViewMixin, FastReadMixin, ListAPIView):
+    """
+    Client list endpoint for Managers with filters 'is_closed', 'is_active'
+    and 'search' by name, email and passport number
+    """
 
     model = User
     queryset = User.objects.filter(
@@ -40,10 +163,169 @@ class ManagerClientListView(ListAPIView):
     )
     serializer_class = ClientForManagerSerializer
     permission_classes = [IsManagerPermission, ]
+    filter_backends = [DjangoFilterBackend, ClientSearchFilter]
     filter_fields = ('is_closed', 'is_active')
 
+    @property
+    def paginator(self):
+        """ Cursor pagination is used with `pagination=cursor` or `cursor` parameter """
+
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or 'cursor' in params:
+                self._paginator = ClientCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_read():
+            return super().list(request, *args, **kwargs)
+
+        encoder = self.get_encoder()
+        queryset = self.filter_queryset(self.get_queryset())
+        columns = encoder.columns + tuple(
+            column for column in getattr(self.paginator, 'columns', ()) if column not in encoder.columns
+        )
+        rows = self.paginate_queryset(queryset.values(*columns))
+
+        with timer('serialize'):
+            data = encoder.encode_many(rows)
+        return self.get_paginated_response(data)
+
+
+class Echo(object):
+    """ File-like object for csv.writer which returns written line """
+
+    def write(self, value):
+        return value
+
+
+class ManagerClientExportView(InstrumentedViewMixin, GenericAPIView):
+    """
+    Streaming export of clients for Managers with filters 'is_closed', 'is_active'.
+    Format is selected by `output` parameter: 'csv' (default) or 'ndjson'
+    """
+
+    model = User
+    queryset = User.objects.filter(
+        is_manager=False,
+        is_staff=False,
+        is_superuser=False
+    )
+    serializer_class = ClientForManagerSerializer
+    permission_classes = [IsManagerPermission, ]
+    filter_fields = ('is_closed', 'is_active')
+    pagination_class = None
 
-class ManagerClientDetailView(RetrieveUpdateDestroyAPIView):
+    content_types = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def iter_rows(self, queryset, fields):
+        """
+        Iterate rows by chunks selected by id, so memory does not depend
+        on count of rows and no transaction is kept open during export
+        """
+        queryset = queryset.order_by('id').values_list(*fields)
+        id_index = fields.index('id')
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id)[:settings.CLIENT_EXPORT_CHUNK_SIZE])
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            last_id = rows[-1][id_index]
+
+    def iter_csv(self, rows, fields):
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+    def iter_ndjson(self, rows, fields):
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row))) + '\n'
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'csv')
+        if output not in self.content_types:
+            raise ValidationError({'output': 'Choose one of: %s' % ', '.join(sorted(self.content_types))})
+
+        fields = list(self.get_serializer_class().Meta.fields)
+        rows = self.iter_rows(self.filter_queryset(self.get_queryset()), fields)
+        content = self.iter_csv(rows, fields) if output == 'csv' else self.iter_ndjson(rows, fields)
+
+        response = StreamingHttpResponse(content, content_type=self.content_types[output])
+        response['Content-Disposition'] = 'attachment; filename="clients.%s"' % output
+        return response
+
+
+class ManagerClientImportView(InstrumentedViewMixin, APIView):
+    """
+    Bulk import of clients for Managers.
+    Accepts JSON list of clients or CSV with header: email, first_name, last_name, passport_number.
+    Nothing is created if any row is invalid
+    """
+
+    permission_classes = [IsManagerPermission, ]
+    parser_classes = [JSONParser, CSVParser]
+
+    def post(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({'non_field_errors': ['Provide list of clients']})
+        if len(rows) > settings.CLIENT_IMPORT_MAX_SIZE:
+            raise ValidationError({
+                'non_field_errors': ['Import may contain at most %d clients' % settings.CLIENT_IMPORT_MAX_SIZE]
+            })
+
+        created, errors = import_clients(rows)
+        if errors:
+            return Response({'errors': errors}, status=HTTP_400_BAD_REQUEST)
+        return Response({'created': created}, status=HTTP_201_CREATED)
+
+
+class ManagerClientBulkView(InstrumentedViewMixin, GenericAPIView):
+    """
+    Bulk update of 'is_active', 'is_closed' or deletion of clients for Managers.
+    Clients are selected by 'ids' or by 'filter' with 'is_closed', 'is_active' or 'all': true
+    """
+
+    model = User
+    queryset = User.objects.filter(
+        is_manager=False,
+        is_staff=False,
+        is_superuser=False
+    )
+    serializer_class = ClientBulkActionSerializer
+    permission_classes = [IsManagerPermission, ]
+    # missing booleans of form data are parsed as False and would be written to all selected clients
+    parser_classes = [JSONParser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        queryset = self.get_queryset()
+        if 'ids' in data:
+            queryset = queryset.filter(id__in=data['ids'])
+        else:
+            queryset = queryset.filter(**data['filter'])
+
+        if data['action'] == ClientBulkActionSerializer.ACTION_DELETE:
+            try:
+                return Response({'deleted': delete_clients(queryset)}, status=HTTP_200_OK)
+            except ProtectedError:
+                raise Conflict('Clients with balance history can not be deleted, close accounts instead')
+
+        return Response({'updated': update_clients(queryset, **data['values'])}, status=HTTP_200_OK)
+
+
+class ManagerClientDetailView(InstrumentedViewMixin, ConditionalMixin, RetrieveUpdateDestroyAPIView):
     """Client resource endpoint for Managers"""
 
     model = User
@@ -57,17 +339,56 @@ class ManagerClientDetailView(RetrieveUpdateDestroyAPIView):
     serializer_class = ClientForManagerSerializer
     permission_classes = [IsManagerPermission, ]
 
+    def perform_destroy(self, instance):
+        try:
+            instance.delete()
+        except ProtectedError:
+            raise Conflict('Client with balance history can not be deleted, close account instead')
+
+
+class ManagerTransferBatchView(InstrumentedViewMixin, APIView):
+    """
+    Batch transfer endpoint for Managers.
+    All transfers are applied in one transaction, result is returned for every transfer
+    """
 
-class ClientRegisterView(CreateAPIView):
+    permission_classes = [IsManagerPermission, ]
+    serializer_class = TransferBatchSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = TransferBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        transfers = serializer.validated_data['transfers']
+        errors = ledger.transfer_batch([
+            (item['from_account'], item['to_account'], item['amount'], item['description'])
+            for item in transfers
+        ])
+
+        results = [
+            {'status': 'rejected', 'error': error} if error else {'status': 'applied'}
+            for error in errors
+        ]
+        applied = sum(1 for error in errors if error is None)
+        return Response({
+            'applied': applied,
+            'rejected': len(errors) - applied,
+            'results': results,
+        }, status=HTTP_200_OK)
+
+
+class ClientRegisterView(InstrumentedViewMixin, CreateAPIView):
     """Endpoint that provide user register"""
 
     model = User
     queryset = User.objects.all()
     serializer_class = ClientRegisterSerializer
     permission_classes = [AllowAny, ]
+    throttle_classes = [IPRateThrottle, EmailRateThrottle]
+    throttle_scope = 'register'
 
 
-class ClientProfileView(RetrieveUpdateAPIView):
+class ClientProfileView(InstrumentedViewMixin, ConditionalMixin, FastReadMixin, RetrieveUpdateAPIView):
     """Endpoint to see and updtae client account """
 
     model = User
@@ -75,18 +396,37 @@ class ClientProfileView(RetrieveUpdateAPIView):
     serializer_class = ClientProfileSerializer
     permission_classes = [ClientHavePINPermission, ]
 
+    def get_conditional_queryset(self):
+        # 304 and 412 are returned before get_object, they are allowed to clients with PIN only
+        self.check_object_permissions(self.request, self.request.user)
+        return self.get_queryset().filter(pk=self.request.user.pk)
+
     def get_object(self):
         obj = self.request.user
+        if self.modified_at is not None and obj.modified_at != self.modified_at:
+            # authenticated user is cached and may be older than the row
+            obj = self.get_queryset().get(pk=obj.pk)
         self.check_object_permissions(self.request, obj)
         return obj
 
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_fast_read():
+            return super().retrieve(request, *args, **kwargs)
+
+        instance = self.get_object()
+        with timer('serialize'):
+            data = self.get_encoder().encode_instance(instance)
+        return Response(data)
+
 
-class ClientProvidePINView(RetrieveUpdateAPIView):
+class ClientProvidePINView(InstrumentedViewMixin, RetrieveUpdateAPIView):
     """Endpoint to provide pin for Client User"""
     model = User
     queryset = User.objects.all()
     serializer_class = ClientProvidePINSerilizer
     permission_classes = [IsClientPermission, ]
+    throttle_classes = [UserRateThrottle]
+    throttle_scope = 'provide_pin'
 
     def get_object(self):
         obj = self.request.user
@@ -99,22 +439,29 @@ class ClientProvidePINView(RetrieveUpdateAPIView):
         if serializer.is_valid(raise_exception=True):
             pin = serializer.data['password']
             user.set_password(pin)
-            user.save()
+            # user may be cached, other columns are not written
+            user.save(update_fields=['password'])
             return Response(serializer.data, status=HTTP_200_OK)
         return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
 
 
-class UserLoginAPIView(APIView):
+class UserLoginAPIView(InstrumentedViewMixin, APIView):
     """Endpoint for login users"""
 
     permission_classes = [AllowAny]
     serializer_class = UserLoginSerializer
+    throttle_classes = [IPRateThrottle, EmailRateThrottle]
+    throttle_scope = 'login'
 
     def post(self, request, *args, **kwargs):
 
         data = request.data
         serializer = UserLoginSerializer(data=data)
         if serializer.is_valid(raise_exception=True):
-            new_data = serializer.data
+            # validated data is returned as is, without serializing it again
+            new_data = {
+                'email': serializer.validated_data['email'],
+                'token': serializer.validated_data['token'].key,
+            }
             return Response(new_data, status=HTTP_200_OK)
         return Response(serializer.errors, status=HTTP_404_NOT_FOUND)
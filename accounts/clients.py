@@ -0,0 +1,84 @@
+"""
+Set based changes of many clients.
+
+Clients are changed by one UPDATE or DELETE statement, so post_save
+and post_delete are not sent and caches filled by signal receivers are
+invalidated here.
+"""
+from django.db import transaction
+from django.db.models import CASCADE, PROTECT, F, ProtectedError
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from .token_cache import invalidate_tokens, invalidate_users
+
+
+# fields which managers may change for many clients at once
+BULK_UPDATE_FIELDS = ('is_active', 'is_closed')
+
+# ids in one IN (...) lookup, SQLite allows 999 parameters
+DELETE_CHUNK_SIZE = 500
+
+
+@transaction.atomic
+def update_clients(queryset, **values):
+    """ Set values for clients from queryset. Returns count of updated clients """
+
+    # selected rows stay locked until commit, so invalidated users are the updated ones
+    user_ids = list(queryset.select_for_update().order_by('id').values_list('id', flat=True))
+    if not user_ids:
+        return 0
+
+    # auto_now is not applied by update(), version makes concurrent saves of clients fail
+    updated = queryset.update(modified_at=timezone.now(), version=F('version') + 1, **values)
+    transaction.on_commit(lambda: invalidate_users(user_ids))
+    return updated
+
+
+def related_querysets(model, ids):
+    """ (on_delete, queryset) of rows referencing objects with ids, many to many rows are cascaded """
+
+    for relation in model._meta.related_objects:
+        if relation.one_to_many or relation.one_to_one:
+            yield relation.on_delete, relation.related_model._base_manager.filter(
+                **{'%s__in' % relation.field.name: ids}
+            )
+    for field in model._meta.many_to_many:
+        yield CASCADE, field.remote_field.through._base_manager.filter(**{'%s__in' % field.m2m_field_name(): ids})
+
+
+@transaction.atomic
+def delete_clients(queryset):
+    """
+    Delete clients from queryset with their tokens and other rows referencing
+    them, by one DELETE per table for every DELETE_CHUNK_SIZE clients.
+    Returns count of deleted clients. Raises ProtectedError if some client
+    has ledger entries, nothing is deleted then
+    """
+    model = queryset.model
+    user_ids = list(queryset.select_for_update().order_by('id').values_list('id', flat=True))
+    # tokens are deleted below, cached ones are found by their keys
+    keys = []
+
+    deleted = 0
+    for start in range(0, len(user_ids), DELETE_CHUNK_SIZE):
+        ids = user_ids[start:start + DELETE_CHUNK_SIZE]
+        related = list(related_querysets(model, ids))
+        for on_delete, related_queryset in related:
+            if on_delete is PROTECT and related_queryset.exists():
+                raise ProtectedError(
+                    'Cannot delete clients referenced by %s' % related_queryset.model._meta.label,
+                    related_queryset
+                )
+            if on_delete not in (CASCADE, PROTECT):
+                raise ValueError('Unsupported on_delete of %s' % related_queryset.model._meta.label)
+
+        keys.extend(Token.objects.filter(user_id__in=ids).values_list('key', flat=True))
+        for on_delete, related_queryset in related:
+            if on_delete is CASCADE:
+                related_queryset._raw_delete(related_queryset.db)
+        deleted += model._base_manager.filter(id__in=ids)._raw_delete(queryset.db)
+
+    transaction.on_commit(lambda: invalidate_tokens(keys))
+    return deleted
@@ -0,0 +1,43 @@
+"""
+Password hashing in bounded worker pool.
+
+PBKDF2 releases GIL, so hashing runs in a pool of `PASSWORD_HASHING_WORKERS`
+threads per process. Bursts of logins queue for the pool instead of
+occupying every request thread with CPU bound work.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS)
+
+
+def _check_password(raw_password, encoded):
+    if not hashers.is_password_usable(encoded):
+        # spend the same time as for real password
+        hashers.make_password(raw_password)
+        return False
+    return hashers.check_password(raw_password, encoded)
+
+
+def _must_update(encoded):
+    preferred = hashers.get_hasher()
+    return hashers.identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def check_password(user, raw_password):
+    """
+    Check password of user in hashing pool.
+    Pass None as user to spend the same time for unknown user
+    """
+    encoded = user.password if user is not None else None
+    is_correct = executor.submit(_check_password, raw_password, encoded).result()
+
+    if is_correct and _must_update(encoded):
+        # hasher settings were changed, upgrade stored hash
+        user.set_password(raw_password)
+        user.save(update_fields=['password'])
+
+    return is_correct
@@ -0,0 +1,159 @@
+"""
+Bulk import of clients.
+
+Rows are validated all together: uniqueness of emails and passports is
+checked with one query per chunk of values instead of query per row.
+Users with auth and search tokens are inserted with bulk inserts, post_save
+is not sent, so notifications are queued as one batch
+(see `notify_clients_imported`).
+Nothing is created if any row is invalid, rows created concurrently after
+validation are reported the same way.
+"""
+import csv
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from rest_framework.authtoken.models import Token
+
+from .models import User
+from .notifications import notify_clients_imported
+from .search import create_tokens
+from .utils import bulk_create
+
+
+IMPORT_FIELDS = ('email', 'first_name', 'last_name', 'passport_number')
+UNIQUE_FIELDS = ('email', 'passport_number')
+
+# values in one IN (...) lookup, SQLite allows 999 parameters
+LOOKUP_CHUNK_SIZE = 500
+
+# users created by one transaction step
+IMPORT_CHUNK_SIZE = 5000
+
+
+def chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def read_csv(stream):
+    """ Read rows from CSV with header """
+
+    return list(csv.DictReader(stream))
+
+
+def read_json(stream):
+    """ Read rows from JSON list of objects """
+
+    rows = json.load(stream)
+    if not isinstance(rows, list):
+        raise ValueError('Expected list of clients')
+    return rows
+
+
+def clean_row(row):
+    """ Return (client, errors) for one row """
+
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Expected object with fields: %s' % ', '.join(IMPORT_FIELDS)]}
+
+    client = {}
+    errors = {}
+    for name in IMPORT_FIELDS:
+        value = row.get(name)
+        value = '' if value is None else str(value).strip()
+        try:
+            client[name] = User._meta.get_field(name).clean(value, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    return client, errors
+
+
+def validate_rows(rows):
+    """
+    Validate fields of rows and uniqueness in file and in database.
+    Returns (clients, errors), errors is list of dicts with 1-based row number
+    """
+    errors = {}
+    clients = []
+    # value -> number of first row with it
+    seen = {field: OrderedDict() for field in UNIQUE_FIELDS}
+
+    def add_error(number, field, message):
+        errors.setdefault(number, {}).setdefault(field, []).append(message)
+
+    for number, row in enumerate(rows, 1):
+        client, row_errors = clean_row(row)
+        if row_errors:
+            errors[number] = row_errors
+            continue
+
+        for field in UNIQUE_FIELDS:
+            first = seen[field].setdefault(client[field], number)
+            if first != number:
+                add_error(number, field, 'Duplicate of row %d' % first)
+        clients.append(client)
+
+    for field in UNIQUE_FIELDS:
+        label = User._meta.get_field(field).verbose_name
+        for values in chunks(list(seen[field]), LOOKUP_CHUNK_SIZE):
+            existing = User.objects.filter(**{field + '__in': values}).values_list(field, flat=True)
+            for value in existing:
+                add_error(seen[field][value], field, 'User with this %s already exists' % label)
+
+    return clients, [
+        OrderedDict((('row', number), ('errors', errors[number]))) for number in sorted(errors)
+    ]
+
+
+def create_clients(clients):
+    """ Insert inactive clients with tokens, returns created users """
+
+    bulk_create(User, [
+        User(is_active=False, **client) for client in clients
+    ])
+
+    # bulk_create does not return ids on SQLite
+    users = []
+    for emails in chunks([client['email'] for client in clients], LOOKUP_CHUNK_SIZE):
+        users.extend(User.objects.filter(email__in=emails).only('id', *IMPORT_FIELDS))
+
+    tokens = []
+    for user in users:
+        token = Token(user_id=user.id)
+        token.key = token.generate_key()
+        tokens.append(token)
+    bulk_create(Token, tokens)
+    create_tokens(users)
+    return users
+
+
+def import_clients(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Create clients from rows of dicts with IMPORT_FIELDS.
+    Returns (created, errors), nothing is created if there are errors
+    """
+    clients, errors = validate_rows(rows)
+    if errors:
+        return 0, errors
+
+    try:
+        with transaction.atomic():
+            users = []
+            for chunk in chunks(clients, chunk_size):
+                users.extend(create_clients(chunk))
+            notify_clients_imported(users)
+    except IntegrityError:
+        # clients were created by concurrent import or registration after validation
+        clients, errors = validate_rows(rows)
+        if not errors:
+            errors = [OrderedDict((
+                ('row', None),
+                ('errors', {'non_field_errors': ['Clients were changed concurrently, try again']}),
+            ))]
+        return 0, errors
+
+    return len(users), []
@@ -0,0 +1,264 @@
+"""
+Posting service for user balances.
+
+Every change of `User.balance` is recorded with `LedgerEntry`.
+Postings are applied in one transaction: affected users are locked
+with SELECT FOR UPDATE in id order, so concurrent batches never deadlock,
+entries are inserted with bulk_create and balances are changed by one
+UPDATE with F() expression.
+
+Because postings of one user are serialized by the lock, ids and creation
+times of user entries grow together. `BalanceCheckpoint` stores balance
+after some entry, so balance at any moment and reconciliation read only
+entries after latest checkpoint.
+"""
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import User, LedgerEntry, LedgerError, BalanceCheckpoint
+from .token_cache import invalidate_users
+from .utils import bulk_create
+
+
+# users updated by one UPDATE statement, every user takes three query parameters
+UPDATE_CHUNK_SIZE = 300
+
+CENT = Decimal('0.01')
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+Posting = namedtuple('Posting', ('user_id', 'amount', 'description'))
+Posting.__new__.__defaults__ = ('', )
+
+Transfer = namedtuple('Transfer', ('from_id', 'to_id', 'amount', 'description'))
+Transfer.__new__.__defaults__ = ('', )
+
+
+def lock_balances(user_ids):
+    """
+    Lock users rows in id order, must be called in transaction.
+    Returns OrderedDict user id -> balance
+    """
+    balances = OrderedDict(
+        User.objects.select_for_update().filter(
+            id__in=sorted(set(user_ids))
+        ).order_by('id').values_list('id', 'balance')
+    )
+
+    missing = set(user_ids) - set(balances)
+    if missing:
+        raise LedgerError('Users do not exist: %s' % ', '.join(str(i) for i in sorted(missing)))
+    return balances
+
+
+def make_entry(balances, user_id, amount, description='', allow_overdraft=False, created_at=None):
+    """ Build entry and change locked balance, entry is not saved """
+
+    amount = Decimal(amount).quantize(CENT)
+    if not amount:
+        raise LedgerError('Amount must not be zero')
+
+    balance = balances[user_id] + amount
+    if balance < 0 and not allow_overdraft:
+        raise InsufficientFunds('Insufficient funds on account %d' % user_id)
+
+    balances[user_id] = balance
+    return LedgerEntry(
+        user_id=user_id,
+        amount=amount,
+        balance_after=balance,
+        description=description,
+        created_at=created_at or timezone.now()
+    )
+
+
+def save_entries(entries):
+    """ Insert entries and apply them to users balances, must be called in transaction """
+
+    if not entries:
+        return
+
+    bulk_create(LedgerEntry, entries)
+
+    deltas = OrderedDict()
+    for entry in entries:
+        deltas[entry.user_id] = deltas.get(entry.user_id, 0) + entry.amount
+
+    user_ids = sorted(deltas)
+    now = timezone.now()
+    for i in range(0, len(user_ids), UPDATE_CHUNK_SIZE):
+        chunk = user_ids[i:i + UPDATE_CHUNK_SIZE]
+        User.objects.filter(id__in=chunk).update(
+            balance=F('balance') + Case(
+                *[When(id=user_id, then=Value(deltas[user_id])) for user_id in chunk],
+                output_field=DecimalField()
+            ),
+            modified_at=now
+        )
+
+    # cached request.user keeps balance
+    transaction.on_commit(lambda: invalidate_users(user_ids))
+
+
+def post(postings, allow_overdraft=False):
+    """
+    Apply postings (credits and debits) in one transaction.
+    All postings are applied or none of them. Returns created entries
+    """
+    postings = [Posting(*posting) for posting in postings]
+    if not postings:
+        return []
+
+    with transaction.atomic():
+        balances = lock_balances([posting.user_id for posting in postings])
+        now = timezone.now()
+        entries = [
+            make_entry(
+                balances,
+                posting.user_id,
+                posting.amount,
+                posting.description,
+                allow_overdraft=allow_overdraft,
+                created_at=now
+            ) for posting in postings
+        ]
+        save_entries(entries)
+
+    return entries
+
+
+def credit(user_id, amount, description=''):
+    return post([(user_id, amount, description)])[0]
+
+
+def debit(user_id, amount, description=''):
+    return post([(user_id, -Decimal(amount), description)])[0]
+
+
+def transfer_batch(transfers):
+    """
+    Apply transfers between clients in one transaction. Clients are locked once in id order.
+    Transfer from or to missing or closed account, account of manager or staff
+    and transfer without funds are rejected, other transfers are applied.
+    Returns list of error messages, None for applied transfer
+    """
+    transfers = [Transfer(*transfer) for transfer in transfers]
+    user_ids = sorted({transfer.from_id for transfer in transfers} | {transfer.to_id for transfer in transfers})
+
+    with transaction.atomic():
+        # accounts of managers and staff are reported as missing
+        users = User.objects.select_for_update().filter(
+            id__in=user_ids, is_manager=False, is_staff=False, is_superuser=False
+        ).order_by('id')
+        balances = OrderedDict()
+        closed = set()
+        for user_id, balance, is_closed in users.values_list('id', 'balance', 'is_closed'):
+            balances[user_id] = balance
+            if is_closed:
+                closed.add(user_id)
+
+        now = timezone.now()
+        entries = []
+        errors = []
+        for transfer in transfers:
+            error = None
+            if transfer.from_id not in balances or transfer.to_id not in balances:
+                error = 'Account does not exist'
+            elif transfer.from_id in closed or transfer.to_id in closed:
+                error = 'Account is closed'
+            else:
+                try:
+                    # debit is checked before credit changes any balance
+                    entries.append(make_entry(
+                        balances, transfer.from_id, -Decimal(transfer.amount), transfer.description, created_at=now
+                    ))
+                    entries.append(make_entry(
+                        balances, transfer.to_id, transfer.amount, transfer.description, created_at=now
+                    ))
+                except LedgerError as e:
+                    error = str(e)
+            errors.append(error)
+
+        save_entries(entries)
+
+    return errors
+
+
+def to_decimal(value):
+    # SQLite returns sums of decimal column as float
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value or 0).quantize(CENT)
+
+
+def balance_as_of(user_id, when):
+    """ Return user balance at given moment from latest checkpoint and entries after it """
+
+    checkpoint = BalanceCheckpoint.objects.filter(
+        user_id=user_id,
+        as_of__lte=when
+    ).order_by('-id').first()
+
+    entries = LedgerEntry.objects.filter(user_id=user_id, created_at__lte=when)
+    balance = 0
+    if checkpoint is not None:
+        entries = entries.filter(id__gt=checkpoint.entry_id)
+        balance = checkpoint.balance
+
+    return to_decimal(balance) + to_decimal(entries.aggregate(total=Sum('amount'))['total'])
+
+
+RECONCILE_SQL = """
+    SELECT u.id, u.balance, c.balance, COALESCE(SUM(e.amount), 0), MAX(e.id), MAX(e.created_at)
+    FROM {user} u
+    LEFT JOIN {checkpoint} c ON c.id = (
+        SELECT MAX(c2.id) FROM {checkpoint} c2 WHERE c2.user_id = u.id
+    )
+    LEFT JOIN {entry} e ON e.user_id = u.id AND e.id > COALESCE(c.entry_id, 0)
+    WHERE u.id >= %s AND u.id < %s
+    GROUP BY u.id, u.balance, c.balance, c.entry_id
+"""
+
+
+def reconcile_range(start, stop, checkpoint=True):
+    """
+    Check stored balance of users with id in [start, stop) against latest checkpoint
+    plus new entries and save new checkpoints for matched users with new entries.
+    Returns tuple (count of checked users, list of mismatched user ids)
+    """
+    sql = RECONCILE_SQL.format(
+        user=User._meta.db_table,
+        checkpoint=BalanceCheckpoint._meta.db_table,
+        entry=LedgerEntry._meta.db_table
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [start, stop])
+        rows = cursor.fetchall()
+
+    mismatches = []
+    checkpoints = []
+    for user_id, balance, checkpoint_balance, delta, last_entry_id, as_of in rows:
+        expected = to_decimal(checkpoint_balance) + to_decimal(delta)
+        if expected != to_decimal(balance):
+            mismatches.append(user_id)
+        elif last_entry_id is not None:
+            if isinstance(as_of, str):
+                as_of = parse_datetime(as_of)
+            checkpoints.append(BalanceCheckpoint(
+                user_id=user_id,
+                entry_id=last_entry_id,
+                balance=expected,
+                as_of=timezone.make_aware(as_of, timezone.utc) if timezone.is_naive(as_of) else as_of
+            ))
+
+    if checkpoint:
+        bulk_create(BalanceCheckpoint, checkpoints)
+    return len(rows), mismatches
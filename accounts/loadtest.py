@@ -0,0 +1,249 @@
+"""
+Load test scenarios for /api/v0/ endpoints.
+
+Every scenario builds requests for seeded users (see `seed_clients` command)
+and is run by `loadtest` command with fixed concurrency against running server.
+"""
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import requests
+
+
+# seeded users, see `seed_clients` command
+SEED_EMAIL = '%s%d@seed.test'
+SEED_PIN = '1234'
+
+SERVER_TIMING_QUERIES_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+class Scenario(object):
+    """ Base scenario, `request` returns (method, path, kwargs) for requests.Session """
+
+    name = None
+
+    def __init__(self, clients, managers):
+        # clients are dicts with token and profile fields, managers are tokens
+        self.clients = clients
+        self.managers = managers
+
+    def auth(self, token):
+        return {'Authorization': 'Token %s' % token}
+
+    def request(self):
+        raise NotImplementedError
+
+
+class Login(Scenario):
+    name = 'login'
+
+    def request(self):
+        client = random.choice(self.clients)
+        return 'post', '/api/v0/login/', {'json': {'email': client['email'], 'password': SEED_PIN}}
+
+
+class Register(Scenario):
+    name = 'register'
+
+    def request(self):
+        key = uuid.uuid4().hex
+        return 'post', '/api/v0/client/register/', {'json': {
+            'email': 'load-%s@seed.test' % key,
+            'first_name': 'Load',
+            'last_name': 'Test',
+            'passport_number': key[:10],
+        }}
+
+
+class ProfileGet(Scenario):
+    name = 'profile_get'
+
+    def request(self):
+        client = random.choice(self.clients)
+        return 'get', '/api/v0/client/profile/', {'headers': self.auth(client['token'])}
+
+
+class ProfilePut(Scenario):
+    name = 'profile_put'
+
+    def request(self):
+        client = random.choice(self.clients)
+        return 'put', '/api/v0/client/profile/', {
+            'headers': self.auth(client['token']),
+            'json': {field: client[field] for field in ('email', 'first_name', 'last_name', 'passport_number')},
+        }
+
+
+class ProvidePIN(Scenario):
+    name = 'provide_pin'
+
+    def request(self):
+        client = random.choice(self.clients)
+        return 'put', '/api/v0/client/provide_pin/', {
+            'headers': self.auth(client['token']),
+            'json': {'password': SEED_PIN, 'password1': SEED_PIN},
+        }
+
+
+class ManagerList(Scenario):
+    name = 'manager_list'
+
+    def request(self):
+        token = random.choice(self.managers)
+        return 'get', '/api/v0/manager/clients/', {
+            'headers': self.auth(token),
+            'params': {'is_active': 'true', 'page': random.randint(1, 50)},
+        }
+
+
+class ManagerDetail(Scenario):
+    name = 'manager_detail'
+
+    def request(self):
+        token = random.choice(self.managers)
+        return 'get', '/api/v0/manager/clients/%d/' % random.choice(self.clients)['id'], {
+            'headers': self.auth(token),
+        }
+
+
+SCENARIOS = OrderedDict(
+    (scenario.name, scenario) for scenario in (
+        Login, Register, ProfileGet, ProfilePut, ProvidePIN, ManagerList, ManagerDetail
+    )
+)
+
+
+def percentile(values, percent):
+    """ Nearest-rank percentile of sorted values """
+
+    if not values:
+        return None
+    index = max(0, int(round(percent / 100.0 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def get_rss(pid):
+    """ Resident memory in bytes of process and its children, None if unknown (Linux only) """
+
+    parents = {}
+    for name in os.listdir('/proc') if os.path.isdir('/proc') else ():
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as stat:
+                # command in parentheses may contain spaces
+                parents[int(name)] = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    if pid not in parents:
+        return None
+
+    tree = {pid}
+    for i in range(len(parents)):
+        children = {child for child, parent in parents.items() if parent in tree} - tree
+        if not children:
+            break
+        tree |= children
+
+    rss = 0
+    for process in tree:
+        try:
+            with open('/proc/%d/status' % process) as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return rss
+
+
+class MemorySampler(threading.Thread):
+    """ Peak resident memory of server while scenario runs """
+
+    interval = 0.1
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = get_rss(pid)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            rss = get_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak, rss)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def run_scenario(scenario, base_url, requests_count, concurrency, server_pid=None, idle_rss=None):
+    """
+    Send requests with given concurrency, returns dict with results.
+    Memory is reported if pid of local server is given, growth is counted
+    from `idle_rss` or from memory at start of scenario
+    """
+
+    latencies = []
+    queries = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests_count))
+
+    def worker():
+        session = requests.Session()
+        for i in counter:
+            method, path, kwargs = scenario.request()
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, **kwargs)
+            except requests.RequestException:
+                with lock:
+                    errors.append(None)
+                continue
+            latency = time.perf_counter() - started
+
+            match = SERVER_TIMING_QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+            with lock:
+                latencies.append(latency)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+                if match:
+                    queries.append(int(match.group(1)))
+
+    sampler = None
+    idle = idle_rss or (get_rss(server_pid) if server_pid else None)
+    if idle is not None:
+        sampler = MemorySampler(server_pid)
+        sampler.start()
+
+    threads = [threading.Thread(target=worker) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    peak = sampler.stop() if sampler else None
+
+    latencies.sort()
+    return OrderedDict((
+        ('requests', requests_count),
+        ('errors', len(errors)),
+        ('throughput', round(len(latencies) / elapsed, 1)),
+        ('p50_ms', round(percentile(latencies, 50) * 1000, 2) if latencies else None),
+        ('p95_ms', round(percentile(latencies, 95) * 1000, 2) if latencies else None),
+        ('p99_ms', round(percentile(latencies, 99) * 1000, 2) if latencies else None),
+        ('queries_per_request', round(sum(queries) / len(queries), 2) if queries else None),
+        ('rss_mb', round(peak / 2 ** 20, 1) if peak else None),
+        # memory added by load over idle server
+        ('kb_per_connection', round((peak - idle) / 1024 / concurrency, 1) if peak else None),
+    ))
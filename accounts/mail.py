@@ -0,0 +1,152 @@
+"""
+Outbox based mail delivery.
+
+Mails are stored in `OutboxEmail` table together with the data they
+notify about and are delivered by `send_outbox` management command
+in batches over one reused SMTP connection.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """ Store mail in outbox, it will be sent by outbox worker """
+
+    return OutboxEmail.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients='\n'.join(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    """ Exponential backoff for failed mail """
+
+    return timedelta(seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size, now):
+    """
+    Take ready mails for this worker. Rows are locked only while claimed,
+    claimed mails are not ready for other workers until OUTBOX_CLAIM_TIMEOUT
+    passes, so they are sent again if this worker dies
+    """
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update().filter(
+                status=OutboxEmail.STATUS_PENDING,
+                next_attempt_at__lte=now
+            ).order_by('id')[:batch_size]
+        )
+        OutboxEmail.objects.filter(id__in=[mail.id for mail in batch]).update(
+            next_attempt_at=now + timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+        )
+    return batch
+
+
+def open_connection(connection):
+    """ Open connection, returns error or None """
+
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning('Failed to open mail connection: %s', e)
+        return e
+    return None
+
+
+def send_batch(batch, connection):
+    """ Send mails over one connection, returns list of sent ids and list of (mail, error) """
+
+    sent_ids = []
+    failed = []
+
+    error = open_connection(connection)
+    if error is not None:
+        return sent_ids, [(mail, error) for mail in batch]
+
+    try:
+        for index, mail in enumerate(batch):
+            message = EmailMessage(
+                subject=mail.subject,
+                body=mail.message,
+                from_email=mail.from_email,
+                to=mail.recipient_list,
+                connection=connection
+            )
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                logger.warning('Failed to send mail %d: %s', mail.id, e)
+                failed.append((mail, e))
+                # connection may be broken, new one is opened for the rest of batch
+                connection.close()
+                error = open_connection(connection)
+                if error is not None:
+                    failed.extend((rest, error) for rest in batch[index + 1:])
+                    break
+            else:
+                sent_ids.append(mail.id)
+    finally:
+        connection.close()
+    return sent_ids, failed
+
+
+def send_outbox(batch_size=None, connection=None):
+    """
+    Send one batch of pending mails over single connection.
+    Returns tuple (sent, failed) with count of mails
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    connection = connection or get_connection()
+    now = timezone.now()
+
+    batch = claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    # SMTP is not waited for in transaction
+    sent_ids, failed = send_batch(batch, connection)
+
+    with transaction.atomic():
+        OutboxEmail.objects.filter(id__in=sent_ids).update(
+            status=OutboxEmail.STATUS_SENT,
+            attempts=F('attempts') + 1,
+            sent_at=timezone.now(),
+            last_error=''
+        )
+
+        for mail, error in failed:
+            mail.attempts += 1
+            mail.last_error = str(error)
+            if mail.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                mail.status = OutboxEmail.STATUS_FAILED
+            else:
+                mail.next_attempt_at = now + retry_delay(mail.attempts)
+            mail.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    return len(sent_ids), len(failed)
+
+
+def drain_outbox(batch_size=None, connection=None):
+    """ Send batches until there are no ready mails. Returns (sent, failed) """
+
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_outbox(batch_size=batch_size, connection=connection)
+        if not sent and not failed:
+            return total_sent, total_failed
+        total_sent += sent
+        total_failed += failed
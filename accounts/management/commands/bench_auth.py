@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.authentication import TokenAuthentication
+
+from accounts.api.authentication import CachedTokenAuthentication, get_stats
+from accounts.models import User
+from accounts.token_cache import invalidate_token
+
+
+class Command(BaseCommand):
+    help = 'Compare cached token authentication with stock TokenAuthentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=100, help='Count of distinct tokens used')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.select_related('auth_token').filter(is_active=True)[:options['users']])
+        if not users:
+            self.stderr.write('No active users, run seed_clients command first')
+            return
+
+        factory = RequestFactory()
+        requests = [
+            factory.get('/', HTTP_AUTHORIZATION='Token %s' % user.auth_token.key)
+            for user in users
+        ]
+
+        for user in users:
+            invalidate_token(user.auth_token.key)
+
+        for backend in (TokenAuthentication(), CachedTokenAuthentication()):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.time()
+                for i in range(options['requests']):
+                    backend.authenticate(requests[i % len(requests)])
+                elapsed = time.time() - start
+
+            self.stdout.write('%-26s %.1f auth/s, %d queries' % (
+                backend.__class__.__name__, options['requests'] / elapsed, len(queries)
+            ))
+
+        self.stdout.write('Cache stats: %s' % get_stats())
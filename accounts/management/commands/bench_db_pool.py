@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.utils import DatabaseError, load_backend
+
+from accounts.loadtest import percentile
+from finance_system.db.backends.postgresql_pool.base import get_pools_stats
+
+
+# (engine, CONN_MAX_AGE) of compared modes
+MODES = OrderedDict((
+    # connection per request
+    ('direct', ('django.db.backends.postgresql', 0)),
+    # connection per thread, as with conn_max_age=500
+    ('persistent', ('django.db.backends.postgresql', 500)),
+    ('pool', ('finance_system.db.backends.postgresql_pool', 0)),
+))
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare connection per request, persistent connections and pool on PostgreSQL: '
+        'throughput, latency, server connections and errors after connections are terminated'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=20, help='Concurrent requests')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per thread')
+        parser.add_argument('--pool-size', type=int, default=5)
+        parser.add_argument('--ping-interval', type=float, default=0,
+                            help='Seconds of idling after which pooled connection is checked')
+        parser.add_argument('--terminate', action='store_true',
+                            help='Terminate server connections in the middle of run, as restart does')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('PostgreSQL database is required, set DATABASE_URL')
+
+        for mode in MODES:
+            self.run(mode, options)
+
+    def make_wrapper(self, mode, options):
+        engine, max_age = MODES[mode]
+        settings_dict = dict(
+            connection.settings_dict, ENGINE=engine, CONN_MAX_AGE=max_age,
+            POOL={
+                'MAX_SIZE': options['pool_size'], 'TIMEOUT': 30,
+                'PRE_PING': True, 'PING_INTERVAL': options['ping_interval'],
+            },
+        )
+        return load_backend(engine).DatabaseWrapper(settings_dict, 'bench_%s' % mode)
+
+    def server_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()'
+            )
+            return cursor.fetchone()[0]
+
+    def terminate_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+                'WHERE datname = current_database() AND pid <> pg_backend_pid()'
+            )
+        # not counted as connection of benchmarked mode
+        connection.close()
+
+    def run(self, mode, options):
+        latencies = []
+        errors = []
+        peak = [0]
+        lock = threading.Lock()
+        done = threading.Event()
+        halfway = threading.Barrier(options['threads'] + 1)
+
+        def worker():
+            wrapper = self.make_wrapper(mode, options)
+            for i in range(options['requests']):
+                if i == options['requests'] // 2:
+                    halfway.wait()
+                started = time.perf_counter()
+                # request_started and request_finished do the same
+                wrapper.close_if_unusable_or_obsolete()
+                try:
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT id, email FROM accounts_user WHERE id = %s', [i + 1])
+                        cursor.fetchone()
+                except DatabaseError:
+                    with lock:
+                        errors.append(i)
+                finally:
+                    wrapper.close_if_unusable_or_obsolete()
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+            wrapper.close()
+
+        def monitor():
+            while not done.wait(0.05):
+                try:
+                    peak[0] = max(peak[0], self.server_connections())
+                except DatabaseError:
+                    # terminated too
+                    connection.close()
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for i in range(options['threads'])]
+        sampler = threading.Thread(target=monitor)
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        sampler.start()
+
+        halfway.wait()
+        if options['terminate']:
+            self.terminate_connections()
+
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        sampler.join()
+
+        latencies.sort()
+        self.stdout.write('%-11s %8.0f req/s  p50 %6.2f ms  p99 %6.2f ms  server connections %3d  errors %d' % (
+            mode, len(latencies) / elapsed, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+            peak[0], len(errors),
+        ))
+        if mode == 'pool':
+            self.stdout.write('pool stats: %s' % ', '.join(
+                '%s=%s' % item for item in get_pools_stats()[connection.settings_dict['NAME']].items()
+            ))
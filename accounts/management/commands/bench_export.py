@@ -0,0 +1,52 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from rest_framework.test import APIClient
+
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Measure throughput and peak memory of streaming clients export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='csv', choices=('csv', 'ndjson'))
+        parser.add_argument('--reports', type=int, default=5, help='Count of memory reports during export')
+
+    def handle(self, *args, **options):
+        manager = User.objects.select_related('auth_token').filter(is_manager=True, is_active=True).first()
+        if manager is None:
+            self.stderr.write('No active managers, run seed_clients command first')
+            return
+
+        total = User.objects.filter(is_manager=False, is_staff=False, is_superuser=False).count()
+        report_every = max(total // options['reports'], 1)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token %s' % manager.auth_token.key)
+
+        # test client checks ALLOWED_HOSTS
+        with override_settings(ALLOWED_HOSTS=['*']):
+            tracemalloc.start()
+            start = time.time()
+            response = client.get('/api/v0/manager/clients/export/', {'output': options['output']})
+
+            rows = size = 0
+            for chunk in response.streaming_content:
+                rows += 1
+                size += len(chunk)
+                if rows % report_every == 0:
+                    current, peak = tracemalloc.get_traced_memory()
+                    self.stdout.write('%10d rows, current %.1f KiB, peak %.1f KiB' % (
+                        rows, current / 1024, peak / 1024
+                    ))
+            elapsed = time.time() - start
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        self.stdout.write('Exported %d lines, %.1f MiB in %.2fs (%.0f rows/s), peak memory %.1f KiB' % (
+            rows, size / 1024 / 1024, elapsed, rows / elapsed, peak / 1024
+        ))
@@ -0,0 +1,77 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from accounts import ledger
+from accounts.models import User, LedgerEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure postings per second with concurrent writers. '
+        'Ledger is append-only, so run it against throwaway database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--batches', type=int, default=100, help='Batches per writer')
+        parser.add_argument('--batch-size', type=int, default=10)
+
+    def handle(self, *args, **options):
+        user_ids = self.get_users(options['users'])
+        errors = {'retries': 0}
+
+        def writer():
+            try:
+                for i in range(options['batches']):
+                    postings = [
+                        (random.choice(user_ids), random.choice(('10.00', '-5.00', '1.50')), 'Benchmark')
+                        for j in range(options['batch_size'])
+                    ]
+                    while True:
+                        try:
+                            ledger.post(postings, allow_overdraft=True)
+                            break
+                        except OperationalError:
+                            # SQLite allows one writer, "database is locked"
+                            errors['retries'] += 1
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for i in range(options['writers'])]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+
+        count = options['writers'] * options['batches'] * options['batch_size']
+        self.stdout.write('%d postings by %d writers in %.2fs: %.1f postings/s, %d retries' % (
+            count, options['writers'], elapsed, count / elapsed, errors['retries']
+        ))
+
+        balances = User.objects.filter(id__in=user_ids).aggregate(total=Sum('balance'))['total']
+        entries = LedgerEntry.objects.filter(user_id__in=user_ids).aggregate(total=Sum('amount'))['total']
+        if balances != entries:
+            self.stderr.write('Balances %s do not match ledger %s' % (balances, entries))
+
+    def get_users(self, count):
+        existing = User.objects.filter(email__startswith='ledger-bench-').count()
+        User.objects.bulk_create([
+            User(
+                first_name='Ledger',
+                last_name='Bench',
+                email='ledger-bench-%d@example.com' % i,
+                passport_number='LB%08d' % i
+            ) for i in range(existing, count)
+        ])
+        return list(
+            User.objects.filter(email__startswith='ledger-bench-').values_list('id', flat=True)[:count]
+        )
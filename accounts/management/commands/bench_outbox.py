@@ -0,0 +1,76 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+
+from accounts.mail import drain_outbox
+from accounts.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure outbox throughput against per-mail connections. '
+        'Run local debugging SMTP server first: '
+        'python -m smtpd -n -c DebuggingServer localhost:1025'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--smtp-host', default='localhost')
+        parser.add_argument('--smtp-port', type=int, default=1025)
+
+    def get_connection(self, options):
+        return get_connection(
+            'django.core.mail.backends.smtp.EmailBackend',
+            host=options['smtp_host'],
+            port=options['smtp_port'],
+            username='',
+            password='',
+            use_ssl=False,
+            use_tls=False
+        )
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        subject = 'Outbox benchmark'
+
+        # baseline: connection per mail, as plain send_mail does
+        start = time.time()
+        for i in range(count):
+            EmailMessage(
+                subject=subject,
+                body='Message %d' % i,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=['bench%d@example.com' % i],
+                connection=self.get_connection(options)
+            ).send()
+        self.report('send_mail', count, time.time() - start)
+
+        OutboxEmail.objects.bulk_create([
+            OutboxEmail(
+                subject=subject,
+                message='Message %d' % i,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipients='bench%d@example.com' % i
+            ) for i in range(count)
+        ])
+
+        start = time.time()
+        try:
+            sent, failed = drain_outbox(
+                batch_size=options['batch_size'],
+                connection=self.get_connection(options)
+            )
+        finally:
+            OutboxEmail.objects.filter(subject=subject).delete()
+        self.report('outbox', sent, time.time() - start)
+
+        if failed:
+            self.stderr.write('Failed mails: %d' % failed)
+
+    def report(self, name, count, elapsed):
+        self.stdout.write('%-10s %6d mails in %.2fs, %.1f mails/s' % (
+            name, count, elapsed, count / elapsed if elapsed else 0
+        ))
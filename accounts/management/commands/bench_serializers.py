@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+
+from accounts.api.encoders import RowEncoder
+from accounts.api.serializers import ClientForManagerSerializer, ClientProfileSerializer
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Compare rows per second of serializers and row encoders for read endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows in one page')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, label, rows, render):
+        renderer = JSONRenderer()
+        start = time.perf_counter()
+        for i in range(self.repeat):
+            content = renderer.render(render())
+        elapsed = time.perf_counter() - start
+        self.stdout.write('%-36s %10.0f rows/s' % (label, rows * self.repeat / elapsed))
+        return content
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        queryset = User.objects.filter(
+            is_manager=False, is_staff=False, is_superuser=False
+        ).order_by('id')[:options['rows']]
+        count = queryset.count()
+        if not count:
+            self.stderr.write('No clients, run seed_clients command first')
+            return
+
+        for serializer_class in (ClientForManagerSerializer, ClientProfileSerializer):
+            encoder = RowEncoder(serializer_class)
+            name = serializer_class.__name__
+            # fetching and rendering, as views do
+            expected = self.measure(
+                '%s (instances)' % name, count,
+                lambda: serializer_class(queryset.all(), many=True).data
+            )
+            content = self.measure(
+                'RowEncoder (values)', count,
+                lambda: encoder.encode_many(queryset.values(*encoder.columns))
+            )
+            if content != expected:
+                self.stderr.write('Rendered JSON differs')
+
+            instances = list(queryset)
+            # profile encodes already loaded user
+            self.measure(
+                '%s (loaded)' % name, count,
+                lambda: [serializer_class(instance).data for instance in instances]
+            )
+            self.measure(
+                'RowEncoder (loaded)', count,
+                lambda: [encoder.encode_instance(instance) for instance in instances]
+            )
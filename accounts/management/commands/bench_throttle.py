@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from rest_framework.request import Request
+from rest_framework.parsers import JSONParser
+from rest_framework.throttling import AnonRateThrottle
+
+from accounts.api.throttling import EmailRateThrottle, IPRateThrottle, reset_throttles
+
+
+class LoginView(object):
+    throttle_scope = 'login'
+
+
+class Command(BaseCommand):
+    help = 'Compare cost of throttling decisions of local buckets and cache-backed DRF throttle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+
+    def make_requests(self, count, shape):
+        factory = RequestFactory()
+        requests = []
+        for i in range(count):
+            if shape == 'one_ip':
+                # one address tries many accounts
+                addr, email = '10.0.0.1', 'user%d@seed.test' % i
+            else:
+                # many addresses try one account
+                addr, email = '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255), 'victim@seed.test'
+            request = Request(factory.post(
+                '/api/v0/login/', '{"email": "%s", "password": "x"}' % email,
+                content_type='application/json', REMOTE_ADDR=addr
+            ), parsers=[JSONParser()])
+            request.data
+            requests.append(request)
+        return requests
+
+    def measure(self, label, requests, throttle_classes):
+        view = LoginView()
+        allowed = 0
+        start = time.perf_counter()
+        for request in requests:
+            if all(throttle().allow_request(request, view) for throttle in throttle_classes):
+                allowed += 1
+        elapsed = time.perf_counter() - start
+        self.stdout.write('%-28s %8.2f us/request %8d allowed' % (
+            label, elapsed * 1e6 / len(requests), allowed
+        ))
+
+    def handle(self, *args, **options):
+        rates = {'anon': '60/min', 'login_ip': '60/min', 'login_email': '10/min'}
+        with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': rates}):
+            AnonRateThrottle.THROTTLE_RATES = rates
+            for shape in ('one_ip', 'one_email'):
+                self.stdout.write(shape)
+                requests = self.make_requests(options['requests'], shape)
+                reset_throttles()
+                self.measure('local (ip, email)', requests, [IPRateThrottle, EmailRateThrottle])
+                self.measure('DRF cache (anon)', requests, [AnonRateThrottle])
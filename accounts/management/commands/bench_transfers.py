@@ -0,0 +1,75 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.test import APIClient
+
+from accounts import ledger
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure batch transfer endpoint throughput for different batch sizes. '
+        'Ledger is append-only, so run it against throwaway database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,100,10000', help='Comma separated batch sizes')
+        parser.add_argument('--transfers', type=int, default=10000, help='Transfers for every batch size')
+        parser.add_argument('--users', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        manager, user_ids = self.get_users(options['users'])
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token %s' % manager.token)
+
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            batches = max(1, options['transfers'] // size)
+            payloads = []
+            for i in range(batches):
+                transfers = []
+                for j in range(size):
+                    from_id, to_id = random.sample(user_ids, 2)
+                    transfers.append({'from_account': from_id, 'to_account': to_id, 'amount': '1.00'})
+                payloads.append({'transfers': transfers})
+
+            start = time.time()
+            for payload in payloads:
+                response = client.post('/api/v0/manager/transfers/', payload, format='json')
+                if response.status_code != 200:
+                    self.stderr.write('Batch failed: %s' % response.content[:200])
+                    return
+            elapsed = time.time() - start
+
+            self.stdout.write('batch size %5d: %d requests, %.1f transfers/s' % (
+                size, batches, batches * size / elapsed
+            ))
+
+    def get_users(self, count):
+        manager = User.objects.filter(email='transfer-bench-manager@example.com').first()
+        if manager is None:
+            manager = User.objects.create(
+                first_name='Transfer',
+                last_name='Bench',
+                email='transfer-bench-manager@example.com',
+                passport_number='TBM',
+                is_manager=True
+            )
+
+        existing = User.objects.filter(email__startswith='transfer-bench-').exclude(id=manager.id).count()
+        User.objects.bulk_create([
+            User(
+                first_name='Transfer',
+                last_name='Bench',
+                email='transfer-bench-%d@example.com' % i,
+                passport_number='TB%08d' % i
+            ) for i in range(existing, count)
+        ])
+        user_ids = list(
+            User.objects.filter(email__startswith='transfer-bench-').exclude(id=manager.id).values_list('id', flat=True)
+        )
+        ledger.post([(user_id, '100000.00', 'Benchmark') for user_id in user_ids])
+        return manager, user_ids
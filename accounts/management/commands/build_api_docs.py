@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from finance_system.docs import build_page
+
+
+class Command(BaseCommand):
+    help = (
+        'Render API docs page and store it in cache. '
+        'Run it after deploy, page is rendered again only when URLconf, views or serializers change'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Render page even if it is in cache')
+
+    def handle(self, *args, **options):
+        content, fingerprint = build_page(force=options['force'])
+        self.stdout.write('Docs page %s: %d bytes' % (fingerprint, len(content)))
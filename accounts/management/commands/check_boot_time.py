@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+BOOT_SCRIPT = 'from finance_system.boot import main; main(%r)'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure import time of worker boot (application import and first request) in new processes, '
+        'report slowest modules and fail when boot exceeds WORKER_BOOT_BUDGET'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', default='finance_system.settings_api', help='Settings module of workers')
+        parser.add_argument('--budget', type=float, help='Seconds, WORKER_BOOT_BUDGET by default')
+        parser.add_argument('--runs', type=int, default=3, help='Boots to measure, fastest one is reported')
+        parser.add_argument('--top', type=int, default=15, help='Slowest modules and packages to report')
+        parser.add_argument('--path', default='/api/v0/login/', help='Path of first request')
+
+    def measure(self, profile, path):
+        process = subprocess.run(
+            [sys.executable, '-c', BOOT_SCRIPT % path],
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE=profile),
+            cwd=settings.BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        if process.returncode:
+            raise CommandError('Worker with %s failed to boot:\n%s' % (profile, process.stderr.decode()))
+        return json.loads(process.stdout.decode())
+
+    def handle(self, *args, **options):
+        budget = options['budget'] if options['budget'] is not None else settings.WORKER_BOOT_BUDGET
+        # first boot may compile .pyc files, others are affected by noise only
+        boot = min(
+            (self.measure(options['profile'], options['path']) for i in range(options['runs'])),
+            key=lambda boot: boot['total'],
+        )
+
+        self.stdout.write('%s: boot %.3f s (%s), %d modules imported, first request %s, budget %.3f s' % (
+            options['profile'], boot['total'],
+            ', '.join('%s %.3f s' % tuple(phase) for phase in boot['phases']),
+            len(boot['modules']), boot['status'], budget,
+        ))
+
+        self.stdout.write('\nslowest modules, self / cumulative ms:')
+        for name, own, cumulative in sorted(boot['modules'], key=lambda record: -record[1])[:options['top']]:
+            self.stdout.write('  %-50s %7.1f %7.1f' % (name, own * 1000, cumulative * 1000))
+
+        packages = Counter()
+        for name, own, cumulative in boot['modules']:
+            packages[name.split('.')[0]] += own
+        self.stdout.write('\nslowest packages, ms:')
+        for name, own in packages.most_common(options['top']):
+            self.stdout.write('  %-50s %7.1f' % (name, own * 1000))
+
+        if boot['total'] > budget:
+            raise CommandError('Worker boot took %.3f s, budget is %.3f s' % (boot['total'], budget))
@@ -0,0 +1,49 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importing import IMPORT_CHUNK_SIZE, import_clients, read_csv, read_json
+
+
+class Command(BaseCommand):
+    help = (
+        'Import clients from CSV with header or JSON list of objects with fields: '
+        'email, first_name, last_name, passport_number. Nothing is imported if any row is invalid'
+    )
+
+    readers = {
+        'csv': read_csv,
+        'json': read_json,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(self.readers), help='By default is taken from file extension')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--max-errors', type=int, default=20, help='Count of reported invalid rows')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if file_format not in self.readers:
+            raise CommandError('Unknown format, use --format')
+
+        start = time.time()
+        try:
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                rows = self.readers[file_format](stream)
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError('Can not read %s: %s' % (options['path'], e))
+
+        created, errors = import_clients(rows, chunk_size=options['chunk_size'])
+
+        if errors:
+            for error in errors[:options['max_errors']]:
+                if error['row'] is None:
+                    # not error of some row, e.g. clients were changed concurrently
+                    self.stderr.write('%s' % error['errors'])
+                else:
+                    self.stderr.write('Row %d: %s' % (error['row'], error['errors']))
+            raise CommandError('Nothing is imported, errors: %d' % len(errors))
+
+        self.stdout.write('Imported clients: %d in %.1fs' % (created, time.time() - start))
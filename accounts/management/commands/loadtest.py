@@ -0,0 +1,173 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+import requests
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.loadtest import SCENARIOS, get_rss, run_scenario
+from accounts.models import User
+
+
+# deployments compared by --compare, (application, gunicorn worker class)
+SERVERS = OrderedDict((
+    ('wsgi', ('finance_system.wsgi', 'sync')),
+    ('asgi', ('finance_system.asgi:application', 'uvicorn.workers.UvicornWorker')),
+))
+
+
+class Command(BaseCommand):
+    help = (
+        'Run load test of /api/v0/ endpoints against local gunicorn and '
+        'report throughput, latency percentiles and queries per request. '
+        'Seed users first with seed_clients command'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help='Comma separated scenarios: %s' % ', '.join(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--url', help='Use running server instead of starting gunicorn')
+        parser.add_argument('--bind', default='127.0.0.1:8765')
+        parser.add_argument('--workers', type=int, default=4, help='Gunicorn workers')
+        parser.add_argument('--worker-class', default='sync', help='Gunicorn worker class')
+        parser.add_argument('--app', default='finance_system.wsgi', help='Application served by gunicorn')
+        parser.add_argument('--compare', action='store_true',
+                            help='Run scenarios against %s deployments' % ' and '.join(SERVERS))
+        parser.add_argument('--sample', type=int, default=1000, help='Seeded clients used in requests')
+        parser.add_argument('--server-log', default=os.devnull, help='File for gunicorn output')
+        parser.add_argument('--output', help='Write JSON results to file')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'].split(',')
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError('Unknown scenarios: %s' % ', '.join(sorted(unknown)))
+
+        if options['compare'] and options['url']:
+            raise CommandError('--compare starts servers, it can not be used with --url')
+
+        clients, managers = self.get_users(options['sample'])
+
+        if options['compare']:
+            results = OrderedDict()
+            for label, (app, worker_class) in SERVERS.items():
+                self.stdout.write(label)
+                results[label] = self.run(dict(options, app=app, worker_class=worker_class),
+                                          scenarios, clients, managers)
+            self.write_comparison(scenarios, results)
+        else:
+            results = self.run(options, scenarios, clients, managers)
+
+        if options['output']:
+            report = OrderedDict((
+                ('commit', self.get_commit()),
+                ('created_at', timezone.now().isoformat()),
+                ('config', OrderedDict(
+                    (key, options[key]) for key in ('requests', 'concurrency', 'workers', 'worker_class', 'app')
+                )),
+                ('clients', User.objects.filter(is_manager=False).count()),
+                ('results', results),
+            ))
+            if options['compare']:
+                report['config'].update(servers=SERVERS)
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+    def run(self, options, scenarios, clients, managers):
+        server = None
+        idle_rss = None
+        base_url = options['url']
+        if not base_url:
+            server = self.start_server(options)
+            base_url = 'http://%s' % options['bind']
+            # workers import views and fill caches on first requests,
+            # memory after that is not used by connections
+            for name in scenarios:
+                scenario = SCENARIOS[name](clients, managers)
+                run_scenario(scenario, base_url, options['concurrency'] * 4, options['concurrency'])
+            idle_rss = get_rss(server.pid)
+
+        results = OrderedDict()
+        try:
+            for name in scenarios:
+                scenario = SCENARIOS[name](clients, managers)
+                results[name] = run_scenario(
+                    scenario, base_url, options['requests'], options['concurrency'],
+                    server_pid=server and server.pid, idle_rss=idle_rss
+                )
+                self.stdout.write('%-15s %s' % (name, ', '.join('%s=%s' % item for item in results[name].items())))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        return results
+
+    def write_comparison(self, scenarios, results):
+        labels = list(results)
+        self.stdout.write('%-15s %s' % ('', ' '.join(
+            '%14s' % ('%s %s' % (label, column)) for column in ('req/s', 'KB/conn') for label in labels
+        )))
+        for name in scenarios:
+            self.stdout.write('%-15s %s' % (name, ' '.join(
+                '%14s' % results[label][name][key] for key in ('throughput', 'kb_per_connection') for label in labels
+            )))
+
+    def get_users(self, sample):
+        clients = list(
+            User.objects.filter(
+                email__endswith='@seed.test',
+                is_manager=False,
+                is_active=True
+            ).order_by('id').values(
+                'id', 'email', 'first_name', 'last_name', 'passport_number', 'auth_token__key'
+            )[:sample]
+        )
+        for client in clients:
+            client['token'] = client.pop('auth_token__key')
+
+        managers = list(
+            User.objects.filter(email__endswith='@seed.test', is_manager=True).values_list('auth_token__key', flat=True)
+        )
+        if not clients or not managers:
+            raise CommandError('No seeded users, run seed_clients command first')
+        return clients, managers
+
+    def start_server(self, options):
+        # load comes from one address, throttling would refuse most requests
+        env = dict(os.environ, REQUEST_INSTRUMENTATION='on', THROTTLING='off')
+        log = open(options['server_log'], 'a')
+        server = subprocess.Popen([
+            # gunicorn 19 can not be run with -m
+            sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()', options['app'],
+            '--bind', options['bind'],
+            '--workers', str(options['workers']),
+            '--worker-class', options['worker_class'],
+        ], env=env, cwd=settings.BASE_DIR, stdout=log, stderr=log)
+        log.close()
+
+        # wait until server accepts connections, first request loads application
+        for i in range(100):
+            try:
+                requests.get('http://%s/api/v0/login/' % options['bind'], timeout=10)
+                return server
+            except requests.RequestException:
+                time.sleep(0.1)
+
+        server.terminate()
+        raise CommandError('Gunicorn did not start')
+
+    def get_commit(self):
+        try:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL
+            ).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from accounts.profiling import can_profile, make_header
+
+
+class Command(BaseCommand):
+    help = 'Print X-Profile header which makes requests of superuser or manager profiled (see accounts.profiling)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options['email'])
+        except User.DoesNotExist:
+            raise CommandError('User %s does not exist' % options['email'])
+        if not can_profile(user):
+            raise CommandError('User %s is not active superuser or manager' % user.email)
+
+        self.stdout.write('X-Profile: %s' % make_header(user))
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+
+from accounts.ledger import reconcile_range
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Check users balances against ledger checkpoints and save new checkpoints. '
+        'Run it periodically, every run reads only entries after previous checkpoints'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Users checked by one query')
+        parser.add_argument('--workers', type=int, default=4, help='Chunks checked in parallel')
+        parser.add_argument('--no-checkpoint', action='store_false', dest='checkpoint',
+                            help='Only check balances, do not save checkpoints')
+
+    def handle(self, *args, **options):
+        ids = User.objects.aggregate(min=Min('id'), max=Max('id'))
+        if ids['min'] is None:
+            return
+
+        chunk_size = options['chunk_size']
+        ranges = [(start, start + chunk_size) for start in range(ids['min'], ids['max'] + 1, chunk_size)]
+
+        def reconcile(range_):
+            return reconcile_range(range_[0], range_[1], checkpoint=options['checkpoint'])
+
+        def reconcile_in_thread(range_):
+            try:
+                return reconcile(range_)
+            finally:
+                # every thread opens own connection
+                connection.close()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                results = list(executor.map(reconcile_in_thread, ranges))
+        else:
+            results = map(reconcile, ranges)
+
+        checked = 0
+        mismatches = []
+        for count, chunk_mismatches in results:
+            checked += count
+            mismatches.extend(chunk_mismatches)
+
+        self.stdout.write('Checked users: %d' % checked)
+        if mismatches:
+            raise CommandError('Balance mismatch for users: %s' % ', '.join(str(i) for i in sorted(mismatches)))
@@ -0,0 +1,65 @@
+import binascii
+import os
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rest_framework.authtoken.models import Token
+
+from accounts.loadtest import SEED_EMAIL, SEED_PIN
+from accounts.models import User
+from accounts.search import SEARCH_FIELDS, create_tokens
+from accounts.utils import bulk_create
+
+
+class Command(BaseCommand):
+    help = (
+        'Create clients and managers with tokens for benchmarks using bulk inserts. '
+        'All seeded users have PIN %s' % SEED_PIN
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10000)
+        parser.add_argument('--managers', type=int, default=10)
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        # hashing once, seeded users share the same PIN
+        password = make_password(SEED_PIN)
+
+        start = time.time()
+        for kind, count, is_manager in (
+            ('manager', options['managers'], True),
+            ('client', options['clients'], False),
+        ):
+            existing = User.objects.filter(email__startswith=kind, email__endswith='@seed.test').count()
+            for chunk_start in range(existing, count, options['chunk_size']):
+                chunk = range(chunk_start, min(count, chunk_start + options['chunk_size']))
+                self.create_users(kind, chunk, is_manager, password)
+            self.stdout.write('%ss: %d' % (kind.capitalize(), max(existing, count)))
+
+        self.stdout.write('Seeded in %.1fs' % (time.time() - start))
+
+    @transaction.atomic
+    def create_users(self, kind, numbers, is_manager, password):
+        emails = [SEED_EMAIL % (kind, number) for number in numbers]
+        bulk_create(User, [
+            User(
+                first_name=kind.capitalize(),
+                last_name=str(number),
+                email=email,
+                passport_number='%s%d' % (kind[0].upper(), number),
+                password=password,
+                is_manager=is_manager,
+                is_closed=not is_manager and number % 10 == 0,
+            ) for number, email in zip(numbers, emails)
+        ])
+
+        # bulk_create does not return ids on SQLite, post_save is not sent
+        users = list(User.objects.filter(email__in=emails).only('id', *SEARCH_FIELDS))
+        bulk_create(Token, [
+            Token(key=binascii.hexlify(os.urandom(20)).decode(), user_id=user.id) for user in users
+        ])
+        create_tokens(users)
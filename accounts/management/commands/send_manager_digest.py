@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.notifications import send_manager_digest
+
+
+class Command(BaseCommand):
+    help = (
+        'Queue digest mail about new clients to every manager. '
+        'Run it periodically when MANAGER_NOTIFICATIONS_DIGEST is enabled'
+    )
+
+    def handle(self, *args, **options):
+        count = send_manager_digest()
+        self.stdout.write('Clients in digest: %d' % count)
@@ -0,0 +1,159 @@
+import cProfile
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from finance_system import instrumentation
+
+from . import profiling
+
+
+logger = logging.getLogger('accounts.instrumentation')
+
+# literals are replaced to find repeated queries which differ only by parameters
+SQL_LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def normalize_sql(sql):
+    return SQL_LITERALS_RE.sub('?', sql)
+
+
+class RequestInstrumentationMiddleware(object):
+    """
+    Measure DB time, queries count, permissions and serializers time of request.
+    Timings are sent in Server-Timing header and logged as JSON line.
+    Queries over per-view budget and repeated queries (N+1) are logged as warnings.
+    Middleware is removed on start when REQUEST_INSTRUMENTATION['ENABLED'] is off
+    """
+
+    def __init__(self, get_response):
+        self.config = settings.REQUEST_INSTRUMENTATION
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        request.instrumented_view = view.__name__
+
+    def __call__(self, request):
+        debug_cursors = {}
+        queries_start = {}
+        for connection in connections.all():
+            debug_cursors[connection.alias] = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+            if len(connection.queries_log) == connection.queries_log.maxlen:
+                connection.queries_log.clear()
+            queries_start[connection.alias] = len(connection.queries_log)
+
+        timings = instrumentation.start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            instrumentation.stop()
+
+            queries = []
+            for connection in connections.all():
+                connection.force_debug_cursor = debug_cursors.get(connection.alias, False)
+                queries.extend(list(connection.queries_log)[queries_start.get(connection.alias, 0):])
+
+        self.report(request, response, timings, queries, total)
+        return response
+
+    def report(self, request, response, timings, queries, total):
+        view = getattr(request, 'instrumented_view', None)
+        db_time = sum(float(query['time']) for query in queries)
+
+        metrics = [('db', db_time, '%d queries' % len(queries))]
+        metrics.extend((name, value, None) for name, value in timings.items())
+        metrics.append(('total', total, None))
+
+        response['Server-Timing'] = ', '.join(
+            '%s;dur=%.2f' % (name, value * 1000) + (';desc="%s"' % desc if desc else '')
+            for name, value, desc in metrics
+        )
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': len(queries),
+        }
+        record.update(('%s_ms' % name, round(value * 1000, 2)) for name, value, desc in metrics)
+
+        warnings = []
+        budget = self.config['QUERY_BUDGETS'].get(view, self.config['DEFAULT_QUERY_BUDGET'])
+        if len(queries) > budget:
+            warnings.append('query budget %d exceeded' % budget)
+
+        repeated = Counter(normalize_sql(query['sql']) for query in queries).most_common(1)
+        if repeated and repeated[0][1] >= self.config['REPEATED_QUERY_THRESHOLD']:
+            warnings.append('possible N+1, query repeated %d times: %s' % (repeated[0][1], repeated[0][0]))
+
+        if warnings:
+            record['warnings'] = warnings
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+
+class RequestProfilingMiddleware(object):
+    """
+    Run request with X-Profile header signed for superuser or manager under
+    cProfile, stats are kept when request was authenticated as that user (see
+    accounts.profiling). Requests without header are passed as is, middleware
+    is removed on start when REQUEST_PROFILING['ENABLED'] is off
+    """
+
+    def __init__(self, get_response):
+        self.config = settings.REQUEST_PROFILING
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.store = profiling.get_store()
+
+    def __call__(self, request):
+        header = request.META.get('HTTP_X_PROFILE')
+        if header is None:
+            return self.get_response(request)
+
+        user_id = profiling.load_header(header)
+        if user_id is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        total = time.perf_counter() - started
+
+        # DRF views set user of request after authentication
+        user = getattr(request, 'user', None)
+        if user is None or user.pk != user_id or not profiling.can_profile(user):
+            return response
+
+        profiler.create_stats()
+        view = getattr(request, 'resolver_match', None)
+        response['X-Profile-Id'] = self.store.save(
+            profiler.stats,
+            method=request.method,
+            # query string may contain personal data
+            path=request.path,
+            view=view.func.__name__ if view else None,
+            status=response.status_code,
+            user=user.email,
+            total_ms=round(total * 1000, 2),
+        )
+        return response
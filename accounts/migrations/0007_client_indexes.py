@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Indexes for queries of client list and client detail endpoints, all of them
+# filter is_manager=False, is_staff=False, is_superuser=False.
+# PostgreSQL gets partial indexes over client rows only. SQLite can not use partial
+# index when condition is bound parameter, so other databases get indexes with
+# these flags as leading columns.
+CLIENT_INDEXES = (
+    # filters is_active, is_closed and count
+    ('accounts_user_client_status', 'is_active, is_closed, id'),
+    # default ordering by email
+    ('accounts_user_client_email', 'email'),
+    # cursor pagination
+    ('accounts_user_client_joined', 'date_joined, id'),
+)
+
+CLIENT_CONDITION = 'NOT is_manager AND NOT is_staff AND NOT is_superuser'
+
+
+def create_indexes(apps, schema_editor):
+    for name, columns in CLIENT_INDEXES:
+        if schema_editor.connection.vendor == 'postgresql':
+            sql = 'CREATE INDEX %s ON accounts_user (%s) WHERE %s' % (name, columns, CLIENT_CONDITION)
+        else:
+            sql = 'CREATE INDEX %s ON accounts_user (is_manager, is_staff, is_superuser, %s)' % (name, columns)
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    for name, columns in CLIENT_INDEXES:
+        schema_editor.execute('DROP INDEX %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_user_date_joined_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='user',
+            index_together=set([]),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 14:40
+from __future__ import unicode_literals
+
+from importlib import import_module
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+client_indexes = import_module('accounts.migrations.0007_client_indexes')
+
+
+# SQLite adds and removes column by rebuilding the table,
+# indexes created with raw SQL in 0007 are lost and created again
+def create_sqlite_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        client_indexes.create_indexes(apps, schema_editor)
+
+
+def drop_sqlite_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        client_indexes.drop_indexes(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_client_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, create_sqlite_indexes),
+        migrations.AddField(
+            model_name='user',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Modified at'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(create_sqlite_indexes, drop_sqlite_indexes),
+    ]
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 14:36
+from __future__ import unicode_literals
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# PostgreSQL: LIKE 'term%' needs pattern ops index in non C locale,
+# similarity of names is served by trigram index
+POSTGRESQL_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX accounts_clientsearchtoken_prefix ON accounts_clientsearchtoken (token varchar_pattern_ops)',
+    'CREATE INDEX accounts_clientsearchtoken_trgm ON accounts_clientsearchtoken USING gin (token gin_trgm_ops)',
+)
+
+FILL_CHUNK_SIZE = 2000
+INSERT_BATCH_SIZE = 1000
+
+# copy of tokenizer of accounts.search at time of migration,
+# later changes of it must not change this migration
+SEARCH_FIELDS = ('first_name', 'last_name', 'email', 'passport_number')
+TOKEN_MAX_LENGTH = 64
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(value):
+    value = unicodedata.normalize('NFKD', value)
+    return ''.join(char for char in value if not unicodedata.combining(char)).lower()
+
+
+def get_tokens(user):
+    tokens = set()
+    for field in ('first_name', 'last_name'):
+        tokens.update(WORD_RE.findall(normalize(getattr(user, field))))
+
+    email = normalize(user.email)
+    tokens.add(email)
+    tokens.update(WORD_RE.findall(email.split('@')[0]))
+
+    tokens.add(''.join(normalize(user.passport_number).split()))
+    return {token[:TOKEN_MAX_LENGTH] for token in tokens if token}
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRESQL_INDEXES:
+            schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX accounts_clientsearchtoken_prefix')
+        schema_editor.execute('DROP INDEX accounts_clientsearchtoken_trgm')
+
+
+def fill_tokens(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    ClientSearchToken = apps.get_model('accounts', 'ClientSearchToken')
+    alias = schema_editor.connection.alias
+    # SQLite limits rows in one INSERT
+    batch_size = min(INSERT_BATCH_SIZE, schema_editor.connection.ops.bulk_batch_size(['user_id', 'token'], []) or INSERT_BATCH_SIZE)
+
+    last_id = 0
+    while True:
+        users = list(User.objects.using(alias).filter(id__gt=last_id).order_by('id').only('id', *SEARCH_FIELDS)[:FILL_CHUNK_SIZE])
+        if not users:
+            return
+        ClientSearchToken.objects.using(alias).bulk_create([
+            ClientSearchToken(user_id=user.id, token=token) for user in users for token in sorted(get_tokens(user))
+        ], batch_size=batch_size)
+        last_id = users[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_user_modified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientSearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, verbose_name='Token')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='clientsearchtoken',
+            index_together=set([('token', 'user')]),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+        migrations.RunPython(fill_tokens, migrations.RunPython.noop),
+    ]
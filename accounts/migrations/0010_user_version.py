@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 16:05
+from __future__ import unicode_literals
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+user_modified_at = import_module('accounts.migrations.0008_user_modified_at')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_clientsearchtoken'),
+    ]
+
+    operations = [
+        # SQLite rebuilds table, see 0008
+        migrations.RunPython(migrations.RunPython.noop, user_modified_at.create_sqlite_indexes),
+        migrations.AddField(
+            model_name='user',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Version'),
+        ),
+        migrations.RunPython(user_modified_at.create_sqlite_indexes, user_modified_at.drop_sqlite_indexes),
+    ]
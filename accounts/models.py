@@ -1,9 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.dispatch import receiver
-from django.db.models.signals import post_save
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db.models.signals import post_save, post_delete
 
 from rest_framework.authtoken.models import Token
 
@@ -15,6 +14,14 @@ class User(AbstractEmailUser):
     """
     Model to represent user in system
     """
+    # fields which values are remembered on load to find out what was changed,
+    # save() of loaded user writes changed ones only
+    TRACKED_FIELDS = ('email', 'first_name', 'last_name', 'passport_number', 'password',
+                      'is_active', 'is_closed', 'is_manager', 'is_staff', 'is_superuser',
+                      'last_login', 'date_joined')
+    # fields written by save() itself, other fields are checked to be unchanged
+    SAVE_FIELDS = ('id', 'modified_at', 'version')
+
     first_name = models.CharField(_('First name'), max_length=30)
     last_name = models.CharField(_('Last name'), max_length=30)
     is_manager = models.BooleanField(_('Is manager ?'), default=False)
@@ -33,10 +40,86 @@ class User(AbstractEmailUser):
     )
 
     email = models.EmailField(_('Email'), unique=True)
+    modified_at = models.DateTimeField(_('Modified at'), auto_now=True)
+    # incremented by every save() of changes and by bulk updates of clients,
+    # balance changes of ledger do not change it
+    version = models.PositiveIntegerField(_('Version'), default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked_values()
+        return instance
+
+    @classmethod
+    def untracked_fields(cls):
+        """ Fields which save() of loaded user does not write, e.g. balance """
+
+        return tuple(
+            field.attname for field in cls._meta.concrete_fields
+            if field.attname not in cls.TRACKED_FIELDS and field.attname not in cls.SAVE_FIELDS
+        )
+
+    def _remember_tracked_values(self):
+        # deferred fields are absent in __dict__ and never reported as changed
+        self._loaded_values = {
+            field: self.__dict__[field] for field in self.TRACKED_FIELDS + self.untracked_fields()
+            if field in self.__dict__
+        }
+
+    def changed_fields(self, fields=TRACKED_FIELDS):
+        """ Return set of fields changed since load, for new instance all fields """
+
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return set(fields)
+        return {field for field in fields if field in loaded and loaded[field] != getattr(self, field)}
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        """
+        Save of loaded user writes changed fields only, balance is changed by ledger.
+        Row is updated only if its version is the loaded one, ConcurrentUpdate is
+        raised otherwise. Change of field out of TRACKED_FIELDS would be lost,
+        so it raises ValueError. With update_fields given fields are written as is
+        """
+        expected_version = None
+        if update_fields is None and not force_insert and getattr(self, '_loaded_values', None) is not None:
+            untracked = self.changed_fields(self.untracked_fields())
+            if untracked:
+                raise ValueError('Changes of %s are not saved by save(), use ledger or update_fields'
+                                 % ', '.join(sorted(untracked)))
+            update_fields = self.changed_fields()
+            if update_fields:
+                update_fields |= {'version', 'modified_at'}
+                expected_version = self.version
+                self.version += 1
+
+        self._expected_version = expected_version
+        try:
+            super().save(force_insert, force_update, using, update_fields)
+        except Exception:
+            if expected_version is not None:
+                self.version = expected_version
+            raise
+        finally:
+            self._expected_version = None
+        # post_save receivers already compared old values, start tracking from saved state
+        self._remember_tracked_values()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_version = getattr(self, '_expected_version', None)
+        if expected_version is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
+        if not super()._do_update(base_qs.filter(version=expected_version), using, pk_val, values,
+                                  update_fields, forced_update):
+            raise ConcurrentUpdate('User %s was changed or deleted after it was loaded' % pk_val)
+        return True
 
     @property
     def token(self):
-        return Token.objects.get(user=self)
+        # reverse relation is cached, so token is fetched once per instance
+        return self.auth_token
 
     @property
     def get_full_name(self):
@@ -47,36 +130,197 @@ class User(AbstractEmailUser):
         return not self.is_manager and not self.is_staff and not self.is_superuser
 
 
+class ConcurrentUpdate(Exception):
+    pass
+
+
+class OutboxEmail(models.Model):
+    """
+    Model to represent email waiting for delivery.
+    Rows are written in the same transaction as the object
+    they notify about and are sent later by `send_outbox` command
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_SENT, _('Sent')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    subject = models.CharField(_('Subject'), max_length=255)
+    message = models.TextField(_('Message'))
+    from_email = models.CharField(_('From email'), max_length=254)
+    recipients = models.TextField(_('Recipients'), help_text=_('One email per line'))
+    status = models.CharField(_('Status'), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(_('Attempts'), default=0)
+    last_error = models.TextField(_('Last error'), blank=True)
+    created_at = models.DateTimeField(_('Created at'), default=timezone.now)
+    next_attempt_at = models.DateTimeField(_('Next attempt at'), default=timezone.now)
+    sent_at = models.DateTimeField(_('Sent at'), null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        index_together = [('status', 'next_attempt_at')]
+
+    def __str__(self):
+        return '%s (%s)' % (self.subject, self.status)
+
+    @property
+    def recipient_list(self):
+        return self.recipients.split('\n')
+
+
+class LedgerError(Exception):
+    pass
+
+
+class LedgerQuerySet(models.QuerySet):
+    """ Ledger entries can be only added """
+
+    def update(self, **kwargs):
+        raise LedgerError('Ledger entries can not be changed')
+
+    def delete(self):
+        raise LedgerError('Ledger entries can not be deleted')
+
+
+class LedgerEntry(models.Model):
+    """
+    Model to represent change of user balance.
+    Entries are append-only, use accounts.ledger to create them
+    """
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='ledger_entries')
+    amount = models.DecimalField(
+        _('Amount'),
+        max_digits=10,
+        decimal_places=2,
+        help_text=_('Positive for credit, negative for debit')
+    )
+    balance_after = models.DecimalField(_('Balance after'), max_digits=10, decimal_places=2)
+    description = models.CharField(_('Description'), max_length=255, blank=True)
+    created_at = models.DateTimeField(_('Created at'), default=timezone.now)
+
+    objects = LedgerQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = _('Ledger entries')
+        index_together = [('user', 'id'), ('user', 'created_at')]
+
+    def __str__(self):
+        return '%s %s' % (self.user_id, self.amount)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise LedgerError('Ledger entries can not be changed')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise LedgerError('Ledger entries can not be deleted')
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Model to represent user balance after some ledger entry.
+    Balance at any time is latest checkpoint plus entries after it
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    entry = models.ForeignKey(LedgerEntry, on_delete=models.PROTECT, related_name='+')
+    balance = models.DecimalField(_('Balance'), max_digits=10, decimal_places=2)
+    as_of = models.DateTimeField(_('As of'), help_text=_('Creation time of entry'))
+    created_at = models.DateTimeField(_('Created at'), default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        index_together = [('user', 'id'), ('user', 'as_of')]
+
+    def __str__(self):
+        return '%s %s' % (self.user_id, self.balance)
+
+
+class ClientRegistrationNotice(models.Model):
+    """
+    Model to represent registration of client waiting for managers digest
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(_('Created at'), default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+
+
+class ClientSearchToken(models.Model):
+    """
+    Model to represent normalized word of user name, email or passport number,
+    used by search of clients (see accounts.search)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(_('Token'), max_length=64)
+
+    class Meta:
+        index_together = [('token', 'user')]
+
+
 @receiver(post_save, sender=User)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
+        # avoid circular import, notifications module works with models
+        from .notifications import notify_client_registered
+
         # creating Token for user (CustomUser model)
         Token.objects.create(user=instance)
 
-        # sending mails to managers
         if instance.is_client:
-            all_managers = User.objects.filter(is_manager=True)
-
-            if all_managers:
-                managers_emails = [manager.email for manager in all_managers]
-                subject = 'Created New User with id: %d' % (instance.id)
-                message = 'Was created new user: %s with id %d' % (instance.get_full_name, instance.id)
-                send_mail(
-                    subject=subject,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=managers_emails,
-                    message=message
-                )
-
-
-            # sending mail to client
-
-            message = 'Dear %s, Thank You for registration in our service, in the nearest future' \
-                      'we activate your account and You can work with us' % (instance.get_full_name)
-
-            send_mail(
-                subject='Thank You for registration',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[instance.email, ],
-                message=message
-            )
+            notify_client_registered(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_manager_emails_on_save(sender, instance=None, created=False, **kwargs):
+    from .notifications import MANAGER_FIELDS, invalidate_manager_emails
+
+    if created:
+        changed = instance.is_manager
+    else:
+        changed_fields = instance.changed_fields(MANAGER_FIELDS)
+        changed = changed_fields and (instance.is_manager or 'is_manager' in changed_fields)
+
+    if changed:
+        # concurrent reader would cache old managers before commit
+        transaction.on_commit(invalidate_manager_emails)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_manager_emails_on_delete(sender, instance=None, **kwargs):
+    from .notifications import invalidate_manager_emails
+
+    if instance.is_manager:
+        transaction.on_commit(invalidate_manager_emails)
+
+
+@receiver(post_save, sender=User)
+def invalidate_auth_cache_on_save(sender, instance=None, created=False, **kwargs):
+    from .token_cache import invalidate_user
+
+    # new user has no cached token yet
+    if not created and instance.changed_fields():
+        invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_auth_cache_on_token_delete(sender, instance=None, **kwargs):
+    from .token_cache import invalidate_token
+
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def update_search_tokens_on_save(sender, instance=None, created=False, **kwargs):
+    from .search import SEARCH_FIELDS, create_tokens, update_tokens
+
+    if created:
+        create_tokens([instance])
+    elif instance.changed_fields(SEARCH_FIELDS):
+        update_tokens([instance])
@@ -0,0 +1,138 @@
+"""
+Notifications about client registration.
+
+Managers emails are kept in cache, it is invalidated by signals in
+accounts.models when manager is added, removed or changes email.
+With `MANAGER_NOTIFICATIONS_DIGEST` enabled managers get one periodic
+mail with all new clients (see `send_manager_digest` command)
+instead of mail per registration.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .mail import queue_mail
+from .models import User, ClientRegistrationNotice, OutboxEmail
+from .utils import bulk_create
+
+
+MANAGER_EMAILS_CACHE_KEY = 'accounts:manager-emails'
+
+# changes of this fields may change managers recipient list
+MANAGER_FIELDS = ('is_manager', 'email', 'is_active')
+
+WELCOME_SUBJECT = 'Thank You for registration'
+
+
+def welcome_message(user):
+    return 'Dear %s, Thank You for registration in our service, in the nearest future' \
+           'we activate your account and You can work with us' % (user.get_full_name)
+
+
+def get_manager_emails():
+    """ Return list of active managers emails, cached """
+
+    emails = cache.get(MANAGER_EMAILS_CACHE_KEY)
+    if emails is None:
+        emails = list(
+            User.objects.filter(is_manager=True, is_active=True).order_by('id').values_list('email', flat=True)
+        )
+        cache.set(MANAGER_EMAILS_CACHE_KEY, emails, settings.MANAGER_EMAILS_CACHE_TIMEOUT)
+    return emails
+
+
+def invalidate_manager_emails():
+    cache.delete(MANAGER_EMAILS_CACHE_KEY)
+
+
+def notify_client_registered(user):
+    """ Queue mails about new client to managers and to client """
+
+    if settings.MANAGER_NOTIFICATIONS_DIGEST:
+        ClientRegistrationNotice.objects.create(user=user)
+    else:
+        managers_emails = get_manager_emails()
+
+        if managers_emails:
+            subject = 'Created New User with id: %d' % (user.id)
+            message = 'Was created new user: %s with id %d' % (user.get_full_name, user.id)
+            queue_mail(
+                subject=subject,
+                recipient_list=managers_emails,
+                message=message
+            )
+
+    queue_mail(
+        subject=WELCOME_SUBJECT,
+        recipient_list=[user.email, ],
+        message=welcome_message(user)
+    )
+
+
+def notify_clients_imported(users):
+    """ Queue mails about imported clients with bulk inserts, one mail to managers for all clients """
+
+    now = timezone.now()
+    if settings.MANAGER_NOTIFICATIONS_DIGEST:
+        bulk_create(ClientRegistrationNotice, [
+            ClientRegistrationNotice(user=user, created_at=now) for user in users
+        ])
+    else:
+        managers_emails = get_manager_emails()
+
+        if managers_emails and users:
+            queue_mail(
+                subject='Imported %d New Users' % len(users),
+                recipient_list=managers_emails,
+                message='Were imported new users:\n%s' % '\n'.join(
+                    '%s with id %d' % (user.get_full_name, user.id) for user in users
+                )
+            )
+
+    bulk_create(OutboxEmail, [
+        OutboxEmail(
+            subject=WELCOME_SUBJECT,
+            message=welcome_message(user),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipients=user.email,
+            created_at=now,
+            next_attempt_at=now
+        ) for user in users
+    ])
+
+
+def send_manager_digest():
+    """
+    Queue one mail per manager with all clients registered since last digest.
+    Returns count of clients in digest
+    """
+    with transaction.atomic():
+        notices = list(
+            ClientRegistrationNotice.objects.select_for_update().select_related('user').order_by('id')
+        )
+        if not notices:
+            return 0
+
+        managers_emails = get_manager_emails()
+
+        if managers_emails:
+            subject = 'Created %d New Users' % len(notices)
+            message = 'Were created new users:\n%s' % '\n'.join(
+                '%s with id %d' % (notice.user.get_full_name, notice.user.id) for notice in notices
+            )
+            now = timezone.now()
+            OutboxEmail.objects.bulk_create([
+                OutboxEmail(
+                    subject=subject,
+                    message=message,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    recipients=email,
+                    created_at=now,
+                    next_attempt_at=now
+                ) for email in managers_emails
+            ])
+
+        ClientRegistrationNotice.objects.filter(id__in=[notice.id for notice in notices]).delete()
+
+    return len(notices)
@@ -0,0 +1,124 @@
+"""
+Profiling of single requests in place.
+
+Superuser or manager gets value of X-Profile header signed for them
+(`profile_header` command or admin profiles page) and sends it with the
+request to profile. RequestProfilingMiddleware runs such request under
+cProfile and keeps stats only when request was authenticated as the user
+the header is signed for. Stats are written to REQUEST_PROFILING['DIR'] of
+the worker as pstats file with JSON metadata, only MAX_PROFILES last ones
+are kept, see admin profiles page. Superuser sees all profiles, others see
+profiles of their requests only.
+"""
+import io
+import json
+import marshal
+import os
+import pstats
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+
+SALT = 'accounts.profiling'
+
+# time of profile and random suffix, ids are sorted by time
+PROFILE_ID_RE = re.compile(r'^\d{20}-[0-9a-f]{8}$')
+
+
+def make_header(user):
+    """ Value of X-Profile header of superuser or manager """
+
+    return signing.dumps({'user': user.pk}, salt=SALT)
+
+
+def load_header(value):
+    """ Id of user the header is signed for, None for bad or expired header """
+
+    try:
+        return signing.loads(value, salt=SALT, max_age=settings.REQUEST_PROFILING['HEADER_MAX_AGE'])['user']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def can_profile(user):
+    return user.is_active and (user.is_superuser or user.is_manager)
+
+
+class ProfileStore(object):
+    """ Last `max_profiles` profiles in directory, `<id>.prof` stats and `<id>.json` metadata """
+
+    def __init__(self, directory, max_profiles):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.lock = threading.Lock()
+
+    def path(self, profile_id, extension):
+        # ids come from URLs of admin pages
+        if not PROFILE_ID_RE.match(profile_id):
+            raise ValueError('Bad profile id %r' % profile_id)
+        return os.path.join(self.directory, '%s.%s' % (profile_id, extension))
+
+    def save(self, stats, **metadata):
+        os.makedirs(self.directory, exist_ok=True)
+        now = timezone.now()
+        profile_id = '%s-%s' % (now.strftime('%Y%m%d%H%M%S%f'), uuid.uuid4().hex[:8])
+        metadata.update(id=profile_id, created_at=now.isoformat())
+
+        with open(self.path(profile_id, 'prof'), 'wb') as f:
+            marshal.dump(stats, f)
+        with open(self.path(profile_id, 'json'), 'w') as f:
+            json.dump(metadata, f)
+
+        with self.lock:
+            for old in self.ids()[self.max_profiles:]:
+                self.delete(old)
+        return profile_id
+
+    def ids(self):
+        """ Ids of profiles, newest first """
+
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[:-5] for name in names if name.endswith('.json')), reverse=True)
+
+    def delete(self, profile_id):
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(self.path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+    def list(self):
+        profiles = []
+        for profile_id in self.ids():
+            try:
+                with open(self.path(profile_id, 'json')) as f:
+                    profiles.append(json.load(f))
+            except FileNotFoundError:
+                # removed by other worker
+                pass
+        return profiles
+
+    def get(self, profile_id):
+        with open(self.path(profile_id, 'json')) as f:
+            return json.load(f)
+
+    def report(self, profile_id, sort='cumulative', limit=50):
+        """ Text of pstats report """
+
+        out = io.StringIO()
+        stats = pstats.Stats(self.path(profile_id, 'prof'), stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def get_store():
+    config = settings.REQUEST_PROFILING
+    return ProfileStore(config['DIR'], config['MAX_PROFILES'])
@@ -0,0 +1,116 @@
+"""
+Search of clients by name, email and passport number.
+
+Values are split into normalized tokens (lower case, without accents)
+stored in `ClientSearchToken`, tokens are updated by post_save of user
+and by bulk import. Every query term matches tokens by prefix with index
+range scan. On PostgreSQL names are matched by trigram similarity too
+(GIN index), so misspelled names are found.
+"""
+import re
+import string
+import unicodedata
+
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.db import connections
+from django.db.models import CharField, Q
+
+from .models import ClientSearchToken
+from .utils import bulk_create
+
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'email', 'passport_number')
+
+TOKEN_MAX_LENGTH = ClientSearchToken._meta.get_field('token').max_length
+
+# shorter terms match whole tokens only
+MIN_PREFIX_LENGTH = 2
+# shorter terms are not matched by similarity
+MIN_TRIGRAM_LENGTH = 3
+MAX_TERMS = 5
+
+# users which tokens are replaced by one DELETE
+DELETE_CHUNK_SIZE = 500
+
+WORD_RE = re.compile(r'\w+')
+
+# upper bound of prefix range, greater than any character
+LAST_CHAR = '\U0010ffff'
+
+# lookup of django.contrib.postgres, the app itself requires psycopg2
+CharField.register_lookup(TrigramSimilar)
+
+
+def normalize(value):
+    value = unicodedata.normalize('NFKD', value)
+    return ''.join(char for char in value if not unicodedata.combining(char)).lower()
+
+
+def get_tokens(user):
+    """ Return set of tokens for user """
+
+    tokens = set()
+    for field in ('first_name', 'last_name'):
+        tokens.update(WORD_RE.findall(normalize(getattr(user, field))))
+
+    email = normalize(user.email)
+    tokens.add(email)
+    tokens.update(WORD_RE.findall(email.split('@')[0]))
+
+    tokens.add(''.join(normalize(user.passport_number).split()))
+    return {token[:TOKEN_MAX_LENGTH] for token in tokens if token}
+
+
+def build_tokens(users, model=ClientSearchToken):
+    return [
+        model(user_id=user.id, token=token) for user in users for token in sorted(get_tokens(user))
+    ]
+
+
+def create_tokens(users):
+    bulk_create(ClientSearchToken, build_tokens(users))
+
+
+def update_tokens(users):
+    """ Replace tokens of users """
+
+    user_ids = [user.id for user in users]
+    for start in range(0, len(user_ids), DELETE_CHUNK_SIZE):
+        ClientSearchToken.objects.filter(user_id__in=user_ids[start:start + DELETE_CHUNK_SIZE]).delete()
+    create_tokens(users)
+
+
+def get_terms(query):
+    terms = []
+    for word in normalize(query).split():
+        word = word.strip(string.punctuation)
+        if word and word not in terms:
+            terms.append(word[:TOKEN_MAX_LENGTH])
+    return terms[:MAX_TERMS]
+
+
+def match_term(term, vendor):
+    """ Condition for tokens matching term """
+
+    if len(term) < MIN_PREFIX_LENGTH:
+        condition = Q(token=term)
+    elif vendor == 'postgresql':
+        # LIKE 'term%' is served by varchar_pattern_ops index
+        condition = Q(token__startswith=term)
+    else:
+        condition = Q(token__gte=term, token__lt=term + LAST_CHAR)
+
+    if vendor == 'postgresql' and len(term) >= MIN_TRIGRAM_LENGTH:
+        condition |= Q(token__trigram_similar=term)
+    return condition
+
+
+def search(queryset, query):
+    """ Filter users from queryset which match every term of query """
+
+    vendor = connections[queryset.db].vendor
+    for term in get_terms(query):
+        queryset = queryset.filter(
+            id__in=ClientSearchToken.objects.filter(match_term(term, vendor)).values('user_id')
+        )
+    return queryset
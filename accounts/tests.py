@@ -1,3 +1,642 @@
-from django.test import TestCase
+import sys
+import tempfile
+import threading
+from unittest import skipUnless
+from decimal import Decimal
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from . import importing, ledger
+from .importing import import_clients
+from .loadtest import SEED_PIN, percentile
+from .mail import claim_batch, drain_outbox, queue_mail, send_outbox
+from .models import (
+    User, OutboxEmail, ClientRegistrationNotice, LedgerEntry, LedgerError, BalanceCheckpoint, ConcurrentUpdate
+)
+from .notifications import get_manager_emails, send_manager_digest
+
+
+class OutboxTestCase(TestCase):
+    """Tests to mail outbox"""
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create(
+            first_name='Manager',
+            last_name='Manager',
+            email='test@testmanager.com',
+            passport_number='12345679',
+            is_manager=True,
+        )
+
+    def test_registration_queue_mails(self):
+        """Test that client creation writes mails to outbox instead of sending"""
+
+        User.objects.create(
+            first_name='Test',
+            last_name='User',
+            email='test@testuser.com',
+            passport_number='12345678',
+        )
+
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(2, OutboxEmail.objects.filter(status=OutboxEmail.STATUS_PENDING).count())
+
+        self.assertEqual((2, 0), drain_outbox())
+        self.assertEqual(2, len(mail.outbox))
+        self.assertEqual(['test@testmanager.com'], mail.outbox[0].to)
+        self.assertEqual(['test@testuser.com'], mail.outbox[1].to)
+        self.assertEqual(2, OutboxEmail.objects.filter(status=OutboxEmail.STATUS_SENT).count())
+
+    def test_batch_size(self):
+        """Test that one call sends only one batch"""
+
+        for i in range(3):
+            queue_mail('Subject', 'Message', ['test%d@testuser.com' % i])
+
+        self.assertEqual((2, 0), send_outbox(batch_size=2))
+        self.assertEqual((1, 0), send_outbox(batch_size=2))
+        self.assertEqual((0, 0), send_outbox(batch_size=2))
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_DELAY=0)
+    def test_retry_failed_mail(self):
+        """Test that failed mail is retried and marked failed after max attempts"""
+
+        outbox_mail = queue_mail('Subject', 'Message', ['test@testuser.com'])
+
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=SMTPException('Connection refused')
+        ), self.assertLogs('accounts.mail', 'WARNING'):
+            self.assertEqual((0, 1), send_outbox())
+            outbox_mail.refresh_from_db()
+            self.assertEqual(OutboxEmail.STATUS_PENDING, outbox_mail.status)
+
+            self.assertEqual((0, 1), send_outbox())
+
+        outbox_mail.refresh_from_db()
+        self.assertEqual(OutboxEmail.STATUS_FAILED, outbox_mail.status)
+        self.assertEqual(2, outbox_mail.attempts)
+        self.assertEqual('Connection refused', outbox_mail.last_error)
+        self.assertEqual((0, 0), send_outbox())
+
+    def test_connection_failure(self):
+        """Test that failed connection fails whole batch with backoff instead of raising"""
+
+        mails = [queue_mail('Subject', 'Message', ['test%d@testuser.com' % i]) for i in range(3)]
+
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.open',
+            side_effect=ConnectionRefusedError('Connection refused')
+        ), self.assertLogs('accounts.mail', 'WARNING'):
+            self.assertEqual((0, 3), send_outbox())
+
+        for outbox_mail in mails:
+            outbox_mail.refresh_from_db()
+            self.assertEqual((OutboxEmail.STATUS_PENDING, 1), (outbox_mail.status, outbox_mail.attempts))
+            self.assertTrue(outbox_mail.next_attempt_at > timezone.now())
+        self.assertEqual((0, 0), send_outbox())
+
+    def test_connection_reopened_once(self):
+        """Test that after failed send the rest of batch is sent over one new connection"""
+
+        for i in range(3):
+            queue_mail('Subject', 'Message', ['test%d@testuser.com' % i])
+
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.open'
+        ) as open_connection, mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=[SMTPException('Connection lost'), 1, 1]
+        ), self.assertLogs('accounts.mail', 'WARNING'):
+            self.assertEqual((2, 1), send_outbox())
+        self.assertEqual(2, open_connection.call_count)
+
+    def test_claimed_mails_skipped(self):
+        """Test that mails claimed by other worker are not sent until claim expires"""
+
+        queue_mail('Subject', 'Message', ['test@testuser.com'])
+        claim_batch(10, timezone.now())
+        self.assertEqual((0, 0), send_outbox())
+
+        with mock.patch('accounts.mail.timezone.now', return_value=timezone.now() + timedelta(minutes=10)):
+            self.assertEqual((1, 0), send_outbox())
+
+
+class ManagerNotificationsMixin(object):
+
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create(
+            first_name='Manager',
+            last_name='Manager',
+            email='test@testmanager.com',
+            passport_number='12345679',
+            is_manager=True,
+        )
+
+    def create_client(self, number):
+        return User.objects.create(
+            first_name='Test',
+            last_name='User%d' % number,
+            email='test%d@testuser.com' % number,
+            passport_number='1234567%d' % number,
+        )
+
+
+class ManagerNotificationsTestCase(ManagerNotificationsMixin, TestCase):
+    """Tests to managers recipients cache and digest"""
+
+    def test_manager_emails_cached(self):
+        """Test that managers are queried once for many registrations"""
+
+        self.assertEqual(['test@testmanager.com'], get_manager_emails())
+
+        with self.assertNumQueries(0):
+            get_manager_emails()
+
+        # token, two outbox and search tokens inserts, no managers query
+        with self.assertNumQueries(5):
+            self.create_client(1)
+
+    @override_settings(MANAGER_NOTIFICATIONS_DIGEST=True)
+    def test_manager_digest(self):
+        """Test that managers get one mail about all new clients"""
+
+        for number in range(3):
+            self.create_client(number)
+
+        self.assertEqual(3, ClientRegistrationNotice.objects.count())
+        # only welcome mails to clients
+        self.assertEqual(3, OutboxEmail.objects.count())
+
+        self.assertEqual(3, send_manager_digest())
+        self.assertEqual(0, ClientRegistrationNotice.objects.count())
+
+        digest = OutboxEmail.objects.get(recipients='test@testmanager.com')
+        self.assertEqual('Created 3 New Users', digest.subject)
+        self.assertEqual(4, len(digest.message.splitlines()))
+
+        self.assertEqual(0, send_manager_digest())
+
+
+class LedgerTestCase(TestCase):
+    """Tests to ledger posting service"""
+
+    def setUp(self):
+        self.user_1 = User.objects.create(
+            first_name='Test',
+            last_name='User1',
+            email='test1@testuser.com',
+            passport_number='12345671',
+        )
+        self.user_2 = User.objects.create(
+            first_name='Test',
+            last_name='User2',
+            email='test2@testuser.com',
+            passport_number='12345672',
+        )
+
+    def test_post_batch(self):
+        """Test that batch of postings changes balances and records entries"""
+
+        entries = ledger.post([
+            (self.user_1.id, '100.00', 'Deposit'),
+            (self.user_2.id, '50.50'),
+            (self.user_1.id, '-30.25', 'Withdrawal'),
+        ])
+
+        self.assertEqual(3, LedgerEntry.objects.count())
+        self.assertEqual(Decimal('69.75'), entries[2].balance_after)
+
+        self.user_1.refresh_from_db()
+        self.user_2.refresh_from_db()
+        self.assertEqual(Decimal('69.75'), self.user_1.balance)
+        self.assertEqual(Decimal('50.50'), self.user_2.balance)
+
+    def test_insufficient_funds(self):
+        """Test that batch is not applied partially"""
+
+        ledger.credit(self.user_1.id, '10')
+
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.post([
+                (self.user_2.id, '5'),
+                (self.user_1.id, '-10.01'),
+            ])
+
+        self.assertEqual(1, LedgerEntry.objects.count())
+        self.user_2.refresh_from_db()
+        self.assertEqual(Decimal('0'), self.user_2.balance)
+
+    def test_unknown_user(self):
+        """Test posting to not existing user"""
+
+        with self.assertRaises(LedgerError):
+            ledger.credit(0, '10')
+
+    def test_entries_append_only(self):
+        """Test that ledger entries can not be changed or deleted"""
+
+        ledger.credit(self.user_1.id, '10')
+        entry = LedgerEntry.objects.get()
+
+        entry.amount = Decimal('20')
+        with self.assertRaises(LedgerError):
+            entry.save()
+        with self.assertRaises(LedgerError):
+            entry.delete()
+        with self.assertRaises(LedgerError):
+            LedgerEntry.objects.all().delete()
+        with self.assertRaises(LedgerError):
+            LedgerEntry.objects.update(amount=0)
+
+
+class BalanceCheckpointTestCase(TestCase):
+    """Tests to balance checkpoints and reconciliation"""
+
+    def setUp(self):
+        self.user = User.objects.create(
+            first_name='Test',
+            last_name='User',
+            email='test@testuser.com',
+            passport_number='12345678',
+        )
+
+    def test_balance_as_of(self):
+        """Test balance at moment before and after checkpoint"""
+
+        start = timezone.now()
+        ledger.credit(self.user.id, '100')
+        ledger.credit(self.user.id, '20')
+
+        self.assertEqual((1, []), ledger.reconcile_range(self.user.id, self.user.id + 1))
+        checkpoint = BalanceCheckpoint.objects.get()
+        self.assertEqual(Decimal('120'), checkpoint.balance)
+
+        ledger.debit(self.user.id, '50')
+
+        self.assertEqual(Decimal('0'), ledger.balance_as_of(self.user.id, start - timedelta(seconds=1)))
+        self.assertEqual(Decimal('120'), ledger.balance_as_of(self.user.id, checkpoint.as_of))
+        self.assertEqual(Decimal('70'), ledger.balance_as_of(self.user.id, timezone.now()))
+
+    def test_reconcile_reads_new_entries(self):
+        """Test that reconciliation saves checkpoint only for new entries"""
+
+        ledger.credit(self.user.id, '100')
+
+        call_command('reconcile_balances', workers=1, stdout=StringIO())
+        self.assertEqual(1, BalanceCheckpoint.objects.count())
+
+        call_command('reconcile_balances', workers=1, stdout=StringIO())
+        self.assertEqual(1, BalanceCheckpoint.objects.count())
+
+        ledger.debit(self.user.id, '30')
+        call_command('reconcile_balances', workers=1, stdout=StringIO())
+        self.assertEqual(Decimal('70'), BalanceCheckpoint.objects.last().balance)
+
+    def test_reconcile_mismatch(self):
+        """Test that balance changed without ledger is reported"""
+
+        ledger.credit(self.user.id, '100')
+        User.objects.filter(id=self.user.id).update(balance=Decimal('1000'))
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_balances', workers=1, stdout=StringIO())
+        self.assertEqual(0, BalanceCheckpoint.objects.count())
+
+
+class ManagerEmailsInvalidationTestCase(ManagerNotificationsMixin, TransactionTestCase):
+    """Tests to invalidation of managers recipients cache after commit"""
+
+    def test_manager_emails_invalidation(self):
+        """Test that managers cache is invalidated on manager changes only"""
+
+        get_manager_emails()
+
+        client = self.create_client(1)
+        client.email = 'new@testuser.com'
+        client.save()
+        with self.assertNumQueries(0):
+            get_manager_emails()
+
+        self.manager.email = 'new@testmanager.com'
+        self.manager.save()
+        self.assertEqual(['new@testmanager.com'], get_manager_emails())
+
+        self.manager.is_active = False
+        self.manager.save()
+        self.assertEqual([], get_manager_emails())
+
+        client.is_manager = True
+        client.save()
+        self.assertEqual(['new@testuser.com'], get_manager_emails())
+
+        client.delete()
+        self.assertEqual([], get_manager_emails())
+
+    def test_invalidated_after_commit(self):
+        """Test that cache is not cleared before commit, when readers would cache old managers again"""
+
+        get_manager_emails()
+        with transaction.atomic():
+            self.manager.email = 'new@testmanager.com'
+            self.manager.save()
+            with self.assertNumQueries(0):
+                self.assertEqual(['test@testmanager.com'], get_manager_emails())
+        self.assertEqual(['new@testmanager.com'], get_manager_emails())
+
+
+class UserVersionTestCase(TestCase):
+    """Tests to minimal updates and version check of user saves"""
+
+    def setUp(self):
+        User.objects.create(
+            first_name='Test',
+            last_name='User',
+            email='test@testuser.com',
+            passport_number='12345678',
+        )
+        self.user = User.objects.get()
+
+    def test_changed_fields_written(self):
+        """Test that save writes changed columns with version and nothing without changes"""
+
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        self.assertEqual(0, len(queries))
+
+        self.user.first_name = 'New'
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        update = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "accounts_user"')]
+        self.assertEqual(1, len(update))
+        self.assertIn('"first_name"', update[0])
+        self.assertIn('"version"', update[0])
+        self.assertNotIn('"balance"', update[0])
+        self.assertNotIn('"last_name"', update[0])
+
+        self.assertEqual(1, self.user.version)
+        self.assertEqual(('New', 1), User.objects.values_list('first_name', 'version').get())
+
+    def test_stale_save(self):
+        """Test that save of stale user fails and does not overwrite balance"""
+
+        other = User.objects.get()
+        other.last_name = 'Other'
+        other.save()
+        ledger.credit(self.user.id, '100')
+
+        self.user.first_name = 'Stale'
+        with self.assertRaises(ConcurrentUpdate), transaction.atomic():
+            self.user.save()
+        self.assertEqual(0, self.user.version)
+
+        self.user.refresh_from_db()
+        self.assertEqual(('Test', 'Other', Decimal('100'), 1), (
+            self.user.first_name, self.user.last_name, self.user.balance, self.user.version
+        ))
+
+        # explicit fields are written without version check
+        other.set_password('1234')
+        other.save(update_fields=['password'])
+        self.assertEqual(1, User.objects.get().version)
+
+    def test_two_loaded_instances(self):
+        """Test that save of instance loaded before save of other one fails"""
+
+        first, second = User.objects.get(), User.objects.get()
+        first.first_name = 'First'
+        first.save()
+
+        second.last_name = 'Second'
+        with self.assertRaises(ConcurrentUpdate), transaction.atomic():
+            second.save()
+        self.assertEqual(('First', 'User', 1), User.objects.values_list('first_name', 'last_name', 'version').get())
+
+    def test_untracked_field_changed(self):
+        """Test that change of field which save does not write is not lost silently"""
+
+        self.user.balance = Decimal('100')
+        with self.assertRaisesRegex(ValueError, 'balance'):
+            self.user.save()
+        self.assertEqual((Decimal('0'), 0), User.objects.values_list('balance', 'version').get())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'concurrent transactions need PostgreSQL')
+class UserConcurrentUpdatesTestCase(TransactionTestCase):
+    """Tests that concurrent saves and balance changes of user are not lost"""
+
+    def test_no_lost_updates(self):
+        """Test counter in last name changed with retries and ledger credits by many threads"""
+
+        user = User.objects.create(
+            first_name='Test',
+            last_name='0',
+            email='test@testuser.com',
+            passport_number='12345678',
+        )
+        conflicts = []
+
+        def increment():
+            for i in range(20):
+                while True:
+                    instance = User.objects.get(id=user.id)
+                    instance.last_name = str(int(instance.last_name) + 1)
+                    try:
+                        instance.save()
+                        break
+                    except ConcurrentUpdate:
+                        conflicts.append(i)
+            connections.close_all()
+
+        def credit():
+            for i in range(20):
+                ledger.credit(user.id, '1')
+            connections.close_all()
+
+        threads = [threading.Thread(target=increment) for i in range(4)]
+        threads.extend(threading.Thread(target=credit) for i in range(4))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        user.refresh_from_db()
+        self.assertEqual('80', user.last_name)
+        self.assertEqual(80, user.version)
+        self.assertEqual(Decimal('80'), user.balance)
+        self.assertEqual(80, LedgerEntry.objects.filter(user=user).count())
+
+
+class LoadTestTestCase(TestCase):
+    """Tests to load test seeding and reports"""
+
+    def test_seed_clients(self):
+        """Test that seeded users have tokens and PIN"""
+
+        call_command('seed_clients', clients=5, managers=1, chunk_size=2, stdout=StringIO())
+        call_command('seed_clients', clients=5, managers=1, chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(6, User.objects.count())
+        self.assertEqual(1, User.objects.filter(is_manager=True).count())
+        self.assertEqual(6, Token.objects.count())
+        self.assertTrue(User.objects.get(email='client1@seed.test').check_password(SEED_PIN))
+
+    def test_percentile(self):
+        """Test nearest-rank percentile"""
+
+        values = list(range(1, 101))
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(1, percentile([1], 99))
+        self.assertIsNone(percentile([], 50))
+
+
+class ImportClientsTestCase(TestCase):
+    """Tests to bulk import of clients"""
+
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create(
+            first_name='Manager',
+            last_name='Manager',
+            email='test@testmanager.com',
+            passport_number='12345679',
+            is_manager=True,
+        )
+
+    def get_rows(self, count):
+        return [{
+            'email': 'test%d@testuser.com' % number,
+            'first_name': 'Test',
+            'last_name': 'User%d' % number,
+            'passport_number': 'P%d' % number,
+        } for number in range(count)]
+
+    def test_import(self):
+        """Test that clients are created with tokens and one batch of mails"""
+
+        # existing outbox mails are not counted
+        OutboxEmail.objects.all().delete()
+
+        created, errors = import_clients(self.get_rows(30), chunk_size=20)
+        self.assertEqual((30, []), (created, errors))
+
+        clients = User.objects.filter(is_manager=False)
+        self.assertEqual(30, clients.count())
+        self.assertFalse(clients.filter(is_active=True).exists())
+        self.assertEqual(30, Token.objects.filter(user__in=clients).count())
+
+        self.assertEqual(31, OutboxEmail.objects.count())
+        self.assertEqual(1, OutboxEmail.objects.filter(recipients='test@testmanager.com').count())
+
+    def test_import_queries_do_not_depend_on_rows_count(self):
+        """Test that rows are validated and created with set based queries"""
+
+        get_manager_emails()
+        with CaptureQueriesContext(connection) as small:
+            import_clients(self.get_rows(5))
+        with CaptureQueriesContext(connection) as large:
+            import_clients(self.get_rows(50)[10:])
+
+        self.assertEqual(len(small), len(large))
+
+    def test_import_errors(self):
+        """Test that nothing is imported when some rows are invalid"""
+
+        rows = self.get_rows(4)
+        rows[1]['email'] = 'test@testmanager.com'
+        rows[2]['passport_number'] = rows[0]['passport_number']
+        rows[3]['first_name'] = ''
+
+        created, errors = import_clients(rows)
+
+        self.assertEqual(0, created)
+        self.assertEqual([2, 3, 4], [error['row'] for error in errors])
+        self.assertIn('email', errors[0]['errors'])
+        self.assertEqual(['Duplicate of row 1'], errors[1]['errors']['passport_number'])
+        self.assertIn('first_name', errors[2]['errors'])
+        self.assertFalse(User.objects.filter(is_manager=False).exists())
+
+    def test_import_concurrent_duplicate(self):
+        """Test that client created after validation is reported as invalid row"""
+
+        rows = self.get_rows(3)
+        validated = importing.validate_rows(rows)
+        # concurrent registration after validation
+        User.objects.create(
+            first_name='Test',
+            last_name='User',
+            email=rows[1]['email'],
+            passport_number='12345678',
+        )
+
+        with mock.patch('accounts.importing.validate_rows', side_effect=[validated, importing.validate_rows(rows)]):
+            created, errors = import_clients(rows)
+
+        self.assertEqual(0, created)
+        self.assertEqual([2], [error['row'] for error in errors])
+        self.assertIn('email', errors[0]['errors'])
+        self.assertEqual(1, User.objects.filter(is_manager=False).count())
+
+    def test_import_command(self):
+        """Test import of CSV file by command"""
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as stream:
+            stream.write('email,first_name,last_name,passport_number\n')
+            stream.write('test1@testuser.com,Test,User1,P1\n')
+            stream.flush()
+
+            call_command('import_clients', stream.name, stdout=StringIO())
+
+        self.assertTrue(User.objects.filter(email='test1@testuser.com', passport_number='P1').exists())
+
+    def test_import_command_concurrent_change(self):
+        """Test that command reports error of import which is not error of some row"""
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as stream:
+            stream.write('email,first_name,last_name,passport_number\n')
+            stream.write('test1@testuser.com,Test,User1,P1\n')
+            stream.flush()
+
+            stderr = StringIO()
+            with mock.patch('accounts.importing.create_clients', side_effect=IntegrityError), \
+                    self.assertRaisesRegex(CommandError, 'Nothing is imported, errors: 1'):
+                call_command('import_clients', stream.name, stdout=StringIO(), stderr=stderr)
+
+        self.assertIn('Clients were changed concurrently', stderr.getvalue())
+        self.assertFalse(User.objects.filter(email='test1@testuser.com').exists())
+
+
+class DomainModulesTestCase(SimpleTestCase):
+    """Tests to dependencies of domain modules"""
+
+    def test_api_not_imported(self):
+        """Test that set based changes of clients and ledger do not import API package"""
+
+        with mock.patch.dict(sys.modules):
+            for name in list(sys.modules):
+                if name.startswith('accounts.api') or name in (
+                    'accounts.clients', 'accounts.ledger', 'accounts.token_cache'
+                ):
+                    del sys.modules[name]
+
+            import accounts.clients  # noqa
+            import accounts.ledger  # noqa
+
+            self.assertEqual([], [name for name in sys.modules if name.startswith('accounts.api')])
@@ -0,0 +1,44 @@
+"""
+Cache of authenticated tokens.
+
+(user, token) pairs are kept in bounded in-process LRU with short TTL in
+front of shared Django cache, they are filled by accounts.api.authentication.
+Signals in accounts.models invalidate both levels when user or token changes,
+set based updates and deletes invalidate them by functions of this module.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.authtoken.models import Token
+
+from .utils import LRUCache
+
+
+CACHE_KEY = 'accounts:auth-token:%s'
+
+local_cache = LRUCache(
+    maxsize=settings.AUTH_TOKEN_CACHE['LOCAL_SIZE'],
+    ttl=settings.AUTH_TOKEN_CACHE['LOCAL_TTL']
+)
+
+
+def invalidate_token(key):
+    local_cache.delete(key)
+    cache.delete(CACHE_KEY % key)
+
+
+def invalidate_user(user_id):
+    invalidate_users([user_id])
+
+
+def invalidate_users(user_ids):
+    """ Drop cached tokens of users, used after bulk updates which skip signals """
+
+    invalidate_tokens(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+
+
+def invalidate_tokens(keys):
+    keys = list(keys)
+    for key in keys:
+        local_cache.delete(key)
+    cache.delete_many([CACHE_KEY % key for key in keys])
@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import connections
+
+
+# max rows inserted by one INSERT statement
+INSERT_BATCH_SIZE = 1000
+
+
+def bulk_create(model, objs, using='default'):
+    """ bulk_create in batches that fit database limits (SQLite limits rows in one INSERT) """
+
+    fields = model._meta.concrete_fields
+    ops = connections[using].ops
+    batch_size = min(INSERT_BATCH_SIZE, ops.bulk_batch_size(fields, objs) or INSERT_BATCH_SIZE)
+    return model.objects.using(using).bulk_create(objs, batch_size=batch_size)
+
+
+class LRUCache(object):
+    """
+    Thread safe in-process cache with bounded size and time to live.
+    Least recently used items are evicted when cache is full
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -1,3 +1,83 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
 from django.shortcuts import render
 
-# Create your views here.
+from . import profiling
+
+
+REPORT_SORTS = ('cumulative', 'tottime', 'calls')
+
+
+def check_profiler(request):
+    if not profiling.can_profile(request.user):
+        raise PermissionDenied
+
+
+def can_see(user, profile):
+    # profiled queries and paths may contain data of other users
+    return user.is_superuser or profile['user'] == user.email
+
+
+def get_profile(request, store, profile_id):
+    """ Metadata of profile visible for user of request """
+
+    try:
+        profile = store.get(profile_id)
+    except FileNotFoundError:
+        raise Http404('Profile was removed')
+    if not can_see(request.user, profile):
+        raise Http404('Profile was removed')
+    return profile
+
+
+def profile_list(request):
+    """ Recent profiles of this worker visible for user and X-Profile header of user """
+
+    check_profiler(request)
+    return render(request, 'accounts/admin/profile_list.html', dict(
+        admin.site.each_context(request),
+        title='Request profiles',
+        profiles=[profile for profile in profiling.get_store().list() if can_see(request.user, profile)],
+        header=profiling.make_header(request.user),
+    ))
+
+
+def profile_detail(request, profile_id):
+    """ pstats report of profile """
+
+    check_profiler(request)
+    sort = request.GET.get('sort')
+    if sort not in REPORT_SORTS:
+        sort = REPORT_SORTS[0]
+
+    store = profiling.get_store()
+    profile = get_profile(request, store, profile_id)
+    try:
+        report = store.report(profile_id, sort=sort)
+    except FileNotFoundError:
+        raise Http404('Profile was removed')
+
+    return render(request, 'accounts/admin/profile_detail.html', dict(
+        admin.site.each_context(request),
+        title='Profile of %s %s' % (profile['method'], profile['path']),
+        profile=profile,
+        report=report,
+        sort=sort,
+        sorts=REPORT_SORTS,
+    ))
+
+
+def profile_download(request, profile_id):
+    """ pstats file of profile, for pstats module, snakeviz, ... """
+
+    check_profiler(request)
+    store = profiling.get_store()
+    get_profile(request, store, profile_id)
+    try:
+        response = FileResponse(open(store.path(profile_id, 'prof'), 'rb'),
+                                content_type='application/octet-stream')
+    except FileNotFoundError:
+        raise Http404('Profile was removed')
+    response['Content-Disposition'] = 'attachment; filename="%s.prof"' % profile_id
+    return response
@@ -0,0 +1,156 @@
+"""
+ASGI config for finance_system project.
+
+Django 1.10 has no async request handling, so views (login, register,
+profile and the rest) are run by the WSGI application in a bounded pool of
+`ASGI_THREADS` threads. The event loop keeps connections while requests are
+read and responses are sent, a thread is busy only while a view runs and the
+pool bounds database connections of the process. Password hashing has its
+own pool (see accounts.hashing).
+
+Run with uvicorn worker of gunicorn:
+
+    gunicorn finance_system.asgi:application -k uvicorn.workers.UvicornWorker
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "finance_system.settings")
+
+from django.conf import settings  # noqa: E402
+
+from .wsgi import application as wsgi_application  # noqa: E402
+
+
+executor = ThreadPoolExecutor(max_workers=settings.ASGI_THREADS)
+
+
+def build_environ(scope, body):
+    """ WSGI environ for http scope """
+
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        # WSGI strings are bytes decoded as latin-1
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope['http_version'],
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_%s' % name
+        if name in environ:
+            value = '%s%s%s' % (environ[name], '; ' if name == 'HTTP_COOKIE' else ',', value)
+        environ[name] = value
+    # body is read already, chunked requests have no length header
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def call_application(environ):
+    """
+    Run WSGI application, returns (status, headers, body, iterable, iterator).
+    Body of regular response is read here and iterable is None, streaming
+    response is returned with its first chunk for reading chunk by chunk
+    """
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [
+            int(status.split(' ', 1)[0]),
+            [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        ]
+
+    iterable = wsgi_application(environ, start_response)
+    if getattr(iterable, 'streaming', True):
+        # streaming or file response, start_response may be called on first chunk
+        iterator = iter(iterable)
+        first = next(iterator, None)
+        return response[0], response[1], first, iterable, iterator
+
+    try:
+        body = b''.join(iterable)
+    finally:
+        # request_finished closes database connection of this thread
+        iterable.close()
+    return response[0], response[1], body, None, None
+
+
+def close_iterable(iterable):
+    if hasattr(iterable, 'close'):
+        iterable.close()
+
+
+async def read_body(receive):
+    """ Request body, None if client disconnected """
+
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def handle_http(scope, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    loop = asyncio.get_event_loop()
+    status, headers, body, iterable, iterator = await loop.run_in_executor(
+        executor, call_application, build_environ(scope, body)
+    )
+    if iterable is None:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return
+
+    # chunks are produced in pool threads, database connections opened there
+    # are closed on next request of the thread
+    try:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        while body is not None:
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            body = await loop.run_in_executor(executor, next, iterator, None)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await loop.run_in_executor(executor, close_iterable, iterable)
+
+
+async def handle_lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        await handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await handle_lifespan(scope, receive, send)
+    else:
+        raise ValueError('Unsupported scope type %s' % scope['type'])
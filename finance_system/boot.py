@@ -0,0 +1,90 @@
+"""
+Import time of worker boot.
+
+`main` does what gunicorn worker does before it answers the first request:
+imports WSGI application (settings, apps and models) and handles a request
+(URLconf, middleware and views). Python 3.6 has no `-X importtime`, so every
+module import is timed by wrapping importlib `_find_and_load`, which is
+called for modules not imported yet. Results are printed as JSON, see
+`check_boot_time` command.
+
+Django must not be imported before `main`, run it in a new process:
+
+    python -c 'from finance_system.boot import main; main()'
+"""
+import importlib._bootstrap
+import json
+import sys
+import time
+
+
+class ImportTimer(object):
+    """ Records (module, self seconds, cumulative seconds) of imports """
+
+    def __init__(self):
+        self.records = []
+        # time of nested imports of every module being imported
+        self.stack = []
+        self.original = importlib._bootstrap._find_and_load
+
+    def find_and_load(self, name, import_):
+        started = time.perf_counter()
+        self.stack.append(0)
+        try:
+            return self.original(name, import_)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            # failed imports of optional modules are not recorded
+            if sys.modules.get(name) is not None:
+                self.records.append((name, elapsed - nested, elapsed))
+
+    def install(self):
+        importlib._bootstrap._find_and_load = self.find_and_load
+
+    def uninstall(self):
+        importlib._bootstrap._find_and_load = self.original
+
+
+def first_request(application, path):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': sys.stdin.buffer,
+        'wsgi.errors': sys.stderr,
+    }
+    status = []
+    response = application(environ, lambda value, headers, exc_info=None: status.append(value))
+    b''.join(response)
+    response.close()
+    return status[0]
+
+
+def main(path='/api/v0/login/'):
+    timer = ImportTimer()
+    timer.install()
+
+    phases = []
+    started = time.perf_counter()
+    from finance_system.wsgi import application
+    phases.append(('wsgi', time.perf_counter() - started))
+
+    request_started = time.perf_counter()
+    status = first_request(application, path)
+    phases.append(('first_request', time.perf_counter() - request_started))
+    total = time.perf_counter() - started
+    timer.uninstall()
+
+    json.dump({
+        'total': total,
+        'status': status,
+        'phases': phases,
+        'modules': timer.records,
+    }, sys.stdout)
@@ -0,0 +1,153 @@
+"""
+PostgreSQL backend with connections from per-process pool.
+
+Closing of connection (at the end of request with CONN_MAX_AGE = 0) returns
+it to the pool, connections opened by failed requests are closed. Pool is
+configured with POOL dict of database settings:
+
+    MAX_SIZE        connections of one process
+    TIMEOUT         seconds to wait for free connection
+    PRE_PING        check connection with SELECT 1 on checkout
+    PING_INTERVAL   seconds of idling after which connection is checked
+    STATS_INTERVAL  seconds between logs of pools stats of process, 0 disables
+
+Stats are logged as JSON to `finance_system.db.pool` logger with INFO level.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.creation import DatabaseCreation as BaseDatabaseCreation
+
+from finance_system.instrumentation import timer
+
+from finance_system.db.pool import ConnectionPool, PoolTimeout
+
+
+logger = logging.getLogger('finance_system.db.pool')
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'PRE_PING': True,
+    'PING_INTERVAL': 0,
+    'STATS_INTERVAL': 60,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+# process which started stats log thread
+_stats_log_pid = None
+
+
+def get_pool_key(settings_dict):
+    return tuple(settings_dict[key] for key in ('NAME', 'USER', 'HOST', 'PORT'))
+
+
+def get_pool(wrapper, conn_params):
+    """ Pool of process for database settings of wrapper """
+
+    key = get_pool_key(wrapper.settings_dict)
+    pool = _pools.get(key)
+    # pools are not shared with forked processes
+    if pool is None or pool.pid != os.getpid():
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.pid != os.getpid():
+                config = dict(POOL_DEFAULTS, **wrapper.settings_dict.get('POOL', {}))
+                pool = _pools[key] = ConnectionPool(
+                    lambda: base.Database.connect(**conn_params),
+                    max_size=config['MAX_SIZE'],
+                    timeout=config['TIMEOUT'],
+                    pre_ping=config['PRE_PING'],
+                    ping_interval=config['PING_INTERVAL'],
+                )
+                pool.pid = os.getpid()
+                start_stats_log(config['STATS_INTERVAL'])
+    return pool
+
+
+def get_pools_stats():
+    """ Stats of pools of this process by database name """
+
+    return {key[0]: pool.stats() for key, pool in _pools.items() if pool.pid == os.getpid()}
+
+
+def log_pools_stats():
+    """ Log stats of pools of this process, one line per database """
+
+    for name, stats in sorted(get_pools_stats().items()):
+        logger.info(json.dumps(dict(stats, database=name, pid=os.getpid())))
+
+
+def start_stats_log(interval):
+    """ Start thread logging pools stats every `interval` seconds, once per process """
+
+    global _stats_log_pid
+    if not interval or _stats_log_pid == os.getpid():
+        return
+    _stats_log_pid = os.getpid()
+
+    def log_stats():
+        while True:
+            time.sleep(interval)
+            try:
+                log_pools_stats()
+            except Exception:
+                logger.exception('Failed to log pools stats')
+
+    threading.Thread(target=log_stats, name='db-pool-stats', daemon=True).start()
+
+
+def clear_pools(name=None):
+    """ Close idle connections of pools, to database with given name only if it is given """
+
+    for key, pool in list(_pools.items()):
+        if name is None or key[0] == name:
+            pool.clear()
+
+
+class DatabaseCreation(BaseDatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # database with idle connections can not be dropped
+        clear_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.creation = DatabaseCreation(self)
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self, conn_params)
+        try:
+            with timer('db_pool'):
+                connection = pool.acquire()
+        except PoolTimeout as e:
+            logger.warning(json.dumps(dict(pool.stats(), error=str(e))))
+            raise base.Database.OperationalError(str(e))
+
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        pool = get_pool(self, self.get_connection_params())
+        if self.errors_occurred and not self.is_usable():
+            # server was restarted or failed over, idle connections are lost too
+            pool.discard(self.connection)
+            pool.clear()
+        else:
+            # connection closed in atomic block is still referenced by wrapper
+            pool.release(self.connection, broken=self.in_atomic_block)
@@ -0,0 +1,68 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from .routers import route_reads
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+PIN_CACHE_KEY = 'replica-pin:%s'
+
+# backends which keep data in process, next request of client may go to other worker
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_pin_key(request):
+    """ Cache key of API client by its Authorization header, None for other clients """
+
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return PIN_CACHE_KEY % hashlib.sha1(authorization.encode()).hexdigest()
+
+
+class ReplicaPinningMiddleware(object):
+    """
+    Send reads of safe requests to replicas unless client wrote in last
+    REPLICA_PINNING['SECONDS']. Client which wrote is pinned to primary in
+    cache by Authorization header or by cookie if it has no header.
+    Default cache must be shared by workers when replicas are used
+    """
+
+    def __init__(self, get_response):
+        if settings.REPLICA_DATABASES and settings.CACHES['default']['BACKEND'] in PROCESS_CACHES:
+            raise ImproperlyConfigured(
+                'Replicas need default cache shared by workers to pin clients which wrote, set CACHE_BACKEND'
+            )
+        self.get_response = get_response
+        self.config = settings.REPLICA_PINNING
+
+    def is_pinned(self, request, key):
+        if request.COOKIES.get(self.config['COOKIE']):
+            return True
+        return key is not None and cache.get(key) is not None
+
+    def pin(self, response, key):
+        if key is not None:
+            cache.set(key, True, self.config['SECONDS'])
+        else:
+            response.set_cookie(self.config['COOKIE'], '1', max_age=self.config['SECONDS'], httponly=True)
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        key = get_pin_key(request)
+        replicas = request.method in SAFE_METHODS and not self.is_pinned(request, key)
+        with route_reads(replicas) as state:
+            response = self.get_response(request)
+
+        if state.wrote:
+            self.pin(response, key)
+        return response
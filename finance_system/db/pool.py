@@ -0,0 +1,209 @@
+"""
+Bounded pool of DB-API connections.
+
+Pool keeps at most `max_size` connections of one process. Checkout waits up
+to `timeout` seconds for a free connection. Idle connections are checked
+with `SELECT 1` on checkout (pre-ping) when they were idle longer than
+`ping_interval`; a failed ping means the server was restarted or failed
+over, so all idle connections are dropped and a new one is opened.
+Wait time and utilization are kept in `stats()`.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Waiter(object):
+    """ Thread waiting for connection, released connection or free slot is handed to it """
+
+    __slots__ = ('event', 'granted', 'connection', 'released_at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.connection = self.released_at = None
+
+    def grant(self, connection=None, released_at=None):
+        self.granted = True
+        self.connection = connection
+        self.released_at = released_at
+        self.event.set()
+
+
+class ConnectionPool(object):
+    """ `connect` is called without arguments and returns new connection """
+
+    timer = time.monotonic
+
+    def __init__(self, connect, max_size=10, timeout=10, pre_ping=True, ping_interval=0):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self.ping_interval = ping_interval
+
+        # (connection, released at), last released is taken first
+        self.idle = []
+        # waiters are served in order of arrival, so released connection is
+        # not taken again by the thread which released it
+        self.waiters = deque()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0
+        self.max_wait_time = 0
+        self.timeouts = 0
+        self.created = 0
+        self.discarded = 0
+        self.failed_pings = 0
+
+    def ping(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def reset(self, connection):
+        """ Rollback transaction left by connection user """
+
+        connection.rollback()
+
+    def close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def is_closed(self, connection):
+        return bool(getattr(connection, 'closed', False))
+
+    def acquire(self):
+        """ Checkout connection, raises PoolTimeout if none was released in time """
+
+        started = self.timer()
+        waiter = None
+        with self.lock:
+            if self.idle and not self.waiters:
+                connection, released_at = self.idle.pop()
+            elif self.size < self.max_size and not self.waiters:
+                # slot is taken by connection being created
+                self.size += 1
+                connection = released_at = None
+            else:
+                waiter = Waiter()
+                self.waiters.append(waiter)
+
+        if waiter is not None:
+            waiter.event.wait(self.timeout)
+            with self.lock:
+                if not waiter.granted:
+                    self.waiters.remove(waiter)
+                    self.timeouts += 1
+                    raise PoolTimeout('No free connection in %s seconds, pool size %d' % (self.timeout, self.max_size))
+            connection, released_at = waiter.connection, waiter.released_at
+
+        waited = self.timer() - started
+        with self.lock:
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+            self.waits += waiter is not None
+
+        if connection is not None:
+            if not self.is_closed(connection) and not (
+                self.pre_ping and self.timer() - released_at >= self.ping_interval and not self.ping(connection)
+            ):
+                return connection
+
+            # other idle connections are to the same lost server, slot of
+            # checked connection is kept for the new one
+            with self.lock:
+                self.failed_pings += 1
+                stale, self.idle = self.idle, []
+                self.size -= len(stale)
+                self.discarded += len(stale) + 1
+            for stale_connection in [connection] + [stale_connection for stale_connection, released_at in stale]:
+                self.close(stale_connection)
+
+        try:
+            connection = self.connect()
+        except Exception:
+            self.free_slot()
+            raise
+        with self.lock:
+            self.created += 1
+        return connection
+
+    def release(self, connection, broken=False):
+        """ Return connection to pool, broken connection is closed """
+
+        if not broken and not self.is_closed(connection):
+            try:
+                self.reset(connection)
+            except Exception:
+                pass
+            else:
+                with self.lock:
+                    if self.waiters:
+                        self.waiters.popleft().grant(connection, self.timer())
+                    else:
+                        self.idle.append((connection, self.timer()))
+                return
+
+        self.discard(connection)
+
+    def discard(self, connection):
+        """ Close connection and free its slot """
+
+        with self.lock:
+            self.discarded += 1
+        self.free_slot()
+        self.close(connection)
+
+    def free_slot(self):
+        with self.lock:
+            if self.waiters:
+                # waiter creates new connection in this slot
+                self.waiters.popleft().grant()
+            else:
+                self.size -= 1
+
+    def clear(self):
+        """ Close idle connections, connections in use are closed on release """
+
+        with self.lock:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+        for connection, released_at in idle:
+            self.close(connection)
+
+    def stats(self):
+        with self.lock:
+            in_use = self.size - len(self.idle)
+            return OrderedDict((
+                ('max_size', self.max_size),
+                ('size', self.size),
+                ('in_use', in_use),
+                ('idle', len(self.idle)),
+                ('waiting', len(self.waiters)),
+                ('utilization', round(in_use / self.max_size, 2)),
+                ('checkouts', self.checkouts),
+                ('waits', self.waits),
+                ('wait_time_ms', round(self.wait_time * 1000, 2)),
+                ('max_wait_time_ms', round(self.max_wait_time * 1000, 2)),
+                ('timeouts', self.timeouts),
+                ('created', self.created),
+                ('discarded', self.discarded),
+                ('failed_pings', self.failed_pings),
+            ))
@@ -0,0 +1,72 @@
+"""
+Routing of reads to replicas.
+
+Reads go to a replica only inside `route_reads(replicas=True)` block, which
+ReplicaPinningMiddleware opens for safe requests of clients which did not
+write recently. Writes, reads in transactions and everything outside of
+requests (commands, migrations) use primary. A request which wrote reads
+primary until it ends and the block reports the write, so the middleware
+pins the client.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_local = threading.local()
+
+
+class RoutingState(object):
+    __slots__ = ('replica', 'wrote', 'depth')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+        self.depth = get_transaction_depth()
+
+    def in_transaction(self):
+        """ Transaction was started in block """
+
+        return get_transaction_depth() > self.depth
+
+
+def get_transaction_depth():
+    # block may run in transaction, e.g. of TestCase
+    connection = connections[DEFAULT_DB_ALIAS]
+    return connection.in_atomic_block + len(connection.savepoint_ids)
+
+
+@contextmanager
+def route_reads(replicas=True):
+    """ Route reads of block to one of replicas or to primary, yields state which records writes """
+
+    previous = getattr(_local, 'state', None)
+    # one replica per request, its reads are consistent with each other
+    state = _local.state = RoutingState(
+        random.choice(settings.REPLICA_DATABASES) if replicas and settings.REPLICA_DATABASES else None
+    )
+    try:
+        yield state
+    finally:
+        _local.state = previous
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        state = getattr(_local, 'state', None)
+        if state is None or state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if state.in_transaction():
+            # transaction may have written already
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = getattr(_local, 'state', None)
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
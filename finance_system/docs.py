@@ -0,0 +1,124 @@
+"""
+Precomputed API documentation page.
+
+`DRFDocsView` walks the URLconf and introspects every view and serializer
+on each request. Here the page is rendered once for fingerprint of sources
+it is built from (URLconf, documented views, their serializers and
+templates), stored in cache and kept in process memory. Requests are
+answered from memory with ETag, the page is rebuilt only when the sources
+change (see also `build_api_docs` command).
+"""
+import hashlib
+import inspect
+import threading
+
+from django.core.cache import cache
+from django.core.urlresolvers import RegexURLResolver, get_resolver
+from django.http import Http404, HttpRequest, HttpResponse
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response
+from django.views.generic import View
+
+from rest_framework.views import APIView
+from rest_framework_docs.settings import DRFSettings
+from rest_framework_docs.views import DRFDocsView
+
+
+DOCS_CACHE_KEY = 'api-docs:%s'
+DOCS_CACHE_TIMEOUT = None
+
+DOCS_TEMPLATES = (
+    'rest_framework_docs/home.html',
+    'rest_framework_docs/docs.html',
+    'rest_framework_docs/base.html',
+)
+
+_page = None
+_lock = threading.Lock()
+
+
+def get_source_files(resolver=None):
+    """ Files of URLconf modules, documented views and their serializers """
+
+    resolver = resolver or get_resolver()
+    files = set()
+    # included list of patterns (admin) has no module
+    if inspect.ismodule(resolver.urlconf_module):
+        files.add(inspect.getsourcefile(resolver.urlconf_module))
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, RegexURLResolver):
+            files.update(get_source_files(pattern))
+            continue
+
+        view = getattr(pattern.callback, 'cls', None)
+        if view is None or not issubclass(view, APIView):
+            continue
+        for cls in inspect.getmro(view) + inspect.getmro(getattr(view, 'serializer_class', None) or object):
+            if cls.__module__ != 'builtins':
+                files.add(inspect.getsourcefile(cls))
+
+    files.discard(None)
+    return files
+
+
+def get_fingerprint():
+    """ Hash of sources the page is built from """
+
+    files = get_source_files() | {get_template(name).origin.name for name in DOCS_TEMPLATES}
+    digest = hashlib.sha1()
+    for name in sorted(files):
+        digest.update(name.encode())
+        with open(name, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def render_page():
+    request = HttpRequest()
+    request.method = 'GET'
+    response = DRFDocsView.as_view()(request)
+    response.render()
+    return response.content
+
+
+def build_page(force=False):
+    """ Return (content, etag) of docs page, render it if sources changed """
+
+    fingerprint = get_fingerprint()
+    key = DOCS_CACHE_KEY % fingerprint
+    content = None if force else cache.get(key)
+    if content is None:
+        content = render_page()
+        cache.set(key, content, DOCS_CACHE_TIMEOUT)
+    return content, fingerprint
+
+
+def get_page():
+    """ Page kept in process memory, sources do not change while process is running """
+
+    global _page
+    if _page is None:
+        with _lock:
+            if _page is None:
+                _page = build_page()
+    return _page
+
+
+def reset_page():
+    global _page
+    _page = None
+
+
+class ApiDocsView(View):
+    """ Serves precomputed docs page, search is rendered by DRFDocsView """
+
+    def get(self, request, *args, **kwargs):
+        if DRFSettings().settings['HIDE_DOCS']:
+            raise Http404('Django Rest Framework Docs are hidden. Check your settings.')
+        if request.GET.get('search'):
+            return DRFDocsView.as_view()(request, *args, **kwargs)
+
+        content, etag = get_page()
+        response = get_conditional_response(request, etag=etag) or HttpResponse(content)
+        response['ETag'] = '"%s"' % etag
+        return response
@@ -0,0 +1,44 @@
+"""
+Per-request timings collected by RequestInstrumentationMiddleware.
+
+Code measures its parts with `timer(name)`, it does nothing
+when request is not instrumented.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+
+def start():
+    """ Start collecting timings in current thread """
+
+    _local.timings = OrderedDict()
+    return _local.timings
+
+
+def stop():
+    """ Stop collecting timings, returns collected timings """
+
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    return timings
+
+
+@contextmanager
+def timer(name):
+    """ Add time spent in block to timing with given name """
+
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0) + time.perf_counter() - started
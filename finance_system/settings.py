@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import tempfile
 
 import dj_database_url
 
@@ -53,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.RequestProfilingMiddleware',
+    'accounts.middleware.RequestInstrumentationMiddleware',
+    'finance_system.db.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +66,30 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL and timing instrumentation (see accounts.middleware)
+
+REQUEST_INSTRUMENTATION = {
+    'ENABLED': os.environ.get('REQUEST_INSTRUMENTATION') == 'on',
+    'DEFAULT_QUERY_BUDGET': 10,
+    'QUERY_BUDGETS': {
+        'ManagerClientListView': 3,
+        'ManagerClientDetailView': 3,
+        'ClientProfileView': 5,
+        'UserLoginAPIView': 2,
+    },
+    'REPEATED_QUERY_THRESHOLD': 5,
+}
+
+# Profiling of requests with X-Profile header signed for superuser or manager
+# (see accounts.profiling), profiles of worker are listed in admin
+
+REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('REQUEST_PROFILING') == 'on',
+    'DIR': os.environ.get('REQUEST_PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'finance_system_profiles')),
+    'MAX_PROFILES': 50,
+    'HEADER_MAX_AGE': 24 * 60 * 60,  # seconds
+}
+
 ROOT_URLCONF = 'finance_system.urls'
 
 TEMPLATES = [
@@ -92,9 +120,61 @@ DATABASES = {
     }
 }
 
-db_from_env = dj_database_url.config(conn_max_age=500)
+# With DATABASE_POOL=on PostgreSQL connections are taken from bounded pool of
+# process (see finance_system.db.backends.postgresql_pool) and returned to it
+# at the end of request instead of being kept by every thread
+
+DATABASE_POOL = os.environ.get('DATABASE_POOL') == 'on'
+
+db_from_env = dj_database_url.config(conn_max_age=0 if DATABASE_POOL else 500)
 DATABASES['default'].update(db_from_env)
 
+# Read replicas, DATABASE_REPLICA_URLS is comma separated list of database URLs.
+# Reads of GET requests go to replicas, see finance_system.db.routers
+
+REPLICA_DATABASES = []
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    DATABASES['replica_%d' % number] = dj_database_url.parse(url, conn_max_age=0 if DATABASE_POOL else 500)
+    REPLICA_DATABASES.append('replica_%d' % number)
+
+for database in DATABASES.values():
+    if DATABASE_POOL and database.get('ENGINE') in (
+            'django.db.backends.postgresql', 'django.db.backends.postgresql_psycopg2'):
+        database.update({
+            'ENGINE': 'finance_system.db.backends.postgresql_pool',
+            'POOL': {
+                'MAX_SIZE': int(os.environ.get('DATABASE_POOL_SIZE', 10)),
+                'TIMEOUT': 10,
+                'PRE_PING': True,
+                'PING_INTERVAL': 0,
+                'STATS_INTERVAL': 60,  # seconds between logs of pool stats of worker
+            },
+        })
+
+DATABASE_ROUTERS = ['finance_system.db.routers.ReplicaRouter']
+
+# Client which wrote is pinned to primary for SECONDS, by its Authorization
+# header in cache or by COOKIE, so it does not read stale replica. Pins are seen
+# by all workers only in shared cache, so replicas require CACHE_BACKEND which is
+# not local memory (see CACHES below)
+
+REPLICA_PINNING = {
+    'SECONDS': 10,
+    'COOKIE': 'use_primary',
+}
+
+
+# Cache
+# Workers share cached data and its invalidation only with shared backend,
+# e.g. CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -116,6 +196,22 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = 'accounts.User'
 
+# Threads per process to check passwords (see accounts.hashing)
+
+PASSWORD_HASHING_WORKERS = 4
+
+# Threads per process running views under ASGI server (see finance_system.asgi),
+# every thread may hold database connection
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 16))
+
+# Seconds in which worker imports application and answers first request,
+# check_boot_time command fails when boot is slower. DRF and django-filter import
+# optional packages (coreapi, markdown, requests) when they are installed, so
+# requirements should not contain ones which are not used
+
+WORKER_BOOT_BUDGET = float(os.environ.get('WORKER_BOOT_BUDGET', 1.0))
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.11/topics/i18n/
 
@@ -148,12 +244,64 @@ REST_FRAMEWORK = {
         ('django_filters.rest_framework.DjangoFilterBackend',),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.api.authentication.CachedTokenAuthentication',
     ),
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '60/min',
+        'login_email': '10/min',
+        'register_ip': '20/hour',
+        'register_email': '5/hour',
+        'provide_pin_user': '10/min',
+    },
+    # count of proxies before app, X-Forwarded-For of clients is ignored by default
+    # and throttling by IP uses REMOTE_ADDR
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
     'PAGE_SIZE': 10,
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.NamespaceVersioning'
 }
 
+# In-process throttling of login, register and provide PIN (see accounts.api.throttling),
+# rates are in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+
+LOCAL_THROTTLE = {
+    'ENABLED': os.environ.get('THROTTLING', 'on') == 'on',
+    'SYNC_INTERVAL': 1,  # seconds between syncs of local counts to shared cache
+    'MAX_KEYS': 100000,  # buckets kept per scope in every process
+}
+
+# Cache of authenticated tokens (see accounts.token_cache)
+
+AUTH_TOKEN_CACHE = {
+    'LOCAL_SIZE': 10000,
+    'LOCAL_TTL': 5,  # seconds, other workers may use stale user this long
+    'SHARED_TTL': 5 * 60,
+}
+
+# Render JSON of manager client list and client profile without serializers
+# (see accounts.api.encoders)
+
+FAST_READ_PATH = True
+
+# Max page size of cursor pagination of manager client list
+
+CLIENT_LIST_MAX_PAGE_SIZE = 1000
+
+# Clients selected by one query of streaming export
+
+CLIENT_EXPORT_CHUNK_SIZE = 2000
+
+# Max count of ids in one bulk update or delete request
+
+CLIENT_BULK_MAX_IDS = 10000
+
+# Max count of clients in one import request
+
+CLIENT_IMPORT_MAX_SIZE = 100000
+
+# Max count of transfers in one request to batch transfer endpoint
+
+TRANSFER_BATCH_MAX_SIZE = 10000
+
 REST_FRAMEWORK_DOCS = {
     'HIDE_DOCS': False
 }
@@ -168,6 +316,18 @@ EMAIL_HOST_PASSWORD = '1234567a'
 EMAIL_USE_SSL = True
 DEFAULT_FROM_EMAIL = 'sofast.team@yandex.ru'
 
+# Mail outbox settings (see accounts.mail)
+
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60  # seconds, doubled after every failed attempt
+OUTBOX_CLAIM_TIMEOUT = 5 * 60  # seconds, claimed mails of failed worker are sent again after it
+
+# Managers notifications settings (see accounts.notifications)
+
+MANAGER_EMAILS_CACHE_TIMEOUT = 60 * 60
+MANAGER_NOTIFICATIONS_DIGEST = False
+
 # Local settings (DATABASE, DEBUG, ... )
 
 try:
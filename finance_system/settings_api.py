@@ -0,0 +1,45 @@
+"""
+Settings of workers serving /api/v0/ only.
+
+Admin, API docs, sessions, messages, forms and static files apps are not
+loaded, so workers import less and boot faster (see check_boot_time
+command). Admin and docs are served by workers with finance_system.settings,
+migrations are run with it too:
+
+    DJANGO_SETTINGS_MODULE=finance_system.settings_api gunicorn finance_system.wsgi
+"""
+from .settings import *  # noqa
+
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in (
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'crispy_forms',
+    'rest_framework_docs',
+)]
+
+# API clients authenticate with token, DRF views are exempt of CSRF check
+
+MIDDLEWARE = [
+    'accounts.middleware.RequestProfilingMiddleware',
+    'accounts.middleware.RequestInstrumentationMiddleware',
+    'finance_system.db.middleware.ReplicaPinningMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'finance_system.urls_api'
+
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    'django.template.context_processors.debug',
+    'django.template.context_processors.request',
+]
+
+# No browsable API, it needs templates and static files
+
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_RENDERER_CLASSES=(
+    'rest_framework.renderers.JSONRenderer',
+))
+
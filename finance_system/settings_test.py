@@ -0,0 +1,12 @@
+"""
+Settings of test runs:
+
+    python manage.py test --settings finance_system.settings_test
+
+Connection to test database under `replica` alias stands in for read
+replica in routing tests (see finance_system.tests).
+"""
+from .settings import *  # noqa
+
+
+DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
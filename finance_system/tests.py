@@ -0,0 +1,470 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import connections, transaction
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from accounts.management.commands import check_boot_time
+from accounts.models import User
+from accounts.token_cache import local_cache
+
+from . import asgi, docs
+from .db.backends.postgresql_pool import base as pool_backend
+from .db.middleware import ReplicaPinningMiddleware, get_pin_key
+from .db.pool import ConnectionPool, PoolTimeout
+from .db.routers import ReplicaRouter, route_reads
+from .boot import ImportTimer
+
+
+# workers share pins of replica routing in file based cache
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'finance_system_test_cache'),
+    }
+}
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ApiDocsTestCase(TestCase):
+    """Tests to precomputed API docs page"""
+
+    def setUp(self):
+        cache.clear()
+        docs.reset_page()
+
+    def tearDown(self):
+        docs.reset_page()
+
+    def test_page_rendered_once(self):
+        """Test that page is the same as DRF Docs page and rendered once"""
+
+        expected = docs.DRFDocsView.as_view()(RequestFactory().get('/'))
+        expected.render()
+
+        with mock.patch.object(docs, 'render_page', wraps=docs.render_page) as render_page:
+            for i in range(3):
+                response = self.client.get('/')
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(expected.content, response.content)
+
+        self.assertEqual(1, render_page.call_count)
+
+    def test_etag(self):
+        """Test that unchanged page is not sent again"""
+
+        etag = self.client.get('/')['ETag']
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+
+    def test_rebuild_on_sources_change(self):
+        """Test that page is rendered again for other sources"""
+
+        self.assertIn('/accounts/api/serializers.py', ' '.join(docs.get_source_files()))
+        docs.build_page()
+
+        with mock.patch.object(docs, 'get_fingerprint', return_value='changed'), \
+                mock.patch.object(docs, 'render_page', return_value=b'new page'):
+            self.assertEqual((b'new page', 'changed'), docs.build_page())
+
+
+class AsgiTestCase(TestCase):
+    """Tests to ASGI application"""
+
+    def request(self, method, path, body=b'', headers=(), query_string=b''):
+        scope = {
+            'type': 'http',
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'query_string': query_string,
+            'headers': [(b'host', b'testserver')] + list(headers),
+            'client': ('10.0.0.1', 5000),
+            'server': ('testserver', 80),
+        }
+        # body is sent in two parts
+        messages = [
+            {'type': 'http.request', 'body': body[:5], 'more_body': True},
+            {'type': 'http.request', 'body': body[5:]},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(asgi.application(scope, receive, send))
+        finally:
+            loop.close()
+        return sent
+
+    def test_response(self):
+        """Test that view response is sent"""
+
+        sent = self.request(
+            'POST', '/api/v0/login/', b'{"email": "not email", "password": "1234"}',
+            headers=[(b'content-type', b'application/json')]
+        )
+        self.assertEqual(['http.response.start', 'http.response.body'], [message['type'] for message in sent])
+        self.assertEqual(400, sent[0]['status'])
+        self.assertIn((b'content-type', b'application/json'), sent[0]['headers'])
+        self.assertEqual({'email': ['Enter a valid email address.']}, json.loads(sent[1]['body'].decode()))
+
+    def test_environ(self):
+        """Test that scope is translated to WSGI environ"""
+
+        environ = asgi.build_environ({
+            'method': 'GET',
+            'path': '/клиенты/',
+            'query_string': b'page=2',
+            'http_version': '1.1',
+            'headers': [
+                (b'content-type', b'text/csv'),
+                (b'cookie', b'a=1'),
+                (b'cookie', b'b=2'),
+                (b'x-forwarded-for', b'10.0.0.2'),
+            ],
+        }, b'body')
+        self.assertEqual('/клиенты/', environ['PATH_INFO'].encode('latin-1').decode())
+        self.assertEqual('page=2', environ['QUERY_STRING'])
+        self.assertEqual('text/csv', environ['CONTENT_TYPE'])
+        self.assertEqual('a=1; b=2', environ['HTTP_COOKIE'])
+        self.assertEqual('10.0.0.2', environ['HTTP_X_FORWARDED_FOR'])
+        self.assertEqual(b'body', environ['wsgi.input'].read())
+
+    def test_streaming_response(self):
+        """Test that streaming response is sent by chunks"""
+
+        def view(request):
+            return StreamingHttpResponse(chunk for chunk in (b'a', b'', b'b'))
+
+        with mock.patch.object(asgi, 'wsgi_application', WSGIHandler()), \
+                mock.patch('django.core.handlers.base.BaseHandler.get_response', lambda self, request: view(request)):
+            sent = self.request('GET', '/stream/')
+
+        self.assertEqual(200, sent[0]['status'])
+        self.assertEqual([b'a', b'', b'b', b''], [message['body'] for message in sent[1:]])
+        self.assertFalse(sent[-1].get('more_body'))
+
+
+class FakeServer(object):
+    """ Server which connections are lost on restart """
+
+    def __init__(self):
+        self.generation = 0
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+    def restart(self):
+        self.generation += 1
+
+
+class FakeConnection(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.generation = server.generation
+        self.closed = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        if self.generation != self.server.generation:
+            raise OSError('server closed the connection unexpectedly')
+        return mock.Mock()
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    """Tests to pool of database connections"""
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.pool = ConnectionPool(self.server.connect, max_size=2, timeout=0.05)
+
+    def test_bounded(self):
+        """Test that pool does not open more than max_size connections"""
+
+        first, second = self.pool.acquire(), self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+
+        stats = self.pool.stats()
+        self.assertEqual(1.0, stats['utilization'])
+        self.assertEqual(1, stats['timeouts'])
+        self.assertEqual(2, len(self.server.connections))
+
+    def test_reuse(self):
+        """Test that released connection is reset and reused"""
+
+        connection = self.pool.acquire()
+        self.pool.release(connection)
+        self.assertEqual(1, connection.rollbacks)
+        self.assertIs(connection, self.pool.acquire())
+
+        # broken connection is closed and its slot is free
+        self.pool.release(connection, broken=True)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(connection, self.pool.acquire())
+        self.assertEqual(1, self.pool.stats()['size'])
+
+    def test_waiter_gets_released_connection(self):
+        """Test that waiting thread gets connection released by other"""
+
+        self.pool.timeout = 5
+        first, second = self.pool.acquire(), self.pool.acquire()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.pool.acquire()))
+        thread.start()
+        while not self.pool.stats()['waiting']:
+            time.sleep(0.001)
+
+        self.pool.release(first)
+        thread.join()
+        self.assertEqual([first], result)
+        self.assertEqual(1, self.pool.stats()['waits'])
+
+    def test_recover_after_restart(self):
+        """Test that connections lost on server restart are replaced on checkout"""
+
+        connections = [self.pool.acquire(), self.pool.acquire()]
+        for connection in connections:
+            self.pool.release(connection)
+        self.server.restart()
+
+        connection = self.pool.acquire()
+        self.assertNotIn(connection, connections)
+        self.assertTrue(all(connection.closed for connection in connections))
+
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['failed_pings'])
+        self.assertEqual(1, stats['size'])
+        self.assertEqual(2, stats['discarded'])
+
+        # connection is not checked if it was idle less than ping_interval
+        self.pool.release(connection)
+        self.pool.ping_interval = 60
+        self.server.restart()
+        self.assertIs(connection, self.pool.acquire())
+
+    def test_stats_log(self):
+        """Test that stats of pools of process are logged by one thread"""
+
+        self.pool.pid = os.getpid()
+        self.pool.acquire()
+        with mock.patch.dict(pool_backend._pools, {('finance', 'postgres', '', ''): self.pool}, clear=True), \
+                self.assertLogs('finance_system.db.pool', 'INFO') as logs:
+            pool_backend.log_pools_stats()
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual('finance', record['database'])
+        self.assertEqual(1, record['in_use'])
+
+        with mock.patch.object(pool_backend, '_stats_log_pid', None), \
+                mock.patch.object(pool_backend.threading, 'Thread') as thread:
+            pool_backend.start_stats_log(60)
+            pool_backend.start_stats_log(60)
+            pool_backend.start_stats_log(0)
+        self.assertEqual(1, thread.call_count)
+
+
+class ReplicaPinningConfigTestCase(SimpleTestCase):
+    """Tests to configuration check of replica pinning"""
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_process_cache_rejected(self):
+        """Test that replicas with cache of process are refused on start"""
+
+        with self.assertRaisesRegex(ImproperlyConfigured, 'shared by workers'):
+            ReplicaPinningMiddleware(lambda request: None)
+
+        with override_settings(CACHES=SHARED_CACHES):
+            ReplicaPinningMiddleware(lambda request: None)
+
+
+@skipUnless('replica' in settings.DATABASES, 'run with --settings finance_system.settings_test')
+@override_settings(REPLICA_DATABASES=['replica'], CACHES=SHARED_CACHES)
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """
+    Tests to routing of reads to replica, second connection to test database
+    stands in for it and sees committed data only
+    """
+
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = User.objects.create(
+            first_name='Test',
+            last_name='User',
+            email='test@testuser.com',
+            passport_number='12345678'
+        )
+        self.user.set_password('1234')
+        self.user.save()
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token %s' % self.user.auth_token.key)
+        self.url = reverse('api-account:client-profile')
+
+    def get(self):
+        """ Response and SQL of queries to primary and replica """
+
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(self.url)
+        return response, [query['sql'] for query in primary], [query['sql'] for query in replica]
+
+    def test_router(self):
+        """Test that only reads of route_reads block go to replica"""
+
+        router = ReplicaRouter()
+        self.assertEqual('default', router.db_for_read(User))
+
+        with route_reads() as state:
+            self.assertEqual('replica', router.db_for_read(User))
+            with transaction.atomic():
+                self.assertEqual('default', router.db_for_read(User))
+
+            self.assertEqual('default', router.db_for_write(User))
+            self.assertTrue(state.wrote)
+            self.assertEqual('default', router.db_for_read(User))
+
+        with route_reads(replicas=False):
+            self.assertEqual('default', router.db_for_read(User))
+
+    def test_safe_request_reads_replica(self):
+        """Test that profile is read from replica and token from primary"""
+
+        response, primary, replica = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(primary))
+        self.assertIn('"authtoken_token"', primary[0])
+        self.assertTrue(replica)
+        self.assertFalse([sql for sql in replica if '"authtoken_token"' in sql])
+
+        # token is cached
+        response, primary, replica = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], primary)
+
+    def test_writer_reads_primary(self):
+        """Test that client which updated profile reads it from primary"""
+
+        data = {
+            'first_name': 'New',
+            'last_name': 'User',
+            'email': 'test@testuser.com',
+            'passport_number': '12345678',
+        }
+        self.assertEqual(200, self.client.put(self.url, data, format='json').status_code)
+        self.assertNotIn('use_primary', self.client.cookies)
+
+        response, primary, replica = self.get()
+        self.assertEqual('New', response.data['first_name'])
+        self.assertTrue(primary)
+        self.assertEqual([], replica)
+
+        # pin expired, other clients were not pinned
+        cache.delete(get_pin_key(response.wsgi_request))
+        response, primary, replica = self.get()
+        self.assertEqual([], primary)
+        self.assertTrue(replica)
+
+    def test_anonymous_writer_pinned_by_cookie(self):
+        """Test that client without token is pinned by cookie, failed request does not pin"""
+
+        url = reverse('api-account:client-account-register')
+        self.assertEqual(400, self.client.post(url, {}).status_code)
+        self.assertNotIn('use_primary', self.client.cookies)
+
+        self.client.credentials()
+        response = self.client.post(url, {
+            'first_name': 'New',
+            'last_name': 'Client',
+            'email': 'new@testuser.com',
+            'passport_number': '87654321',
+        })
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(10, response.cookies['use_primary']['max-age'])
+
+
+class WorkerBootTestCase(SimpleTestCase):
+    """Tests to API settings profile and import time of worker boot"""
+
+    @override_settings(ROOT_URLCONF='finance_system.urls_api')
+    def test_api_urlconf(self):
+        """Test that API profile serves API only"""
+
+        client = APIClient()
+        self.assertEqual(405, client.get(reverse('api-account:user-login')).status_code)
+        self.assertEqual(404, client.get('/admin/').status_code)
+        self.assertEqual(404, client.get('/').status_code)
+
+    def test_import_timer(self):
+        """Test that imports are timed once, with nested imports in cumulative time only"""
+
+        timer = ImportTimer()
+        with mock.patch.dict(sys.modules):
+            for name in ('xml.dom.minidom', 'xml.dom.minicompat'):
+                sys.modules.pop(name, None)
+            timer.install()
+            try:
+                import xml.dom.minidom
+                import xml.dom.minidom  # noqa
+            finally:
+                timer.uninstall()
+        records = {name: (own, cumulative) for name, own, cumulative in timer.records}
+
+        self.assertEqual(len(records), len(timer.records))
+        own, cumulative = records['xml.dom.minidom']
+        self.assertGreater(cumulative, own + records['xml.dom.minicompat'][1] - 0.0001)
+
+    def test_boot_budget(self):
+        """Test that API profile boots without admin and docs and check fails over budget"""
+
+        command = check_boot_time.Command()
+        boot = command.measure('finance_system.settings_api', '/api/v0/login/')
+        modules = {record[0] for record in boot['modules']}
+        self.assertEqual('405 Method Not Allowed', boot['status'])
+        self.assertIn('accounts.api.views', modules)
+        self.assertNotIn('django.contrib.admin', modules)
+        self.assertNotIn('rest_framework_docs', modules)
+        self.assertNotIn('coreapi', modules)
+
+        out = io.StringIO()
+        call_command('check_boot_time', runs=1, budget=60, stdout=out)
+        self.assertIn('finance_system.settings_api: boot', out.getvalue())
+        with self.assertRaisesRegex(CommandError, 'budget is 0.001 s'):
+            call_command('check_boot_time', runs=1, budget=0.001, stdout=io.StringIO())
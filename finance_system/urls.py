@@ -18,9 +18,20 @@ from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
 
+from accounts import views as account_views
+
+from .docs import ApiDocsView
+
+
+PROFILE_ID = r'(?P<profile_id>\d{20}-[0-9a-f]{8})'
 
 urlpatterns = [
+    url(r'^admin/profiles/$', admin.site.admin_view(account_views.profile_list), name='admin-profile-list'),
+    url(r'^admin/profiles/%s/$' % PROFILE_ID, admin.site.admin_view(account_views.profile_detail),
+        name='admin-profile-detail'),
+    url(r'^admin/profiles/%s/download/$' % PROFILE_ID, admin.site.admin_view(account_views.profile_download),
+        name='admin-profile-download'),
     url(r'^admin/', admin.site.urls),
     url(r'^api/v0/', include('accounts.api.urls', namespace='api-account')),
-    url(r'^', include('rest_framework_docs.urls'))
+    url(r'^$', ApiDocsView.as_view(), name='drfdocs')
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -0,0 +1,10 @@
+"""
+URL configuration of API workers (see finance_system.settings_api),
+admin and docs are in finance_system.urls
+"""
+from django.conf.urls import url, include
+
+
+urlpatterns = [
+    url(r'^api/v0/', include('accounts.api.urls', namespace='api-account')),
+]